@@ -9,17 +9,108 @@ def load_env_vars():
 
 TOP_K_CHUNKS = 20  # You can tweak this later
 
-# Base data directory at project root
-BASE_DATA_DIR = os.path.join(os.getcwd(), 'data')
+# Retrieval: "sparse" (TF-IDF cosine), "dense" (LSA embeddings) or "hybrid" (weighted fusion of both).
+# Stores vectorized without an LSA index always fall back to sparse.
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "sparse").lower()
+HYBRID_DENSE_WEIGHT = float(os.getenv("HYBRID_DENSE_WEIGHT", 0.5))  # Share of the dense score in hybrid mode
+LSA_COMPONENTS = int(os.getenv("LSA_COMPONENTS", 128))  # TruncatedSVD dimensions (capped by the document size)
+BUILD_LSA_INDEX = os.getenv("BUILD_LSA_INDEX", str(RETRIEVAL_MODE != "sparse")).lower() == "true"
+# On-disk TF-IDF store written at vectorize time: "sklearn" (pickled vectorizer + float64 matrix),
+# "float32" or "int8" (compact arrays, see app/utils/compact_store.py). Loading detects the format.
+VECTOR_STORE_FORMAT = os.getenv("VECTOR_STORE_FORMAT", "sklearn").lower()
+# A new version of a document patches the previous version's TF-IDF store (kept chunks keep their rows)
+# unless the added chunks bring in more than this share of new terms; then it is refitted
+VECTOR_REFIT_DRIFT = float(os.getenv("VECTOR_REFIT_DRIFT", 0.05))
+# The extra LLM call that rephrases the question for retrieval; dense/hybrid retrieval makes it less necessary
+QUERY_REWRITE = os.getenv("QUERY_REWRITE", "true").lower() == "true"
+
+# Packing of the retrieved chunks into the /ask and chat prompts (app/utils/context_packer.py): near-duplicates
+# (word-shingle Jaccard >= CONTEXT_DEDUP_SIMILARITY) are dropped, overlapping chunks merged, passages
+# scoring below CONTEXT_TRIM_RATIO * the best score cut to their CONTEXT_TRIM_SENTENCES best sentences,
+# and passages added best first up to CONTEXT_TOKEN_BUDGET tokens (0 = no budget)
+CONTEXT_PACKING = os.getenv("CONTEXT_PACKING", "true").lower() == "true"
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 3000))
+CONTEXT_DEDUP_SIMILARITY = float(os.getenv("CONTEXT_DEDUP_SIMILARITY", 0.8))
+CONTEXT_TRIM_RATIO = float(os.getenv("CONTEXT_TRIM_RATIO", 0.5))
+CONTEXT_TRIM_SENTENCES = int(os.getenv("CONTEXT_TRIM_SENTENCES", 3))
+
+# Signup rejects email domains without MX records; turn off for offline deployments and load tests
+VERIFY_EMAIL_DOMAIN = os.getenv("VERIFY_EMAIL_DOMAIN", "true").lower() == "true"
+
+# Chat model backend (see app/utils/llm_providers.py): "gemini", or "stub" for offline load tests
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini").lower()
+LLM_STUB_LATENCY_SECONDS = float(os.getenv("LLM_STUB_LATENCY_SECONDS", 0.0))  # Fixed delay per call
+LLM_STUB_TOKENS_PER_SECOND = float(os.getenv("LLM_STUB_TOKENS_PER_SECOND", 0))  # Simulated generation speed; 0 = instant
+LLM_STUB_REPLY_TOKENS = int(os.getenv("LLM_STUB_REPLY_TOKENS", 120))
+LLM_STUB_ERROR_RATE = float(os.getenv("LLM_STUB_ERROR_RATE", 0.0))  # Share of calls failing with a 429
+LLM_STUB_SEED = int(os.getenv("LLM_STUB_SEED", 0))
+
+# Base data directory at project root (DATA_PATH overrides it, e.g. a temporary directory for load tests)
+BASE_DATA_DIR = os.getenv("DATA_PATH", os.path.join(os.getcwd(), 'data'))
 
 # Subdirectories under data
 UPLOAD_DIR = os.path.join(BASE_DATA_DIR, 'uploaded_files')
 VECTOR_STORE_DIR = os.path.join(BASE_DATA_DIR, 'vector_store')
 DB_DIR = os.path.join(BASE_DATA_DIR, 'Database') # this code will make a folder called 'Database' in the data folder
+EXTRACTED_TEXT_DIR = os.path.join(BASE_DATA_DIR, 'extracted_text') # <file_hash>.txt, written at vectorize time and reused by summarize
+METRICS_DIR = os.path.join(BASE_DATA_DIR, 'metrics') # Per-worker metric snapshots, summed by /metrics when running several workers
+
+# SQLite is shared by every worker process: WAL lets readers run alongside the one writer,
+# and a writer waits this long for the lock instead of failing with "database is locked"
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 30000))
+SQLITE_WAL = os.getenv("SQLITE_WAL", "true").lower() == "true"
+# Pooled SQLite connections per worker; sync routes run in FastAPI's threadpool (40 threads) and each holds one
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 40))
+# uvicorn reads WEB_CONCURRENCY itself; with several workers /metrics sums their snapshots (app/utils/metrics.py)
+METRICS_MULTIPROCESS = int(os.getenv("WEB_CONCURRENCY", 1)) > 1
+METRICS_FLUSH_SECONDS = int(os.getenv("METRICS_FLUSH_SECONDS", 5))  # How stale the other workers' values may be
+
+# Vector store / artifact garbage collection (see app/utils/vector_store_gc.py)
+GC_GRACE_PERIOD_SECONDS = int(os.getenv("GC_GRACE_PERIOD_SECONDS", 3600))  # Never sweep anything modified more recently
+GC_INTERVAL_SECONDS = int(os.getenv("GC_INTERVAL_SECONDS", 6 * 3600))  # 0 disables the periodic sweep
+
+# How long deleted-document tombstones are kept for the GET /documents/changes feed.
+# Clients whose `since` is older than this are told to reload from scratch.
+TOMBSTONE_RETENTION_SECONDS = int(os.getenv("TOMBSTONE_RETENTION_SECONDS", 7 * 24 * 3600))
+
+# Single-flight vectorize/summarize per content (app/utils/single_flight.py)
+SINGLE_FLIGHT_LEASE_SECONDS = int(os.getenv("SINGLE_FLIGHT_LEASE_SECONDS", 60))  # Renewed every third of this while work runs
+SINGLE_FLIGHT_WAIT_SECONDS = int(os.getenv("SINGLE_FLIGHT_WAIT_SECONDS", 900))  # How long a duplicate request waits for the first one
+
+# Per-call LLM usage rows older than this are pruned by the GC; the daily rollup is kept
+LLM_USAGE_RETENTION_DAYS = int(os.getenv("LLM_USAGE_RETENTION_DAYS", 90))
+
+# Stored chunks (and their map summaries, app/models/chunk.py) no document lists any more are
+# kept this long after their last use, so re-uploads and revisions still reuse them
+CHUNK_RETENTION_DAYS = int(os.getenv("CHUNK_RETENTION_DAYS", 30))
+
+# /ask answer cache per content (app/utils/answer_cache.py): answers expire after ANSWER_CACHE_TTL_SECONDS
+# (0 disables the cache), at most ANSWER_CACHE_MAX_PER_DOCUMENT per content are kept (least recently hit
+# go first), and a question whose TF-IDF similarity to a cached one reaches ANSWER_CACHE_SIMILARITY
+# gets that answer (above 1 only exact matches are served)
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", 24 * 3600))
+ANSWER_CACHE_MAX_PER_DOCUMENT = int(os.getenv("ANSWER_CACHE_MAX_PER_DOCUMENT", 200))
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", 0.9))
+
+# Chat sessions (app/utils/chat.py): each turn retrieves CHAT_TURN_CHUNKS chunks into a window of at most
+# CHAT_WINDOW_CHUNKS (least recently used dropped first) that is packed into CONTEXT_TOKEN_BUDGET, older
+# turns are folded into a summary once 2 * CHAT_RECENT_TURNS are kept, each worker pins up to
+# CHAT_PINNED_STORES loaded vector stores, and sessions idle for CHAT_SESSION_TTL_SECONDS expire
+CHAT_TURN_CHUNKS = int(os.getenv("CHAT_TURN_CHUNKS", 8))
+CHAT_WINDOW_CHUNKS = int(os.getenv("CHAT_WINDOW_CHUNKS", 20))
+CHAT_RECENT_TURNS = int(os.getenv("CHAT_RECENT_TURNS", 4))
+CHAT_PINNED_STORES = int(os.getenv("CHAT_PINNED_STORES", 8))
+CHAT_SESSION_TTL_SECONDS = int(os.getenv("CHAT_SESSION_TTL_SECONDS", 3600))
+
+# Batch vectorize/summarize (POST /vectorize/batch, POST /summarize/batch)
+MAX_BATCH_DOCUMENTS = int(os.getenv("MAX_BATCH_DOCUMENTS", 100))
+VECTORIZE_WORKERS = int(os.getenv("VECTORIZE_WORKERS", min(4, os.cpu_count() or 1)))  # Process pool size
+SUMMARIZE_BATCH_LLM_CALLS = int(os.getenv("SUMMARIZE_BATCH_LLM_CALLS", 30))  # LLM calls one batch may spend on the user's key
 
 # Create all required directories
 def create_required_directories():
     os.makedirs(UPLOAD_DIR, exist_ok=True)
     os.makedirs(VECTOR_STORE_DIR, exist_ok=True)
     os.makedirs(DB_DIR, exist_ok=True)
+    os.makedirs(EXTRACTED_TEXT_DIR, exist_ok=True)
 
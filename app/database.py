@@ -1,6 +1,7 @@
 from sqlmodel import create_engine, Session, SQLModel
+from sqlalchemy import event
 import os
-from app.config import DB_DIR
+from app.config import DB_DIR, SQLITE_BUSY_TIMEOUT_MS, SQLITE_WAL, DB_POOL_SIZE
 # Ensure app/data/db directory exists
 # Change from app/data/db to data/db
 
@@ -10,9 +11,22 @@ SQLALCHEMY_DATABASE_URL = f"sqlite:///{os.path.join(DB_DIR, 'database.db')}"
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL,
     echo=True,
-    connect_args={"check_same_thread": False}
+    connect_args={"check_same_thread": False},
+    pool_size=DB_POOL_SIZE,
+    max_overflow=10
 )
 
+# Applied to every pooled connection, in every worker process
+@event.listens_for(engine, "connect")
+def _configure_sqlite(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+    if SQLITE_WAL:
+        # Persistent in the database file; NORMAL sync is safe under WAL and avoids an fsync per commit
+        cursor.execute("PRAGMA journal_mode = WAL")
+        cursor.execute("PRAGMA synchronous = NORMAL")
+    cursor.close()
+
 # Create database tables
 def create_db():
     SQLModel.metadata.create_all(bind=engine)
@@ -1,3 +1,4 @@
+import html
 import streamlit as st
 from datetime import datetime, timezone
 import pytz
@@ -28,10 +29,12 @@ if "current_page" not in st.session_state:
     st.session_state.current_page = "login"  # Default to login page
 if "documents_cache" not in st.session_state:
     st.session_state.documents_cache = None
-if "last_refresh" not in st.session_state:
-    st.session_state.last_refresh = 0
 if "force_refresh" not in st.session_state:
     st.session_state.force_refresh = False
+if "doc_search" not in st.session_state:
+    st.session_state.doc_search = ""
+if "doc_cursors" not in st.session_state:
+    st.session_state.doc_cursors = [None]  # Cursor of every page visited; last one is the current page
 if "author_name" not in st.session_state:
     st.session_state.author_name = os.getenv("APP_AUTHOR_NAME") # Default if not set
 if "author_email" not in st.session_state:
@@ -176,12 +179,19 @@ def render_main_app():
                 </div>
             """, unsafe_allow_html=True)
             
+            # Marking an edited file as a new version lets vectorize/summarize reuse the previous version's work
+            filenames = {doc["id"]: doc["filename"] for doc in version_candidates()}
+            previous_version = st.selectbox(
+                "New version of",
+                [None] + list(filenames),
+                format_func=lambda doc_id: "— (new document)" if doc_id is None else filenames[doc_id],
+            )
+            
             if st.button("📤 Upload Document", use_container_width=True):
                 with error_boundary(), st.spinner("📤 Uploading document..."):
-                    result = upload_document(uploaded_file)  # error_boundary will auto-catch exceptions
+                    result = upload_document(uploaded_file, previous_version)  # error_boundary will auto-catch exceptions
                     if result and not result.get("detail"):
                         st.success("✅ Document uploaded successfully!")
-                        st.session_state.force_refresh = True  # Changed from full rerun
                     elif result and result.get("detail"):
                         st.error(f"❌ {result['detail']}")
                     else:
@@ -247,34 +257,50 @@ def render_main_app():
         
     # Only one tab now: My Documents
     st.markdown('<h2 class="sub-header">📚 My Documents</h2>', unsafe_allow_html=True)
-    documents = get_documents()
-    
+
+    # Search and pagination happen on the backend; a new search starts again at page 1
+    search_term = st.text_input("🔍 Search documents", st.session_state.doc_search)
+    if search_term != st.session_state.doc_search:
+        st.session_state.doc_search = search_term
+        st.session_state.doc_cursors = [None]
+
+    page = get_documents_page(search_term, st.session_state.doc_cursors[-1])
+    documents = page["documents"]
+
+    if not documents and len(st.session_state.doc_cursors) > 1:
+        # The page we were on became empty (e.g. its last document was deleted)
+        st.session_state.doc_cursors.pop()
+        st.rerun()
+
     if not documents:
-        st.markdown("""
-            <div class="info-box" style="text-align: center;">
-                <h3>📝 No documents found</h3>
-                <p>Upload a document to get started!</p>
-            </div>
-        """, unsafe_allow_html=True)
+        if search_term:
+            st.markdown(f"""
+                <div class="info-box" style="text-align: center;">
+                    <h3>🔍 No documents match "{html.escape(search_term)}"</h3>
+                </div>
+            """, unsafe_allow_html=True)
+        else:
+            st.markdown("""
+                <div class="info-box" style="text-align: center;">
+                    <h3>📝 No documents found</h3>
+                    <p>Upload a document to get started!</p>
+                </div>
+            """, unsafe_allow_html=True)
     else:
-        # Add search/filter functionality
-        search_term = st.text_input("🔍 Search documents", "")
-        filtered_docs = [doc for doc in documents if search_term.lower() in doc['filename'].lower()]
-
-        # Sort documents by upload_time (descending)
-        filtered_docs.sort(
-            key=lambda doc: doc.get('upload_time', ''),
-            reverse=True
-        )
-
-        # Pagination controls
-        items_per_page = 5
-        total_pages = max(1, (len(filtered_docs) + items_per_page - 1) // items_per_page)
-        page_number = st.number_input("Page", 1, total_pages, key="doc_page", format="%d")
-        start_idx = (page_number - 1) * items_per_page
-        end_idx = start_idx + items_per_page
-
-        for doc in filtered_docs[start_idx:end_idx]:
+        # Pagination controls (keyset: we can only step forward with next_cursor or back through visited pages)
+        col_prev, col_page, col_next = st.columns([1, 2, 1])
+        with col_prev:
+            if st.button("◀ Previous", key="doc_prev", disabled=len(st.session_state.doc_cursors) == 1, use_container_width=True):
+                st.session_state.doc_cursors.pop()
+                st.rerun()
+        with col_page:
+            st.markdown(f'<div style="text-align: center;">Page {len(st.session_state.doc_cursors)}</div>', unsafe_allow_html=True)
+        with col_next:
+            if st.button("Next ▶", key="doc_next", disabled=not page.get("next_cursor"), use_container_width=True):
+                st.session_state.doc_cursors.append(page["next_cursor"])
+                st.rerun()
+
+        for doc in documents:
             with st.expander(f"📄 {doc['filename']}", expanded=False):
                 # Create a column layout for filename and delete button
                 col_header = st.columns([4, 1])
@@ -314,7 +340,6 @@ def render_main_app():
                         with st.spinner("🗑️ Deleting..."):
                             if delete_document(doc['id']):
                                 st.success("✅ Document deleted successfully!")
-                                st.session_state.force_refresh = True
                                 st.rerun()
                             else:
                                 st.error("❌ Delete failed")
@@ -349,11 +374,10 @@ def render_main_app():
                                     st.info(result["message"])
                                 else:
                                     st.success("✨ Document vectorized successfully!")
-                                st.session_state.force_refresh = True
                                 st.rerun()
                 
                 with col2:
-                    has_summary = bool(doc.get('summary'))
+                    has_summary = bool(doc.get('has_summary'))
                     summarize_disabled = not is_vectorized and not has_summary
                     
                     if st.button(
@@ -368,7 +392,7 @@ def render_main_app():
                                     <h4>📝 Document Summary</h4>
                                     {}
                                 </div>
-                            """.format(doc.get('summary', 'No summary available')), unsafe_allow_html=True)
+                            """.format(get_document_summary(doc['id']) or 'No summary available'), unsafe_allow_html=True)
                         else:
                             with st.spinner("✨ Generating summary..."):
                                 result = summarize_document(doc['id'])
@@ -377,7 +401,6 @@ def render_main_app():
                                         st.error(f"❌ {result.get('summary')}")
                                     else:
                                         st.success("✅ Summary generated!")
-                                        st.session_state.force_refresh = True
                                         st.rerun()  # Add this back but with cache refresh
                                         
                     
@@ -385,8 +408,8 @@ def render_main_app():
                 if has_summary:
                     st.download_button(
                         label="⬇️ Export Summary as TXT",
-                        data=export_summary_as_txt(doc.get('summary', ''), doc.get('filename', f"document_{doc['id']}.txt")),
-                        file_name=f"summary_{doc.get('filename', f'document_{doc['id']}')}.txt",
+                        data=export_summary_as_txt(get_document_summary(doc['id']) or '', doc.get('filename', f"document_{doc['id']}.txt")),
+                        file_name=f"summary_{doc.get('filename', 'document_' + doc['id'])}.txt",
                         mime="text/plain",
                         key=f"export_sum_{doc['id']}"
                     )
@@ -399,6 +422,16 @@ def render_main_app():
                         </div>
                     """, unsafe_allow_html=True)
                     
+                    # Follow-up mode keeps a chat session: earlier turns are remembered and context is reused
+                    follow_up = st.checkbox("🧵 Remember the conversation", key=f"follow_up_{doc['id']}")
+                    if follow_up:
+                        for turn in chat_turns(doc['id']):
+                            st.markdown(f"**You:** {turn['question']}")
+                            st.markdown(f"**SmartDoc:** {turn['answer']}")
+                        if chat_turns(doc['id']) and st.button("🧹 New conversation", key=f"reset_chat_{doc['id']}"):
+                            reset_chat(doc['id'])
+                            st.rerun()
+
                     question = st.text_input("🤔 Ask a question:", key=f"q_{doc['id']}")
                     if st.button("🔍 Ask", key=f"ask_{doc['id']}", use_container_width=True):
                         if not question or question.strip() == "":
@@ -406,7 +439,10 @@ def render_main_app():
                         else:
                             with st.spinner("🤔 Thinking..."):
                                 # Check if document is actually vectorized by looking for embeddings
-                                result = ask_question(doc['id'], question)
+                                if follow_up:
+                                    result = send_chat_message(doc['id'], question)
+                                else:
+                                    result = ask_question(doc['id'], question)
                                 if result:
                                     st.markdown("""
                                         <div style="margin-top: 1rem; padding: 1rem; background-color: #E8F5E9; border-radius: 0.5rem;">
@@ -414,6 +450,8 @@ def render_main_app():
                                             <p>{}</p>
                                         </div>
                                     """.format(result.get('answer', 'No answer available')), unsafe_allow_html=True)
+                                    if result.get('cached'):
+                                        st.caption(f"⚡ Answered from cache (asked before as \"{result.get('cached_question')}\")")
                                 else:
                                     st.info("⚠️ Vectorize the document to enable chat functionality")
                                     
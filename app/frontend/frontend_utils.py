@@ -9,6 +9,8 @@ import streamlit as st
 import streamlit as st
 import requests
 import os
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 
 # API endpoint
@@ -16,6 +18,45 @@ BACKEND_API_URL = os.getenv('BACKEND_API_URL')
 
 DEBUG = os.getenv("DEBUG", "False").lower() == "true"
 
+# HTTP client settings (seconds)
+CONNECT_TIMEOUT = float(os.getenv("BACKEND_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("BACKEND_READ_TIMEOUT", "60"))
+# Summarize/vectorize/ask do the heavy lifting server-side and can take minutes
+LONG_READ_TIMEOUT = float(os.getenv("BACKEND_LONG_READ_TIMEOUT", "600"))
+LONG_RUNNING_ENDPOINTS = ("/summarize", "/vectorize", "/ask", "/upload", "/chat")
+MAX_RETRIES = 3
+
+
+def get_http_session() -> requests.Session:
+    """
+    Pooled keep-alive client for this Streamlit session.
+
+    Every rerun reuses the same connections instead of opening a new TCP
+    connection per call. Only idempotent methods (GET/HEAD/OPTIONS) are
+    retried, with exponential backoff, on connection errors and 502/503/504.
+    """
+    if st.session_state.get("http_session") is None:
+        retry = Retry(
+            total=MAX_RETRIES,
+            backoff_factor=0.5,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(["GET", "HEAD", "OPTIONS"]),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=10, max_retries=retry)
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        st.session_state.http_session = session
+    return st.session_state.http_session
+
+
+def request_timeout(endpoint: str) -> tuple:
+    """(connect, read) timeout for an endpoint"""
+    if endpoint.startswith(LONG_RUNNING_ENDPOINTS):
+        return (CONNECT_TIMEOUT, LONG_READ_TIMEOUT)
+    return (CONNECT_TIMEOUT, READ_TIMEOUT)
+
 
 @cache_data(ttl=300)
 def export_summary_as_txt(summary: str, filename: str) -> str:
@@ -33,9 +74,10 @@ def login(email: str, password: str) -> bool:
         # Normalize email to lowercase
         normalized_email = email.lower() if email else ""
         
-        response = requests.post(
+        response = get_http_session().post(
             f"{BACKEND_API_URL}/auth/token",
             data={"username": normalized_email, "password": password},
+            timeout=request_timeout("/auth/token"),
         )
         
         # Add debug information
@@ -87,7 +129,7 @@ def signup(email: str, username: str, password: str, gemini_api_key: str) -> boo
         # Add debug prints
         print(f"Attempting signup with email: {normalized_email}, username: {username}")
         
-        response = requests.post(
+        response = get_http_session().post(
             f"{BACKEND_API_URL}/auth/signup",
             json={
                 "email": normalized_email,
@@ -95,6 +137,7 @@ def signup(email: str, username: str, password: str, gemini_api_key: str) -> boo
                 "password": password,
                 "gemini_api_key": gemini_api_key
             },
+            timeout=request_timeout("/auth/signup"),
         )
         
         # Add debug prints
@@ -158,10 +201,17 @@ def logout():
     st.session_state.username = None
     st.session_state.token = None
     st.session_state.current_page = "login"
+    _reset_documents_cache()
+    # Per-user state the next login in this browser session must not see
+    st.session_state.pop('summary_cache', None)
+    st.session_state.pop('chat_sessions', None)
+    st.session_state.pop('chat_turns', None)
+    st.session_state.doc_search = ""
+    st.session_state.doc_cursors = [None]
 
 # Helper function to make authenticated requests
-def authenticated_request(method, endpoint, **kwargs):
-    """Make an authenticated request to the API"""
+def authenticated_request(method: str, endpoint: str, **kwargs):
+    """Make an authenticated request to the API (method is an HTTP verb, e.g. "GET")"""
     if not st.session_state.token:
         st.error("Authentication required")
         st.session_state.current_page = "login"
@@ -173,45 +223,181 @@ def authenticated_request(method, endpoint, **kwargs):
     else:
         kwargs["headers"] = headers
 
+    kwargs.setdefault("timeout", request_timeout(endpoint))
+
+    started = time.perf_counter()
     try:
-        response = method(f"{BACKEND_API_URL}{endpoint}", **kwargs)
-        print(f"API request to {endpoint}: status={response.status_code}")
+        response = get_http_session().request(method, f"{BACKEND_API_URL}{endpoint}", **kwargs)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        print(f"API request {method} {endpoint}: status={response.status_code} in {elapsed_ms:.0f} ms")
         if response.status_code == 401:
             st.error("Session expired. Please log in again.")
             logout()
             return None
         return response
     except Exception as e:
-        print(f"Error in API request to {endpoint}: {str(e)}")
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        print(f"Error in API request {method} {endpoint} after {elapsed_ms:.0f} ms: {str(e)}")
         st.error(f"API request failed: {str(e)}")
         return None
 
 
 # Existing functions modified to use authenticated requests
-def get_documents() -> List[Dict]:
-    """Get cached documents or fetch fresh data"""
-    cache_validity = 30  # seconds
-    
-    if (st.session_state.force_refresh 
-        or st.session_state.documents_cache is None 
-        or (time.time() - st.session_state.last_refresh) > cache_validity
-    ):
-        response = authenticated_request(requests.get, "/documents")
-        if response and response.status_code == 200:
-            st.session_state.documents_cache = response.json()
-        else:
-            st.session_state.documents_cache = []
-        st.session_state.last_refresh = time.time()
-        st.session_state.force_refresh = False
-    
+DOCUMENTS_PAGE_SIZE = 5
+DOCUMENTS_CACHE_TTL = 30  # seconds between change-feed syncs
+
+
+def _documents_by_id() -> Dict[str, Dict]:
+    if st.session_state.get("documents_by_id") is None:
+        st.session_state.documents_by_id = {}
+    return st.session_state.documents_by_id
+
+
+def _document_pages() -> Dict:
+    if st.session_state.get("documents_cache") is None:
+        st.session_state.documents_cache = {}
     return st.session_state.documents_cache
 
 
-def upload_document(file) -> Optional[Dict]:
-    """Upload a document with authentication"""
+def _reset_documents_cache():
+    st.session_state.documents_by_id = {}
+    st.session_state.documents_cache = {}
+    st.session_state.documents_since = None
+
+
+def _store_document(doc: Dict) -> bool:
+    """Insert or update a document in the ID-keyed cache; True if it was new"""
+    documents = _documents_by_id()
+    is_new = doc["id"] not in documents
+    documents[doc["id"]] = {**documents.get(doc["id"], {}), **doc}
+    return is_new
+
+
+def _forget_document(document_id: str):
+    """Drop a document from the cache and from every cached page"""
+    _documents_by_id().pop(document_id, None)
+    if "summary_cache" in st.session_state:
+        st.session_state.summary_cache.pop(document_id, None)
+    for entry in _document_pages().values():
+        if document_id in entry["ids"]:
+            entry["ids"].remove(document_id)
+
+
+def sync_documents():
+    """
+    Apply the backend change feed (GET /documents/changes?since=) to the
+    cache: changed documents are updated in place and deleted ones dropped.
+    New documents shift the pagination, so cached page listings are
+    discarded (the documents themselves stay cached).
+    """
+    st.session_state.documents_synced_at = time.time()
+    since = st.session_state.get("documents_since")
+    if not since:
+        return
+
+    response = authenticated_request("GET", "/documents/changes", params={"since": since})
+    if response is None or response.status_code != 200:
+        return
+    feed = response.json()
+    if feed.get("reset"):
+        _reset_documents_cache()
+        return
+
+    inserted = False
+    for doc in feed["documents"]:
+        inserted = _store_document(doc) or inserted
+    for document_id in feed["deleted"]:
+        _forget_document(document_id)
+    if inserted:
+        _document_pages().clear()
+    st.session_state.documents_since = feed["server_time"]
+
+
+def get_documents_page(search: str = "", cursor: Optional[str] = None) -> Dict:
+    """
+    Get one page of the user's documents (newest first).
+
+    Documents are cached in a dict keyed by ID and pages as lists of IDs per
+    (search, cursor). Every DOCUMENTS_CACHE_TTL seconds (or when
+    force_refresh is set) the cache is brought up to date through the change
+    feed; a page is only fetched again when it is not cached.
+    """
+    stale = (time.time() - st.session_state.get("documents_synced_at", 0)) > DOCUMENTS_CACHE_TTL
+    if st.session_state.get("force_refresh") or stale:
+        st.session_state.force_refresh = False
+        sync_documents()
+
+    pages = _document_pages()
+    key = (search, cursor)
+    if key not in pages:
+        params = {"limit": DOCUMENTS_PAGE_SIZE}
+        if search:
+            params["q"] = search
+        if cursor:
+            params["cursor"] = cursor
+        response = authenticated_request("GET", "/documents", params=params)
+        if response is None or response.status_code != 200:
+            return {"documents": [], "next_cursor": None}
+        page = response.json()
+        for doc in page["documents"]:
+            _store_document(doc)
+        pages[key] = {"ids": [doc["id"] for doc in page["documents"]], "next_cursor": page["next_cursor"]}
+        if not st.session_state.get("documents_since"):
+            st.session_state.documents_since = page["server_time"]
+            st.session_state.documents_synced_at = time.time()
+
+    documents = _documents_by_id()
+    entry = pages[key]
+    return {
+        "documents": [documents[doc_id] for doc_id in entry["ids"] if doc_id in documents],
+        "next_cursor": entry["next_cursor"],
+    }
+
+
+def find_document(document_id: str) -> Optional[Dict]:
+    """Look a document up in the cache, falling back to GET /documents/{id}"""
+    documents = _documents_by_id()
+    if document_id in documents:
+        return documents[document_id]
+
+    response = authenticated_request("GET", f"/documents/{document_id}")
+    if response is not None and response.status_code == 200:
+        doc = response.json()
+        doc["has_summary"] = bool(doc.pop("summary", None))
+        _store_document(doc)
+        return documents[document_id]
+    return None
+
+
+def get_document_summary(document_id: str) -> Optional[str]:
+    """Fetch a document's summary on demand (the document list only reports `has_summary`)"""
+    if "summary_cache" not in st.session_state:
+        st.session_state.summary_cache = {}
+
+    if document_id not in st.session_state.summary_cache:
+        response = authenticated_request("GET", f"/documents/{document_id}")
+        if not response or response.status_code != 200:
+            return None
+        summary = response.json().get("summary")
+        if not summary:
+            return None
+        st.session_state.summary_cache[document_id] = summary
+
+    return st.session_state.summary_cache[document_id]
+
+
+def version_candidates() -> List[Dict]:
+    """Documents an upload can be marked as a new version of: the cached ones, newest first"""
+    get_documents_page()  # Make sure at least the first page is cached
+    return sorted(_documents_by_id().values(), key=lambda doc: doc.get("upload_time") or "", reverse=True)
+
+
+def upload_document(file, previous_version_id: Optional[str] = None) -> Optional[Dict]:
+    """Upload a document with authentication, optionally as a new version of another one"""
     try:
         files = {"file": (file.name, file, file.type)}
-        response = authenticated_request(requests.post, "/upload", files=files)
+        data = {"previous_version_id": previous_version_id} if previous_version_id else None
+        response = authenticated_request("POST", "/upload", files=files, data=data)
         
         print(f"Upload response status: {response.status_code if response else 'No response'}")
         print(f"Upload response headers: {response.headers if response else 'No response'}")
@@ -222,7 +408,13 @@ def upload_document(file) -> Optional[Dict]:
                 print(f"Upload response JSON: {response.json()}")
             except Exception as e:
                 print(f"Error parsing JSON: {e}")
-            return response.json()
+            result = response.json()
+            # The new document goes to the top of the list, so every cached page shifts
+            doc = {key: value for key, value in result.items() if key != "summary"}
+            doc["has_summary"] = bool(result.get("summary"))
+            _store_document(doc)
+            _document_pages().clear()
+            return result
         elif response:
             print(f"Upload failed with status code: {response.status_code}")
             print(f"Response content: {response.text}")
@@ -258,8 +450,7 @@ def upload_document(file) -> Optional[Dict]:
 
 def summarize_document(document_id: str) -> Optional[Dict]:
     """Summarize a document with authentication"""
-    documents = get_documents()
-    document = next((doc for doc in documents if doc['id'] == document_id), None)
+    document = find_document(document_id)
     
     if not document:
         print(f"Document with ID {document_id} not found")
@@ -267,10 +458,16 @@ def summarize_document(document_id: str) -> Optional[Dict]:
     
     print(f"Attempting to summarize document: {document['filename']}")
     
-    response = authenticated_request(requests.post, f"/summarize/{document['filename']}")
+    response = authenticated_request("POST", f"/summarize/{document['filename']}")
     if response and response.status_code == 200:
         print(f"Document summarized successfully: {document['filename']}")
-        return response.json()
+        result = response.json()
+        if result.get("summary"):
+            if "summary_cache" not in st.session_state:
+                st.session_state.summary_cache = {}
+            st.session_state.summary_cache[document_id] = result["summary"]
+            _store_document({"id": document_id, "has_summary": True})
+        return result
     elif response:
         print(f"Summarize failed with status code: {response.status_code}")
         print(f"Response content: {response.text}")
@@ -313,8 +510,7 @@ def summarize_document(document_id: str) -> Optional[Dict]:
 
 def vectorize_document(document_id: str) -> Optional[Dict]:
     """Vectorize a document with authentication"""
-    documents = get_documents()
-    document = next((doc for doc in documents if doc['id'] == document_id), None)
+    document = find_document(document_id)
     
     if not document:
         print(f"Document with ID {document_id} not found")
@@ -323,9 +519,10 @@ def vectorize_document(document_id: str) -> Optional[Dict]:
     print(f"Attempting to vectorize document: {document['filename']}")
     print(f"Document path: {document.get('path', 'Path not available')}")
     
-    response = authenticated_request(requests.post, f"/vectorize/{document['filename']}")
+    response = authenticated_request("POST", f"/vectorize/{document['filename']}")
     if response and response.status_code == 200:
         print(f"Document vectorized successfully: {document['filename']}")
+        _store_document({"id": document_id, "is_vectorized": True})
         return response.json()
     elif response:
         print(f"Vectorize failed with status code: {response.status_code}")
@@ -346,8 +543,7 @@ def ask_question(document_id: str, question: str) -> Optional[Dict]:
     print(f"Making request to ask endpoint for document ID: {document_id}")
     print(f"Question: {question}")
     
-    documents = get_documents()
-    document = next((doc for doc in documents if doc['id'] == document_id), None)
+    document = find_document(document_id)
     
     if not document:
         print(f"Document with ID {document_id} not found")
@@ -365,7 +561,7 @@ def ask_question(document_id: str, question: str) -> Optional[Dict]:
     print(f"Request data: {data}")
     
     response = authenticated_request(
-        requests.post, 
+        "POST",
         "/ask", 
         json=data,
         headers={"Content-Type": "application/json"}
@@ -394,22 +590,73 @@ def ask_question(document_id: str, question: str) -> Optional[Dict]:
     return None
 
 
+def chat_turns(document_id: str) -> List[Dict]:
+    """Turns of this document's conversation so far, oldest first"""
+    return st.session_state.setdefault("chat_turns", {}).get(document_id, [])
+
+
+def reset_chat(document_id: str):
+    """Forget the conversation; the next message starts a new session"""
+    session_id = st.session_state.setdefault("chat_sessions", {}).pop(document_id, None)
+    st.session_state.setdefault("chat_turns", {}).pop(document_id, None)
+    if session_id:
+        authenticated_request("DELETE", f"/chat/sessions/{session_id}")
+
+
+def send_chat_message(document_id: str, question: str) -> Optional[Dict]:
+    """
+    Ask a follow-up question in the document's chat session, starting one
+    when there is none yet or the server expired it.
+    """
+    sessions = st.session_state.setdefault("chat_sessions", {})
+    for _ in range(2):
+        if document_id not in sessions:
+            response = authenticated_request("POST", "/chat/sessions", json={"document_id": document_id})
+            if not response:
+                return None
+            if response.status_code != 200:
+                st.error(f"❌ Failed to start chat: {response.json().get('detail', 'Unknown error')}")
+                return None
+            sessions[document_id] = response.json()["session_id"]
+            st.session_state.setdefault("chat_turns", {})[document_id] = []
+
+        response = authenticated_request(
+            "POST", f"/chat/sessions/{sessions[document_id]}/messages", json={"question": question}
+        )
+        if not response:
+            return None
+        if response.status_code == 404 and "chat session" in response.text.lower():
+            # Expired on the server: start over with a new session
+            sessions.pop(document_id, None)
+            continue
+        if response.status_code == 200:
+            result = response.json()
+            st.session_state.chat_turns[document_id].append({"question": question, "answer": result.get("answer", "")})
+            return result
+        if response.status_code == 400 and "gemini api key not found" in response.text.lower():
+            st.error("⚠️ Your Gemini API key is missing or invalid. Please ensure it is provided during signup.")
+        else:
+            st.error(f"❌ Failed to get answer: {response.json().get('detail', 'Unknown error')}")
+        return None
+    return None
+
+
 def delete_document(document_id: str) -> bool:
     """Delete a document with authentication"""
-    documents = get_documents()
-    document = next((doc for doc in documents if doc['id'] == document_id), None)
+    document = find_document(document_id)
     
     if not document:
         print(f"Document with ID {document_id} not found")
         return False
     
     response = authenticated_request(
-        requests.delete, 
+        "DELETE",
         f"/documents/{document['filename']}?document_id={document_id}"
     )
     
     if response and response.status_code == 200:
         print(f"Document and folder deleted successfully: {document['filename']}")
+        _forget_document(document_id)
         return True
     else:
         print(f"Failed to delete document: {response.text if response else 'No response'}")
@@ -435,7 +682,7 @@ def delete_my_account() -> bool:
     print(f"Attempting to delete account for user ID: {st.session_state.user_id}")
     
     response = authenticated_request(
-        requests.delete, 
+        "DELETE",
         f"/delete/my-account", # New endpoint to be created in backend
         headers={"Content-Type": "application/json"}
     )
@@ -449,7 +696,12 @@ def delete_my_account() -> bool:
         st.session_state.pop('username', None)
         st.session_state.pop('token', None)
         st.session_state.pop('documents_cache', None)
-        st.session_state.pop('last_refresh', None)
+        st.session_state.pop('documents_by_id', None)
+        st.session_state.pop('documents_since', None)
+        st.session_state.pop('documents_synced_at', None)
+        st.session_state.pop('summary_cache', None)
+        st.session_state.pop('chat_sessions', None)
+        st.session_state.pop('chat_turns', None)
         st.session_state.pop('force_refresh', None)
         st.session_state.pop('confirm_delete_account', None)
         if 'chat_history' in st.session_state: # Clear chat history if it exists
@@ -482,7 +734,7 @@ def wait_for_backend(timeout=60, interval=3):
     while time.time() - start_time < timeout:
         try:
             # Attempt to hit a lightweight backend endpoint (e.g., the root '/')
-            response = requests.get(BACKEND_API_URL, timeout=5) # Small timeout for each ping attempt
+            response = get_http_session().get(BACKEND_API_URL, timeout=(CONNECT_TIMEOUT, 5)) # Small timeout for each ping attempt
             if response.status_code == 200:
                 return True # Backend is awake and responsive
         except requests.exceptions.ConnectionError:
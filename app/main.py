@@ -3,10 +3,10 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import os
-import time
 from datetime import datetime # Added for datetime.utcnow() (though default_factory handles creation time)
 # --- Database Imports ---
 from app.database import create_db, engine # engine is needed for session and metadata.create_all
+from app.migrations import run_migrations
 from sqlmodel import Session, SQLModel, select # Session and SQLModel.metadata are used
 
 # --- Import password hashing/verification functions ---
@@ -17,9 +17,12 @@ from app.models.user import User # User model is needed for admin creation
 
 # --- Config Imports ---
 from app.config import create_required_directories, DB_DIR # DB_DIR is used in initialize_database_and_admin_user
+from app.utils.vector_store_gc import start_gc_scheduler
+from app.utils.file_lock import file_lock
+from app.utils.metrics import MetricsMiddleware, start_snapshot_writer
 
 # --- Router Imports ---
-from app.routes import file_info, upload, summarize, vectorize, ask, delete, health, auth, admin
+from app.routes import file_info, upload, summarize, vectorize, ask, chat, delete, health, auth, admin, metrics, usage
 
 app = FastAPI(title="SmartDoc AI API")
 
@@ -32,14 +35,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-route latency and in-flight requests; labels the stage timings recorded below it
+app.add_middleware(MetricsMiddleware)
+
 
 # --- Function to initialize database and admin user (Moved from main_utils.py) ---
 def initialize_database_and_admin_user():
     print("Attempting to initialize database and admin user...")
 
-    # Optional, but can help with file system stability on some systems/deployments
-    time.sleep(5) 
-
     # --- Get admin user details from environment variables ---
     admin_email = os.getenv("ADMIN_EMAIL")
     print("admin_email:", admin_email)
@@ -118,13 +121,22 @@ def initialize_database_and_admin_user():
 
     print("Database and admin initialization complete.")
 
+# Held by whichever worker is bootstrapping; the others wait for it
+BOOTSTRAP_LOCK_PATH = os.path.join(DB_DIR, ".bootstrap.lock")
+
 # --- Existing startup event ---
 @app.on_event("startup")
 def on_startup():
     print("Running startup events...")
     create_required_directories()
-    create_db() # This already calls SQLModel.metadata.create_all
-    initialize_database_and_admin_user() 
+    # With several uvicorn workers every one of them runs this. The lock makes them take turns:
+    # the first creates the schema, migrates and creates the admin, the rest find it all done.
+    with file_lock(BOOTSTRAP_LOCK_PATH):
+        create_db() # This already calls SQLModel.metadata.create_all
+        run_migrations(engine) # Brings existing databases up to date (indexes/columns create_all skips)
+        initialize_database_and_admin_user() 
+    start_gc_scheduler() # Periodically sweeps vector stores no document references any more (one worker only)
+    start_snapshot_writer() # With several workers, /metrics sums every worker's snapshot
     print("Startup events completed.")
 
 # Include routers
@@ -134,8 +146,11 @@ app.include_router(upload.router, tags=["documents"])
 app.include_router(summarize.router, tags=["documents"])
 app.include_router(vectorize.router, tags=["documents"])
 app.include_router(ask.router, tags=["chat"])
+app.include_router(chat.router, tags=["chat"])
+app.include_router(usage.router, tags=["usage"])
 app.include_router(delete.router, tags=["documents"])
 app.include_router(health.router, tags=["system"])
+app.include_router(metrics.router, tags=["system"])
 app.include_router(admin.router, tags=["admin"], prefix="/admin")
 
 @app.get("/")
@@ -0,0 +1,156 @@
+# app/migrations.py
+"""
+Minimal schema migration runner.
+
+SQLModel.metadata.create_all() only creates tables that are missing, so new
+indexes or columns on existing tables never reach databases created by an
+older release. Each migration below runs exactly once, in order, and is
+recorded in the `schema_migrations` table. Migrations must be idempotent
+(IF NOT EXISTS, check the inspector first), because a fresh database already has
+everything create_all() knows about.
+"""
+import hashlib
+import logging
+import os
+from datetime import datetime
+from typing import Callable, Iterable, List, Tuple
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, insert, select, text
+from sqlalchemy.engine import Connection, Engine
+
+from app.models.cached_answer import CachedAnswer
+from app.models.document import Document
+
+logger = logging.getLogger(__name__)
+
+# Kept on its own MetaData so create_all() on the models never touches it.
+_migration_metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    _migration_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+def _create_index(connection: Connection, name: str, table: str, columns: Iterable[str]) -> None:
+    """
+    CREATE INDEX IF NOT EXISTS with the definition frozen in the migration itself,
+    so old migrations keep working when the model's indexes change later.
+    Skipped when one of the columns no longer exists (a later migration or the
+    current model dropped it).
+    """
+    columns = list(columns)
+    existing = {c["name"] for c in inspect(connection).get_columns(table.strip('"'))}
+    if not set(columns) <= existing:
+        return
+    connection.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"))
+
+
+def _add_model_column(connection: Connection, model, column_name: str) -> bool:
+    """ALTER TABLE ... ADD COLUMN for a column declared on the model. Returns False if it already exists."""
+    table = model.__table__
+    existing = {c["name"] for c in inspect(connection).get_columns(table.name)}
+    if column_name in existing:
+        return False
+    column_type = table.c[column_name].type.compile(dialect=connection.dialect)
+    connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column_name} {column_type}"))
+    return True
+
+
+def _add_document_indexes(connection: Connection) -> None:
+    _create_index(connection, "ix_document_filename_user_id", "document", ["filename", "user_id"])
+    _create_index(connection, "ix_document_user_id_file_hash", "document", ["user_id", "file_hash"])
+    _create_index(connection, "ix_document_file_hash_is_vectorized", "document", ["file_hash", "is_vectorized"])
+
+
+def _add_document_updated_at(connection: Connection) -> None:
+    _add_model_column(connection, Document, "updated_at")
+    connection.execute(text("UPDATE document SET updated_at = upload_time WHERE updated_at IS NULL"))
+    _create_index(connection, "ix_document_user_id_upload_time", "document", ["user_id", "upload_time"])
+    _create_index(connection, "ix_document_user_id_updated_at", "document", ["user_id", "updated_at"])
+
+
+def _add_admin_listing_indexes(connection: Connection) -> None:
+    _create_index(connection, "ix_user_created_at_id", '"user"', ["created_at", "id"])
+    _create_index(connection, "ix_document_upload_time_id", "document", ["upload_time", "id"])
+
+
+def _move_content_state_out_of_document(connection: Connection) -> None:
+    """
+    Populate the content table (one row per file_hash) from the summary and
+    is_vectorized values that used to be copied into each document row, then
+    drop those columns from document.
+    """
+    columns = {c["name"] for c in inspect(connection).get_columns("document")}
+    if "summary" not in columns:
+        return  # Database was created with the content table already in place
+
+    # Legacy rows may lack a hash; it used to be computed lazily on first use
+    for doc_id, path in connection.execute(text("SELECT id, path FROM document WHERE file_hash IS NULL")).all():
+        if path and os.path.exists(path):
+            with open(path, "rb") as f:
+                file_hash = hashlib.md5(f.read()).hexdigest()
+            connection.execute(
+                text("UPDATE document SET file_hash = :file_hash WHERE id = :id"),
+                {"file_hash": file_hash, "id": doc_id},
+            )
+
+    now = datetime.utcnow()
+    connection.execute(text("""
+        INSERT INTO content (file_hash, summary, is_vectorized, created_at, updated_at)
+        SELECT file_hash, MAX(summary), MAX(is_vectorized), :now, :now
+        FROM document
+        WHERE file_hash IS NOT NULL
+          AND file_hash NOT IN (SELECT file_hash FROM content)
+        GROUP BY file_hash
+    """), {"now": now})
+
+    connection.execute(text("DROP INDEX IF EXISTS ix_document_file_hash_is_vectorized"))
+    connection.execute(text("ALTER TABLE document DROP COLUMN summary"))
+    connection.execute(text("ALTER TABLE document DROP COLUMN is_vectorized"))
+    _create_index(connection, "ix_document_file_hash", "document", ["file_hash"])
+
+
+def _add_document_previous_version_id(connection: Connection) -> None:
+    _add_model_column(connection, Document, "previous_version_id")
+
+
+def _add_cached_answer_context(connection: Connection) -> None:
+    _add_model_column(connection, CachedAnswer, "context")
+
+
+# (version, name, callable) - append only, never renumber.
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "add composite indexes on document", _add_document_indexes),
+    (2, "add document.updated_at for listing ETags", _add_document_updated_at),
+    (3, "add keyset indexes for admin listings", _add_admin_listing_indexes),
+    (4, "move summary/is_vectorized into content table", _move_content_state_out_of_document),
+    (5, "add document.previous_version_id for new-version uploads", _add_document_previous_version_id),
+    (6, "add cachedanswer.context so cache hits carry the packing report", _add_cached_answer_context),
+]
+
+
+def run_migrations(engine: Engine) -> List[int]:
+    """Apply pending migrations and return the versions that were applied."""
+    applied_now = []
+    with engine.begin() as connection:
+        schema_migrations.create(bind=connection, checkfirst=True)
+        applied = set(connection.execute(select(schema_migrations.c.version)).scalars())
+
+        for version, name, migrate in MIGRATIONS:
+            if version in applied:
+                continue
+            logger.info(f"Applying schema migration {version}: {name}")
+            migrate(connection)
+            connection.execute(
+                insert(schema_migrations).values(
+                    version=version, name=name, applied_at=datetime.utcnow()
+                )
+            )
+            applied_now.append(version)
+
+    if applied_now:
+        logger.info(f"Schema migrations applied: {applied_now}")
+    return applied_now
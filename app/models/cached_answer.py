@@ -0,0 +1,122 @@
+from sqlmodel import SQLModel, Field, Session
+from datetime import datetime, timedelta, timezone
+import json
+import re
+from typing import Any, Dict, List, Optional
+from sqlalchemy import Column, DateTime, Text, delete, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION = re.compile(r"[\s?!.]+$")
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def normalize_question(question: str) -> str:
+    """Case, whitespace and trailing ?!. do not make a different question."""
+    return _TRAILING_PUNCTUATION.sub("", _WHITESPACE.sub(" ", question.strip().lower()))
+
+
+class CachedAnswer(SQLModel, table=True):
+    """
+    An /ask answer for one content (file_hash), shared by every user asking
+    about that content. Looked up by normalized question, or by TF-IDF
+    similarity to the cached questions (app/utils/answer_cache.py). Rows
+    expire after ANSWER_CACHE_TTL_SECONDS; beyond ANSWER_CACHE_MAX_PER_DOCUMENT
+    per content the least recently hit ones are evicted.
+    """
+    file_hash: str = Field(primary_key=True)
+    model: str = Field(primary_key=True)  # "<provider>:<model>" that wrote the answer
+    question_key: str = Field(primary_key=True)  # normalize_question(question)
+    question: str = Field(sa_column=Column(Text, nullable=False))
+    rewritten_questions: str = Field(sa_column=Column(Text, nullable=False))  # JSON list
+    answer: str = Field(sa_column=Column(Text, nullable=False))
+    sources: str = Field(sa_column=Column(Text, nullable=False))  # JSON list of {chunk_id, page_content}
+    context: Optional[str] = Field(default=None, sa_column=Column(Text, nullable=True))  # JSON packing report
+    hits: int = 0
+    created_at: datetime = Field(
+        default_factory=_utcnow,
+        sa_column=Column(DateTime(timezone=True), default=_utcnow, index=True)
+    )
+    last_hit_at: datetime = Field(
+        default_factory=_utcnow,
+        sa_column=Column(DateTime(timezone=True), default=_utcnow)
+    )
+
+    def to_response(self) -> Dict[str, Any]:
+        return {
+            "original_question": self.question,
+            "rewritten_questions": json.loads(self.rewritten_questions),
+            "answer": self.answer,
+            "sources": json.loads(self.sources),
+            # Entries cached before the packing report was stored have none
+            "context": json.loads(self.context) if self.context else None,
+        }
+
+
+def fresh_answers(db: Session, file_hash: str, model: str, ttl_seconds: int) -> List[CachedAnswer]:
+    """Unexpired cached answers of one content, most recently hit first."""
+    return list(db.execute(
+        select(CachedAnswer)
+        .where(CachedAnswer.file_hash == file_hash)
+        .where(CachedAnswer.model == model)
+        .where(CachedAnswer.created_at >= _utcnow() - timedelta(seconds=ttl_seconds))
+        .order_by(CachedAnswer.last_hit_at.desc())
+    ).scalars())
+
+
+def record_hit(db: Session, entry: CachedAnswer) -> None:
+    """Count a hit and make the entry the most recently used one. Commits."""
+    db.execute(
+        update(CachedAnswer)
+        .where(CachedAnswer.file_hash == entry.file_hash)
+        .where(CachedAnswer.model == entry.model)
+        .where(CachedAnswer.question_key == entry.question_key)
+        .values(hits=CachedAnswer.hits + 1, last_hit_at=_utcnow())
+    )
+    db.commit()
+
+
+def store_answer(
+    db: Session, file_hash: str, model: str, question: str, response: Dict[str, Any], ttl_seconds: int, max_entries: int
+) -> None:
+    """
+    Cache an answer (a concurrent request caching the same question first
+    wins), then drop the content's expired entries and the least recently
+    hit ones beyond max_entries. Commits.
+    """
+    now = _utcnow()
+    db.execute(sqlite_insert(CachedAnswer).values(
+        file_hash=file_hash,
+        model=model,
+        question_key=normalize_question(question),
+        question=question,
+        rewritten_questions=json.dumps(response["rewritten_questions"]),
+        answer=response["answer"],
+        sources=json.dumps(response["sources"]),
+        context=json.dumps(response["context"]) if response.get("context") is not None else None,
+        hits=0,
+        created_at=now,
+        last_hit_at=now,
+    ).on_conflict_do_nothing())
+
+    of_content = (CachedAnswer.file_hash == file_hash, CachedAnswer.model == model)
+    db.execute(delete(CachedAnswer).where(*of_content).where(CachedAnswer.created_at < now - timedelta(seconds=ttl_seconds)))
+    keep = (
+        select(CachedAnswer.question_key)
+        .where(*of_content)
+        .order_by(CachedAnswer.last_hit_at.desc())
+        .limit(max_entries)
+    )
+    db.execute(delete(CachedAnswer).where(*of_content).where(CachedAnswer.question_key.not_in(keep)))
+    db.commit()
+
+
+def delete_expired_answers(db: Session, ttl_seconds: int, file_hashes: Optional[List[str]] = None) -> int:
+    """Remove expired entries (and every entry of `file_hashes`). Caller commits."""
+    condition = CachedAnswer.created_at < _utcnow() - timedelta(seconds=ttl_seconds)
+    if file_hashes:
+        condition = condition | CachedAnswer.file_hash.in_(file_hashes)
+    return db.execute(delete(CachedAnswer).where(condition)).rowcount
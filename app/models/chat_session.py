@@ -0,0 +1,43 @@
+from sqlmodel import SQLModel, Field
+from datetime import datetime, timezone
+from typing import Iterable, Optional
+from uuid import UUID, uuid4
+from sqlalchemy import Column, DateTime, Text, delete
+from sqlmodel import Session
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class ChatSession(SQLModel, table=True):
+    """
+    A multi-turn conversation about one document (see app/utils/chat.py).
+    The state is bounded: the last turns verbatim, a running summary of the
+    older ones, and the window of chunk IDs the model currently sees. It is
+    stored here so any worker can continue the session.
+    """
+    id: UUID = Field(default_factory=uuid4, primary_key=True)
+    user_id: UUID = Field(foreign_key="user.id", index=True)
+    document_id: UUID = Field(index=True)
+    file_hash: str
+    turns: str = Field(default="[]", sa_column=Column(Text, nullable=False))  # JSON [{question, answer, new_chunk_ids}]
+    history_summary: Optional[str] = Field(default=None, sa_column=Column(Text, nullable=True))
+    summarized_turns: int = 0  # Turns folded into history_summary
+    chunk_window: str = Field(default="[]", sa_column=Column(Text, nullable=False))  # JSON chunk IDs, least recently used first
+    created_at: datetime = Field(
+        default_factory=_utcnow,
+        sa_column=Column(DateTime(timezone=True), default=_utcnow)
+    )
+    updated_at: datetime = Field(
+        default_factory=_utcnow,
+        sa_column=Column(DateTime(timezone=True), default=_utcnow, onupdate=_utcnow, index=True)
+    )
+
+
+def delete_document_sessions(db: Session, document_ids: Iterable[UUID]) -> int:
+    """Remove the chat sessions about these (deleted) documents. Caller commits."""
+    document_ids = list(document_ids)
+    if not document_ids:
+        return 0
+    return db.execute(delete(ChatSession).where(ChatSession.document_id.in_(document_ids))).rowcount
@@ -0,0 +1,136 @@
+from sqlmodel import SQLModel, Field, Session
+from datetime import datetime, timezone
+import hashlib
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import Column, DateTime, Text, delete, insert, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+# Rows per IN (...) / multi-row INSERT, well below SQLite's bound-parameter limit
+_BATCH = 500
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def normalize_chunk_text(text: str) -> str:
+    """Collapse whitespace runs and trim, so re-wrapped or re-indented passages hash the same."""
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha256(normalize_chunk_text(text).encode("utf-8")).hexdigest()
+
+
+class Chunk(SQLModel, table=True):
+    """
+    A passage of document text stored once under the hash of its normalized
+    text, whichever documents contain it: contract boilerplate, legal
+    footers and unchanged sections of a revision all map to the same row.
+    Vector store chunks are listed per content by ContentChunk; summarizer
+    map units also keep the map summary produced for them, so any later
+    document containing the same passage skips that part of the map phase.
+    """
+    chunk_hash: str = Field(primary_key=True)
+    text: str = Field(sa_column=Column(Text, nullable=False))
+    map_summary: Optional[str] = Field(default=None, sa_column=Column(Text, nullable=True))
+    map_model: Optional[str] = None  # Model that wrote map_summary; other models do not reuse it
+    created_at: datetime = Field(
+        default_factory=_utcnow,
+        sa_column=Column(DateTime(timezone=True), default=_utcnow)
+    )
+    last_used_at: datetime = Field(
+        default_factory=_utcnow,
+        sa_column=Column(DateTime(timezone=True), default=_utcnow, index=True)
+    )
+
+
+class ContentChunk(SQLModel, table=True):
+    """The vector store chunks of one content, in order (position = index in chunks.pkl)."""
+    file_hash: str = Field(primary_key=True)
+    position: int = Field(primary_key=True)
+    chunk_hash: str = Field(index=True)
+
+
+def _existing_hashes(db: Session, hashes: Iterable[str]) -> set:
+    hashes = list(hashes)
+    found = set()
+    for start in range(0, len(hashes), _BATCH):
+        found.update(db.execute(
+            select(Chunk.chunk_hash).where(Chunk.chunk_hash.in_(hashes[start:start + _BATCH]))
+        ).scalars())
+    return found
+
+
+def _insert_new_chunks(db: Session, rows: List[Dict]) -> None:
+    # ON CONFLICT DO NOTHING: another ingestion may add the same passage concurrently
+    for start in range(0, len(rows), _BATCH):
+        db.execute(sqlite_insert(Chunk).values(rows[start:start + _BATCH]).on_conflict_do_nothing())
+
+
+def _touch(db: Session, hashes: List[str], now: datetime) -> None:
+    # last_used_at keeps passages that are still being reused from being pruned by the GC
+    for start in range(0, len(hashes), _BATCH):
+        db.execute(update(Chunk).where(Chunk.chunk_hash.in_(hashes[start:start + _BATCH])).values(last_used_at=now))
+
+
+def register_content_chunks(db: Session, file_hash: str, chunks: List[str]) -> Dict[str, float]:
+    """
+    Store the chunks of one content (new passages only) and list them under
+    its file_hash, replacing an earlier listing. Returns how many were
+    already known: reused / new counts and the reuse ratio. Caller commits.
+    """
+    hashes = [chunk_hash(chunk) for chunk in chunks]
+    known = _existing_hashes(db, set(hashes))
+    now = _utcnow()
+    new_rows, reused, seen = [], 0, set()
+    for chunk, digest in zip(chunks, hashes):
+        if digest in known or digest in seen:
+            reused += 1
+        else:
+            seen.add(digest)
+            new_rows.append({"chunk_hash": digest, "text": chunk, "created_at": now, "last_used_at": now})
+    _insert_new_chunks(db, new_rows)
+    _touch(db, list(known), now)
+
+    db.execute(delete(ContentChunk).where(ContentChunk.file_hash == file_hash))
+    listing = [{"file_hash": file_hash, "position": position, "chunk_hash": digest} for position, digest in enumerate(hashes)]
+    for start in range(0, len(listing), _BATCH):
+        db.execute(insert(ContentChunk), listing[start:start + _BATCH])
+
+    total = len(chunks)
+    return {"chunks": total, "reused": reused, "new": total - reused, "reuse_ratio": round(reused / total, 4) if total else 0.0}
+
+
+def get_map_summaries(db: Session, hashes: Iterable[str], model: str) -> Dict[str, str]:
+    """Stored map summaries written by `model` for these chunk hashes (missing ones are left out). Caller commits."""
+    hashes = list(hashes)
+    summaries = {}
+    for start in range(0, len(hashes), _BATCH):
+        rows = db.execute(
+            select(Chunk.chunk_hash, Chunk.map_summary)
+            .where(Chunk.chunk_hash.in_(hashes[start:start + _BATCH]))
+            .where(Chunk.map_model == model)
+            .where(Chunk.map_summary.is_not(None))
+        ).all()
+        summaries.update({digest: summary for digest, summary in rows})
+    _touch(db, list(summaries), _utcnow())
+    return summaries
+
+
+def store_map_summaries(db: Session, summaries: Dict[str, Tuple[str, str]], model: str) -> None:
+    """Save {chunk_hash: (text, map summary)} for `model`, creating the chunks that are new. Caller commits."""
+    now = _utcnow()
+    _insert_new_chunks(db, [
+        {"chunk_hash": digest, "text": text, "created_at": now, "last_used_at": now}
+        for digest, (text, _) in summaries.items()
+    ])
+    for digest, (_, summary) in summaries.items():
+        db.execute(
+            update(Chunk)
+            .where(Chunk.chunk_hash == digest)
+            .values(map_summary=summary, map_model=model, last_used_at=now)
+        )
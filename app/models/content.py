@@ -0,0 +1,58 @@
+from sqlmodel import SQLModel, Field, Session, update
+from datetime import datetime, timezone
+from typing import Optional
+from sqlalchemy import Column, DateTime, Text
+from sqlalchemy.exc import IntegrityError
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class Content(SQLModel, table=True):
+    """
+    State that belongs to the file contents rather than to an upload: every
+    Document with the same file_hash points at one Content row, so dedup
+    lookups are primary-key hits and a summary is stored once.
+    """
+    file_hash: str = Field(primary_key=True)
+    summary: Optional[str] = Field(default=None, sa_column=Column(Text, nullable=True))
+    is_vectorized: bool = Field(default=False)
+    text_path: Optional[str] = None  # Extracted plain text (EXTRACTED_TEXT_DIR/<file_hash>.txt)
+    chunk_count: Optional[int] = None  # Number of chunks in the vector store
+    created_at: datetime = Field(
+        default_factory=_utcnow,
+        sa_column=Column(DateTime(timezone=True), default=_utcnow)
+    )
+    updated_at: datetime = Field(
+        default_factory=_utcnow,
+        sa_column=Column(DateTime(timezone=True), default=_utcnow, onupdate=_utcnow)
+    )
+
+
+def get_or_create_content(db: Session, file_hash: str) -> Content:
+    """Return the Content row for a hash, creating it if needed (safe against concurrent creators)."""
+    content = db.get(Content, file_hash)
+    if content:
+        return content
+    try:
+        with db.begin_nested():
+            content = Content(file_hash=file_hash)
+            db.add(content)
+    except IntegrityError:
+        # Someone else created it between our get() and insert
+        content = db.get(Content, file_hash)
+    return content
+
+
+def touch_documents(db: Session, file_hash: str) -> None:
+    """
+    Bump updated_at on every document sharing this content, so listing ETags
+    change when a summary or vectorization finishes. Caller commits.
+    """
+    from app.models.document import Document
+    db.exec(
+        update(Document)
+        .where(Document.file_hash == file_hash)
+        .values(updated_at=_utcnow())
+    )
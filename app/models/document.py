@@ -1,11 +1,35 @@
 from sqlmodel import SQLModel, Field, Relationship
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 from uuid import UUID, uuid4
-from sqlalchemy import Column, DateTime
+from sqlalchemy import Column, DateTime, Index
 from datetime import timezone
+from pydantic import BaseModel
+from app.models.content import Content
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
 
 class Document(SQLModel, table=True):
+    # Composite indexes matching the hot lookups:
+    #   (filename, user_id)      -> per-user lookups in summarize/vectorize/ask
+    #   (user_id, file_hash)     -> duplicate detection on upload
+    #   (file_hash)              -> documents sharing a Content row, GC live set
+    #   (user_id, upload_time)   -> keyset pagination of GET /documents
+    #   (user_id, updated_at)    -> ETag / change detection for listings
+    #   (upload_time, id)        -> keyset pagination of the admin listing
+    # Existing databases get these through app/migrations.py.
+    __table_args__ = (
+        Index("ix_document_filename_user_id", "filename", "user_id"),
+        Index("ix_document_user_id_file_hash", "user_id", "file_hash"),
+        Index("ix_document_file_hash", "file_hash"),
+        Index("ix_document_user_id_upload_time", "user_id", "upload_time"),
+        Index("ix_document_user_id_updated_at", "user_id", "updated_at"),
+        Index("ix_document_upload_time_id", "upload_time", "id"),
+    )
+
     id: UUID = Field(default_factory=uuid4, primary_key=True, index=True)
     filename: str
     file_type: str
@@ -13,14 +37,20 @@ class Document(SQLModel, table=True):
         sa_column=Column(DateTime(timezone=True))
     )
     path: str
-    summary: Optional[str] = None
-    is_vectorized: bool = Field(default=False)  # Track vectorization status
     user_id: Optional[UUID] = Field(default=None, foreign_key="user.id")
-    file_hash: Optional[str] = None  # Store file hash to identify identical files
+    # Identifies identical files; summary and vectorization state live on Content
+    file_hash: Optional[str] = Field(default=None, foreign_key="content.file_hash")
+    # Set when uploaded as a new version of another of the user's documents; vectorizing
+    # then patches that version's vector store instead of starting from scratch
+    previous_version_id: Optional[UUID] = Field(default=None)
+    # Bumped on every ORM/Core update; drives listing ETags
+    updated_at: Optional[datetime] = Field(
+        default=None,
+        sa_column=Column(DateTime(timezone=True), default=_utcnow, onupdate=_utcnow)
+    )
 
+    content: Optional[Content] = Relationship()
 
-from pydantic import BaseModel
-from typing import List
 
 class BatchDeleteRequest(BaseModel):
     document_ids: List[str]
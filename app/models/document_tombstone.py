@@ -0,0 +1,34 @@
+from sqlmodel import SQLModel, Field, Session
+from datetime import datetime, timezone
+from typing import Iterable, Tuple
+from uuid import UUID
+from sqlalchemy import Column, DateTime, Index, insert
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class DocumentTombstone(SQLModel, table=True):
+    """
+    Marker left behind when a document is deleted, so the `since=` change
+    feed can tell clients which cached documents to drop. Old tombstones are
+    pruned by the GC (TOMBSTONE_RETENTION_SECONDS).
+    """
+    __table_args__ = (
+        Index("ix_documenttombstone_user_id_deleted_at", "user_id", "deleted_at"),
+    )
+
+    document_id: UUID = Field(primary_key=True)
+    user_id: UUID
+    deleted_at: datetime = Field(
+        default_factory=_utcnow,
+        sa_column=Column(DateTime(timezone=True), default=_utcnow)
+    )
+
+
+def record_deletions(db: Session, deleted: Iterable[Tuple[UUID, UUID]]) -> None:
+    """Insert tombstones for (document_id, user_id) pairs in one statement. Caller commits."""
+    rows = [{"document_id": document_id, "user_id": user_id} for document_id, user_id in deleted if user_id]
+    if rows:
+        db.execute(insert(DocumentTombstone), rows)
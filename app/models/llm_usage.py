@@ -0,0 +1,135 @@
+from sqlmodel import SQLModel, Field, Session
+from datetime import date, datetime, timezone
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+from sqlalchemy import Column, DateTime, Index, func, insert, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class LLMUsage(SQLModel, table=True):
+    """
+    One LLM call (append-only): who made it, from which endpoint and
+    operation, on which model, its token counts and latency. Rows older than
+    LLM_USAGE_RETENTION_DAYS are pruned by the GC; LLMUsageDaily keeps the totals.
+    """
+    __table_args__ = (
+        Index("ix_llmusage_user_id_created_at", "user_id", "created_at"),
+        Index("ix_llmusage_created_at", "created_at"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: UUID
+    endpoint: str  # Route template, e.g. "/ask"
+    operation: str  # rewrite, answer, summarize, ...
+    model: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    tokens_estimated: bool = False  # True when the provider reported no usage (len // 4 estimate)
+    latency_ms: float = 0.0
+    success: bool = True
+    created_at: datetime = Field(
+        default_factory=_utcnow,
+        sa_column=Column(DateTime(timezone=True), default=_utcnow)
+    )
+
+
+class LLMUsageDaily(SQLModel, table=True):
+    """Per day, user, endpoint, operation and model totals, updated with every LLMUsage insert."""
+    day: date = Field(primary_key=True)
+    user_id: UUID = Field(primary_key=True)
+    endpoint: str = Field(primary_key=True)
+    operation: str = Field(primary_key=True)
+    model: str = Field(primary_key=True)
+    calls: int = 0
+    errors: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    latency_ms: float = 0.0  # Sum; divide by calls for the mean
+
+
+def record_llm_usage(db: Session, usage: Dict[str, Any]) -> None:
+    """Append one call to LLMUsage and fold it into today's LLMUsageDaily row (one upsert). Caller commits."""
+    usage = {**usage, "created_at": usage.get("created_at") or _utcnow()}
+    db.execute(insert(LLMUsage), [usage])
+
+    daily = sqlite_insert(LLMUsageDaily).values(
+        day=usage["created_at"].date(),
+        user_id=usage["user_id"],
+        endpoint=usage["endpoint"],
+        operation=usage["operation"],
+        model=usage["model"],
+        calls=1,
+        errors=0 if usage["success"] else 1,
+        prompt_tokens=usage["prompt_tokens"],
+        completion_tokens=usage["completion_tokens"],
+        latency_ms=usage["latency_ms"],
+    )
+    db.execute(daily.on_conflict_do_update(
+        index_elements=["day", "user_id", "endpoint", "operation", "model"],
+        set_={
+            "calls": LLMUsageDaily.calls + daily.excluded.calls,
+            "errors": LLMUsageDaily.errors + daily.excluded.errors,
+            "prompt_tokens": LLMUsageDaily.prompt_tokens + daily.excluded.prompt_tokens,
+            "completion_tokens": LLMUsageDaily.completion_tokens + daily.excluded.completion_tokens,
+            "latency_ms": LLMUsageDaily.latency_ms + daily.excluded.latency_ms,
+        }
+    ))
+
+
+def usage_totals(db: Session, since: date, group_by: List[str], user_id: Optional[UUID] = None) -> List[Dict[str, Any]]:
+    """
+    Sum LLMUsageDaily from `since` (inclusive), grouped by the given columns
+    (any of day, user_id, endpoint, operation, model), most tokens first.
+    """
+    keys = [getattr(LLMUsageDaily, name) for name in group_by]
+    statement = (
+        select(
+            *keys,
+            func.sum(LLMUsageDaily.calls).label("calls"),
+            func.sum(LLMUsageDaily.errors).label("errors"),
+            func.sum(LLMUsageDaily.prompt_tokens).label("prompt_tokens"),
+            func.sum(LLMUsageDaily.completion_tokens).label("completion_tokens"),
+            func.sum(LLMUsageDaily.latency_ms).label("latency_ms"),
+        )
+        .where(LLMUsageDaily.day >= since)
+        .group_by(*keys)
+    )
+    if user_id is not None:
+        statement = statement.where(LLMUsageDaily.user_id == user_id)
+
+    rows = []
+    for row in db.execute(statement).mappings():
+        calls = row["calls"] or 0
+        entry = {name: row[name] for name in group_by}
+        entry.update({
+            "calls": calls,
+            "errors": row["errors"] or 0,
+            "prompt_tokens": row["prompt_tokens"] or 0,
+            "completion_tokens": row["completion_tokens"] or 0,
+            "total_tokens": (row["prompt_tokens"] or 0) + (row["completion_tokens"] or 0),
+            "avg_latency_ms": round((row["latency_ms"] or 0) / calls, 1) if calls else 0.0,
+        })
+        for name in ("day", "user_id"):
+            if name in entry:
+                entry[name] = str(entry[name])
+        rows.append(entry)
+    if "day" in group_by:
+        rows.sort(key=lambda entry: entry["day"])
+    else:
+        rows.sort(key=lambda entry: entry["total_tokens"], reverse=True)
+    return rows
+
+
+def usage_report(db: Session, since: date, user_id: Optional[UUID] = None) -> Dict[str, Any]:
+    """Totals plus breakdowns by endpoint/operation, model and day, from the daily rollup."""
+    return {
+        "since": since.isoformat(),
+        "totals": usage_totals(db, since, [], user_id)[0],
+        "by_endpoint": usage_totals(db, since, ["endpoint", "operation"], user_id),
+        "by_model": usage_totals(db, since, ["model"], user_id),
+        "daily": usage_totals(db, since, ["day"], user_id),
+    }
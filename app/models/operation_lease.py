@@ -0,0 +1,75 @@
+from sqlmodel import SQLModel, Field, Session
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import Column, DateTime, delete, update
+from sqlalchemy.exc import IntegrityError
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class OperationLease(SQLModel, table=True):
+    """
+    Cross-process lock on one (operation, file_hash), e.g. ("vectorize", <hash>).
+    The row exists while a worker is doing that work; a lease whose holder
+    died expires and can be taken over. See app/utils/single_flight.py.
+    """
+    operation: str = Field(primary_key=True)
+    file_hash: str = Field(primary_key=True)
+    owner: str
+    expires_at: datetime = Field(sa_column=Column(DateTime(timezone=True), nullable=False))
+
+
+def acquire_lease(db: Session, operation: str, file_hash: str, owner: str, ttl_seconds: int) -> bool:
+    """Take the lease if nobody holds it or the holder's lease expired. Commits."""
+    now = _utcnow()
+    expires_at = now + timedelta(seconds=ttl_seconds)
+    try:
+        db.add(OperationLease(operation=operation, file_hash=file_hash, owner=owner, expires_at=expires_at))
+        db.commit()
+        return True
+    except IntegrityError:
+        db.rollback()
+    result = db.exec(
+        update(OperationLease)
+        .where(OperationLease.operation == operation)
+        .where(OperationLease.file_hash == file_hash)
+        .where(OperationLease.expires_at < now)
+        .values(owner=owner, expires_at=expires_at)
+    )
+    db.commit()
+    return result.rowcount == 1
+
+
+def renew_lease(db: Session, operation: str, file_hash: str, owner: str, ttl_seconds: int) -> bool:
+    """Push the expiry of a lease we hold. Returns False if it was lost. Commits."""
+    result = db.exec(
+        update(OperationLease)
+        .where(OperationLease.operation == operation)
+        .where(OperationLease.file_hash == file_hash)
+        .where(OperationLease.owner == owner)
+        .values(expires_at=_utcnow() + timedelta(seconds=ttl_seconds))
+    )
+    db.commit()
+    return result.rowcount == 1
+
+
+def release_lease(db: Session, operation: str, file_hash: str, owner: str) -> None:
+    """Drop a lease we hold (no-op if it was taken over). Commits."""
+    db.exec(
+        delete(OperationLease)
+        .where(OperationLease.operation == operation)
+        .where(OperationLease.file_hash == file_hash)
+        .where(OperationLease.owner == owner)
+    )
+    db.commit()
+
+
+def lease_held(db: Session, operation: str, file_hash: str) -> bool:
+    """Whether an unexpired lease exists for (operation, file_hash)."""
+    lease = db.get(OperationLease, (operation, file_hash))
+    if lease is None:
+        return False
+    db.expunge(lease)
+    expires_at = lease.expires_at if lease.expires_at.tzinfo else lease.expires_at.replace(tzinfo=timezone.utc)
+    return expires_at >= _utcnow()
@@ -3,9 +3,12 @@ from datetime import datetime
 from typing import Optional
 from uuid import UUID, uuid4
 from pydantic import EmailStr # Ensure this is imported
-from sqlalchemy import Boolean, Column, String # <--- Import String for explicit column type
+from sqlalchemy import Boolean, Column, Index, String # <--- Import String for explicit column type
 
 class User(SQLModel, table=True):
+    # Keyset pagination of the admin user listing
+    __table_args__ = (Index("ix_user_created_at_id", "created_at", "id"),)
+
     id: UUID = Field(default_factory=uuid4, primary_key=True, index=True)
     # Corrected: unique=True and index=True moved into Column, removed from Field
     email: EmailStr = Field(sa_column=Column(String, unique=True, index=True))
@@ -1,20 +1,35 @@
 # app/routes/admin.py
-from fastapi import APIRouter, Depends, HTTPException, status
+import asyncio
+import json
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import and_, or_
 from sqlalchemy.orm import Session
-from app.database import get_db
+from app.database import get_db, engine
 from app.models.user import User
 from app.models.user import User, UserCreate, UserResponse
+from app.models.chat_session import ChatSession, delete_document_sessions
 from app.routes.auth import get_current_user
-from typing import List
+from typing import Any, Callable, Iterator, List, Optional
 from app.models.document import Document  # Add this import
+from app.models.content import Content
+from app.models.document_tombstone import record_deletions
+from app.models.llm_usage import usage_report, usage_totals
 from uuid import UUID
-import shutil
 import os
+from datetime import datetime, timedelta, timezone
 from app.config import UPLOAD_DIR  # Add this import at the top
+from app.utils.chat import unpin_store
+from app.utils.file_cleanup import chunked, unlink_files, remove_directories
+from app.utils.pagination import encode_cursor, decode_cursor
+from app.utils.vector_store_gc import run_gc, get_last_report
 
 # Remove the prefix here since it's already defined in main.py
 router = APIRouter(tags=["Admin"])
 
+ADMIN_PAGE_SIZE = 1000
+ADMIN_MAX_PAGE_SIZE = 10000
+
 def verify_admin(current_user: User = Depends(get_current_user)):
     if not current_user.is_admin:
         raise HTTPException(
@@ -23,68 +38,154 @@ def verify_admin(current_user: User = Depends(get_current_user)):
         )
     return current_user
 
-@router.get("/users", response_model=List[UserResponse])
+
+def _parse_cursor(cursor: Optional[str]):
+    try:
+        return decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _stream_page(
+    key: str,
+    query_factory: Callable[[Any], Any],
+    limit: int,
+    serialize: Callable[[Any], dict],
+    cursor_of: Callable[[Any], str],
+) -> StreamingResponse:
+    """
+    Stream one keyset page as `{"<key>": [...], "next_cursor": ...}`.
+
+    Rows are fetched with yield_per and written out one by one, so even a
+    10k-row page never builds the full list in memory. The generator runs
+    after the request dependencies have been torn down, so it owns its session.
+    """
+    def generate() -> Iterator[str]:
+        with Session(engine) as session:
+            rows = query_factory(session).limit(limit + 1).yield_per(500)
+            yield f'{{"{key}": ['
+            last_row = None
+            emitted = 0
+            has_more = False
+            for row in rows:
+                if emitted == limit:
+                    has_more = True
+                    break
+                yield ("," if emitted else "") + json.dumps(serialize(row), default=str)
+                last_row = row
+                emitted += 1
+            next_cursor = cursor_of(last_row) if has_more and last_row is not None else None
+            yield f'], "next_cursor": {json.dumps(next_cursor)}}}'
+
+    return StreamingResponse(generate(), media_type="application/json")
+
+
+@router.get("/users")
 async def get_all_users(
-    current_user: User = Depends(verify_admin),
-    db: Session = Depends(get_db)
+    limit: int = Query(ADMIN_PAGE_SIZE, ge=1, le=ADMIN_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(verify_admin)
 ):
-    users = db.query(User).all()
-    return [
-        {
+    """List users (admin only), oldest first, keyset-paginated on (created_at, id) and streamed."""
+    position = _parse_cursor(cursor)
+
+    def query_factory(session):
+        query = session.query(User)
+        if position:
+            last_created, last_id = position
+            query = query.filter(or_(
+                User.created_at > last_created,
+                and_(User.created_at == last_created, User.id > last_id),
+            ))
+        return query.order_by(User.created_at, User.id)
+
+    return _stream_page(
+        "users",
+        query_factory,
+        limit,
+        lambda user: {
             "id": str(user.id),
             "username": user.username,
             "email": user.email,
-            "created_at": user.created_at,
+            "created_at": user.created_at.isoformat() if user.created_at else None,
             "is_active": bool(user.is_active),  # Include is_active
             "is_admin": bool(user.is_admin)     # Include is_admin
-        }
-        for user in users
-    ]
+        },
+        lambda user: encode_cursor(user.created_at, user.id),
+    )
 
-@router.get("/documents", response_model=List[dict])
+@router.get("/documents")
 async def get_all_documents(
-    current_user: User = Depends(verify_admin),
-    db: Session = Depends(get_db)
+    limit: int = Query(ADMIN_PAGE_SIZE, ge=1, le=ADMIN_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    user_id: Optional[UUID] = None,
+    current_user: User = Depends(verify_admin)
 ):
-    """Get all documents (admin only)"""
-    documents = db.query(Document).all()
-    return [
-        {
-            "id": str(doc.id),
-            "filename": doc.filename,
-            "file_type": doc.file_type,
-            "upload_time": doc.upload_time.isoformat(),
-            "summary": doc.summary,
-            "is_vectorized": doc.is_vectorized,
-            "user_id": str(doc.user_id),
-            "path": doc.path
-        }
-        for doc in documents
-    ]
+    """
+    List documents (admin only), newest first, keyset-paginated on
+    (upload_time, id) and streamed. Summary text is never loaded; only its
+    presence is reported.
+    """
+    position = _parse_cursor(cursor)
+
+    def query_factory(session):
+        query = (
+            session.query(Document, Content.is_vectorized, Content.summary.isnot(None).label("has_summary"))
+            .outerjoin(Content, Content.file_hash == Document.file_hash)
+        )
+        if user_id:
+            query = query.filter(Document.user_id == user_id)
+        if position:
+            last_time, last_id = position
+            query = query.filter(or_(
+                Document.upload_time < last_time,
+                and_(Document.upload_time == last_time, Document.id < last_id),
+            ))
+        return query.order_by(Document.upload_time.desc(), Document.id.desc())
+
+    return _stream_page(
+        "documents",
+        query_factory,
+        limit,
+        lambda row: {
+            "id": str(row[0].id),
+            "filename": row[0].filename,
+            "file_type": row[0].file_type,
+            "upload_time": row[0].upload_time.isoformat(),
+            "has_summary": bool(row[2]),
+            "is_vectorized": bool(row[1]),
+            "user_id": str(row[0].user_id),
+            "path": row[0].path
+        },
+        lambda row: encode_cursor(row[0].upload_time, row[0].id),
+    )
 
 @router.delete("/documents/{document_id}")
 async def delete_document(
     document_id: UUID,
+    background_tasks: BackgroundTasks,
     current_user: User = Depends(verify_admin),
     db: Session = Depends(get_db)
 ):
     """Delete a document (admin only)"""
-    document = db.query(Document).filter(Document.id == document_id).first()
-    if not document:
+    row = db.query(Document.path, Document.file_hash, Document.user_id).filter(Document.id == document_id).first()
+    if not row:
         raise HTTPException(status_code=404, detail="Document not found")
-    
-    # Delete file from filesystem
-    if os.path.exists(document.path):
-        os.remove(document.path)
-    
-    # Delete from database
-    db.delete(document)
+
+    # Delete from database, then unlink the file and sweep the vector store if it became unreferenced
+    db.query(Document).filter(Document.id == document_id).delete(synchronize_session=False)
+    delete_document_sessions(db, [document_id])
+    record_deletions(db, [(document_id, row.user_id)])
     db.commit()
+    unpin_store(row.file_hash)
+    background_tasks.add_task(unlink_files, [row.path])
+    background_tasks.add_task(run_gc, file_hashes=[row.file_hash])
     return {"message": "Document deleted successfully"}
 
 @router.delete("/users/{user_id}")
 async def delete_user(
     user_id: UUID,
+    background_tasks: BackgroundTasks,
     current_user: User = Depends(verify_admin),
     db: Session = Depends(get_db)
 ):
@@ -96,19 +197,15 @@ async def delete_user(
         raise HTTPException(status_code=400, detail="Cannot delete admin user")
 
     try:
-        # Delete user's entire upload folder
-        user_upload_dir = os.path.join(UPLOAD_DIR, str(user.id))
-        if os.path.exists(user_upload_dir):
-            shutil.rmtree(user_upload_dir)
+        file_hashes = [h for (h,) in db.query(Document.file_hash).filter(Document.user_id == user.id).distinct()]
 
         # Delete all documents from database
-        db.query(Document).filter(Document.user_id == user.id).delete()
+        db.query(Document).filter(Document.user_id == user.id).delete(synchronize_session=False)
+        db.query(ChatSession).filter(ChatSession.user_id == user.id).delete(synchronize_session=False)
         
         # Delete user
         db.delete(user)
         db.commit()
-        
-        return {"message": "User and all associated data deleted successfully"}
     except Exception as e:
         db.rollback()
         raise HTTPException(
@@ -116,72 +213,142 @@ async def delete_user(
             detail=f"Error deleting user: {str(e)}"
         )
 
+    for file_hash in file_hashes:
+        unpin_store(file_hash)
+    # Delete user's entire upload folder in the background
+    background_tasks.add_task(remove_directories, [os.path.join(UPLOAD_DIR, str(user_id))])
+    background_tasks.add_task(run_gc, file_hashes=file_hashes)
+    return {"message": "User and all associated data deleted successfully"}
+
 @router.post("/bulk-delete/users")
 async def bulk_delete_users(
     user_ids: List[UUID],
+    background_tasks: BackgroundTasks,
     current_user: User = Depends(verify_admin),
     db: Session = Depends(get_db)
 ):
-    """Delete multiple users in bulk (admin only)"""
-    deleted_count = 0
-    failed_users = []
-
-    for user_id in user_ids:
-        try:
-            user = db.query(User).filter(User.id == user_id).first()
-            if not user:
-                failed_users.append(str(user_id))
-                continue
-                
-            # Don't delete admin users
-            if user.is_admin:
-                failed_users.append(str(user_id))
-                continue
-
-            # Delete user's documents
-            docs = db.query(Document).filter(Document.user_id == user_id).all()
-            for doc in docs:
-                if os.path.exists(doc.path):
-                    os.remove(doc.path)
-                db.delete(doc)
-
-            # Delete user
-            db.delete(user)
-            deleted_count += 1
-
-        except Exception as e:
-            failed_users.append(str(user_id))
+    """
+    Delete multiple users in bulk (admin only).
 
-    db.commit()
-    return {"success_count": deleted_count, "failed_users": failed_users}
+    Works on the whole set at once: one SELECT to resolve which users exist
+    and are not admins, one to collect every affected file path, then
+    DELETE ... WHERE id IN for documents and users. Files are unlinked in a
+    background batch after the response.
+    """
+    requested = list(dict.fromkeys(user_ids))
+    deletable: List[UUID] = []
+    for batch in chunked(requested):
+        deletable.extend(
+            uid for (uid,) in db.query(User.id).filter(User.id.in_(batch), User.is_admin == False)
+        )
+    deletable_set = set(deletable)
+    failed_users = [str(uid) for uid in requested if uid not in deletable_set]  # Missing or admin users
+
+    paths: List[str] = []
+    file_hashes = set()
+    try:
+        for batch in chunked(deletable):
+            for path, file_hash in db.query(Document.path, Document.file_hash).filter(Document.user_id.in_(batch)):
+                paths.append(path)
+                file_hashes.add(file_hash)
+            db.query(Document).filter(Document.user_id.in_(batch)).delete(synchronize_session=False)
+            db.query(ChatSession).filter(ChatSession.user_id.in_(batch)).delete(synchronize_session=False)
+            db.query(User).filter(User.id.in_(batch)).delete(synchronize_session=False)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error deleting users: {str(e)}")
+
+    for file_hash in file_hashes:
+        unpin_store(file_hash)
+
+    background_tasks.add_task(unlink_files, paths)
+    background_tasks.add_task(remove_directories, [os.path.join(UPLOAD_DIR, str(uid)) for uid in deletable])
+    background_tasks.add_task(run_gc, file_hashes=file_hashes)
+    return {"success_count": len(deletable), "failed_users": failed_users}
 
 @router.post("/bulk-delete/documents")
 async def bulk_delete_documents(
     document_ids: List[UUID],
+    background_tasks: BackgroundTasks,
     current_user: User = Depends(verify_admin),
     db: Session = Depends(get_db)
 ):
-    """Delete multiple documents in bulk (admin only)"""
-    deleted_count = 0
-    failed_documents = []
+    """
+    Delete multiple documents in bulk (admin only), using one SELECT for the
+    affected paths and DELETE ... WHERE id IN. Files are unlinked in a
+    background batch after the response.
+    """
+    requested = list(dict.fromkeys(document_ids))
+    found = {}
+    try:
+        for batch in chunked(requested):
+            rows = db.query(Document.id, Document.path, Document.file_hash, Document.user_id).filter(Document.id.in_(batch)).all()
+            found.update((doc_id, (path, file_hash)) for doc_id, path, file_hash, _ in rows)
+            db.query(Document).filter(Document.id.in_(batch)).delete(synchronize_session=False)
+            delete_document_sessions(db, batch)
+            record_deletions(db, [(doc_id, user_id) for doc_id, _, _, user_id in rows])
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error deleting documents: {str(e)}")
 
-    for doc_id in document_ids:
-        try:
-            document = db.query(Document).filter(Document.id == doc_id).first()
-            if not document:
-                failed_documents.append(str(doc_id))
-                continue
+    for file_hash in {file_hash for _, file_hash in found.values()}:
+        unpin_store(file_hash)
+    failed_documents = [str(doc_id) for doc_id in requested if doc_id not in found]
+    background_tasks.add_task(unlink_files, [path for path, _ in found.values()])
+    background_tasks.add_task(run_gc, file_hashes={file_hash for _, file_hash in found.values()})
+    return {"success_count": len(found), "failed_documents": failed_documents}
 
-            # Delete file from filesystem
-            if os.path.exists(document.path):
-                os.remove(document.path)
+@router.get("/gc/preview")
+async def preview_garbage_collection(
+    grace_period: Optional[int] = Query(None, ge=0, description="Override GC_GRACE_PERIOD_SECONDS"),
+    current_user: User = Depends(verify_admin)
+):
+    """Show which unreferenced vector stores/artifacts a GC run would delete (admin only)"""
+    kwargs = {"dry_run": True}
+    if grace_period is not None:
+        kwargs["grace_period"] = grace_period
+    return await asyncio.to_thread(run_gc, **kwargs)
 
-            # Delete from database
-            db.delete(document)
-            deleted_count += 1
+@router.post("/gc")
+async def trigger_garbage_collection(
+    background_tasks: BackgroundTasks,
+    grace_period: Optional[int] = Query(None, ge=0, description="Override GC_GRACE_PERIOD_SECONDS"),
+    current_user: User = Depends(verify_admin)
+):
+    """Start a GC sweep in the background (admin only); poll /admin/gc/status for the report"""
+    kwargs = {}
+    if grace_period is not None:
+        kwargs["grace_period"] = grace_period
+    background_tasks.add_task(run_gc, **kwargs)
+    return {"message": "Garbage collection started"}
 
-        except Exception as e:
-            failed_documents.append(str(doc_id))
+@router.get("/gc/status")
+async def garbage_collection_status(current_user: User = Depends(verify_admin)):
+    """Report of the last completed GC sweep, including bytes reclaimed (admin only)"""
+    report = get_last_report()
+    if report is None:
+        return {"status": "never_run"}
+    return report
 
-    db.commit()
-    return {"success_count": deleted_count, "failed_documents": failed_documents}
+@router.get("/usage")
+def llm_usage(
+    days: int = Query(30, ge=1, le=366),
+    user_id: Optional[UUID] = None,
+    limit: int = Query(50, ge=1, le=1000, description="Number of users in by_user"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(verify_admin)
+):
+    """LLM calls and tokens over the last `days` days, overall or for one user, with the heaviest users (admin only)"""
+    since = (datetime.now(timezone.utc) - timedelta(days=days - 1)).date()
+    report = usage_report(db, since, user_id)
+
+    by_user = usage_totals(db, since, ["user_id"], user_id)[:limit]
+    emails = dict(
+        db.query(User.id, User.email).filter(User.id.in_([UUID(row["user_id"]) for row in by_user])).all()
+    ) if by_user else {}
+    for row in by_user:
+        row["email"] = emails.get(UUID(row["user_id"]))
+    report["by_user"] = by_user
+    return report
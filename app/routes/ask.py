@@ -1,42 +1,67 @@
 from fastapi import APIRouter, HTTPException, Depends
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
+from typing import List, Optional
+from uuid import UUID
 import os
+import asyncio
 import logging
 
 from app.database import get_db
 from app.routes.auth import get_current_user
 from app.models.user import User # Ensure User model is imported
 from app.models.document import Document
-from app.config import VECTOR_STORE_DIR
+from app.models.content import Content
+from app.config import VECTOR_STORE_DIR, TOP_K_CHUNKS, MAX_BATCH_DOCUMENTS, QUERY_REWRITE
+from app.utils.llm_usage import llm_usage_scope
+from app.utils.answer_cache import lookup_answer, cache_answer
 
 from app.utils.qa_utils import (
     load_vector_store,
     get_llm, # This function now expects 'api_key'
     run_qa_chain,
     rewrite_queries,
-    retrieve_top_k_chunks
+    retrieve_packed_context,
+    retrieve_top_k_across
 )
+from app.utils.context_packer import pack_context
+from app.utils.metrics import span
 
 class QAModel(BaseModel):
     filename: str
     question: str
 
+class MultiQAModel(BaseModel):
+    question: str
+    document_ids: Optional[List[UUID]] = None  # Default: all of the user's vectorized documents
+    top_k: int = TOP_K_CHUNKS
+
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+def _expand_question(llm, question: str) -> list[str]:
+    """Retrieval queries for a question: LLM rephrasings, or just the question when QUERY_REWRITE is off."""
+    if not QUERY_REWRITE:
+        return [question]
+    return rewrite_queries(llm, question, num_rephrasals=4)
+
 @router.get("/ask/test")
 async def test_ask_endpoint():
     return {"status": "Ask endpoint is working"}
 
 @router.post("/ask")
-async def qa_query(payload: QAModel, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def qa_query(payload: QAModel, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     """
     Handles a Q&A query against a vectorized document for the current user,
-    using their provided Gemini API key.
+    using their provided Gemini API key. Repeated and near-duplicate
+    questions about the same content are answered from the answer cache
+    (cached: true) without any LLM call.
+
+    A plain def: FastAPI runs it in its threadpool, so the store load, the
+    LLM calls and the database work never block the worker's event loop.
     """
     logger.info(f"Received ask request with payload: {payload}")
     logger.info(f"Current user ID: {current_user.id}")
@@ -50,7 +75,7 @@ async def qa_query(payload: QAModel, db: Session = Depends(get_db), current_user
         raise HTTPException(status_code=404, detail="Document not found in database")
 
     # The existing check for is_vectorized and file_hash is good.
-    if not document.is_vectorized or not document.file_hash:
+    if not document.file_hash or not document.content or not document.content.is_vectorized:
         raise HTTPException(status_code=400, detail="Document is not properly vectorized. Please re-vectorize.")
 
     vector_store_path = os.path.join(VECTOR_STORE_DIR, document.file_hash)
@@ -66,6 +91,11 @@ async def qa_query(payload: QAModel, db: Session = Depends(get_db), current_user
             detail="Gemini API key not found for user. Please ensure it is provided during signup."
         )
 
+    # Same or nearly the same question asked about this content before (by anyone)
+    cached = lookup_answer(db, document.file_hash, payload.question)
+    if cached is not None:
+        return cached
+
     try:
         # Load TF-IDF vector store
         vector_store = load_vector_store(vector_store_path)
@@ -73,21 +103,143 @@ async def qa_query(payload: QAModel, db: Session = Depends(get_db), current_user
         # FIX: Pass the user's API key to get_llm
         llm = get_llm(api_key=user_gemini_api_key)
 
-        # Expand the question semantically
-        rewritten_queries = rewrite_queries(llm, payload.question, num_rephrasals=4)
-        combined_query = " OR ".join(rewritten_queries)
+        with llm_usage_scope(current_user.id):
+            # Expand the question semantically
+            rewritten_queries = _expand_question(llm, payload.question)
+            combined_query = " OR ".join(rewritten_queries)
 
-        # Retrieve top-k matching chunks
-        top_chunks = retrieve_top_k_chunks(vector_store, combined_query)
+            # Retrieve top-k matching chunks, packed into the token budget
+            top_chunks, packing = retrieve_packed_context(vector_store, combined_query)
 
-        # Generate answer using Gemini
-        answer, sources = run_qa_chain(llm, payload.question, top_chunks)
+            # Generate answer using Gemini
+            answer, sources = run_qa_chain(llm, payload.question, top_chunks)
 
+        response = {
+            "original_question": payload.question,
+            "rewritten_questions": rewritten_queries,
+            "answer": answer,
+            "sources": sources,
+            "context": packing,
+            "cached": False,
+            "cache_match": None,
+            "cached_question": None,
+            "similarity": None
+        }
+        cache_answer(db, document.file_hash, payload.question, response)
+        return response
+
+    except FileNotFoundError as fnf:
+        raise HTTPException(status_code=404, detail=str(fnf))
+    except RuntimeError as e:
+        logger.error(f"Q&A failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Q&A failed: {str(e)}")
+    except Exception as e:
+        logger.error(f"An unexpected error occurred during Q&A: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
+
+
+@router.post("/ask/multi")
+async def qa_query_multi(payload: MultiQAModel, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    """
+    Answer one question over several of the user's documents. Their vector
+    stores are loaded concurrently, chunks from all of them are ranked into
+    one global top-k, and a single LLM call answers from that merged
+    context, with every source attributed to its document.
+    """
+    if payload.document_ids is not None and len(payload.document_ids) > MAX_BATCH_DOCUMENTS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_DOCUMENTS} documents per question")
+    if not 1 <= payload.top_k <= 100:
+        raise HTTPException(status_code=400, detail="top_k must be between 1 and 100")
+
+    query = (
+        db.query(Document.id, Document.filename, Document.file_hash, Content.is_vectorized)
+        .outerjoin(Content, Content.file_hash == Document.file_hash)
+        .filter(Document.user_id == current_user.id)
+    )
+    if payload.document_ids is not None:
+        query = query.filter(Document.id.in_(payload.document_ids))
+    rows = query.all()
+
+    found = {row.id for row in rows}
+    skipped = [
+        {"document_id": str(document_id), "reason": "not_found"}
+        for document_id in (payload.document_ids or []) if document_id not in found
+    ]
+    # One store per content; a user never has two documents with the same hash
+    documents_by_hash = {}
+    for row in rows:
+        if not row.file_hash or not row.is_vectorized:
+            if payload.document_ids is not None:
+                skipped.append({"document_id": str(row.id), "reason": "not_vectorized"})
+            continue
+        documents_by_hash.setdefault(row.file_hash, row)
+    if not documents_by_hash:
+        raise HTTPException(status_code=400, detail="None of the selected documents are vectorized.")
+
+    user_gemini_api_key = current_user.gemini_api_key
+    if not user_gemini_api_key or user_gemini_api_key.strip() == "":
+        logger.error("Gemini API key is missing or empty for the current user during Q&A.")
+        raise HTTPException(
+            status_code=400, 
+            detail="Gemini API key not found for user. Please ensure it is provided during signup."
+        )
+
+    try:
+        llm = get_llm(api_key=user_gemini_api_key)
+
+        # Load every store concurrently, overlapped with the query rewrite
+        file_hashes = list(documents_by_hash)
+        loads = [asyncio.to_thread(load_vector_store, os.path.join(VECTOR_STORE_DIR, h)) for h in file_hashes]
+        with llm_usage_scope(current_user.id):
+            rewritten_queries, *stores = await asyncio.gather(
+                asyncio.to_thread(_expand_question, llm, payload.question),
+                *loads,
+                return_exceptions=True
+            )
+        if isinstance(rewritten_queries, BaseException):
+            rewritten_queries = [payload.question]
+        vector_stores = {}
+        for file_hash, store in zip(file_hashes, stores):
+            if isinstance(store, BaseException):
+                skipped.append({"document_id": str(documents_by_hash[file_hash].id), "reason": "vector_store_missing"})
+            else:
+                vector_stores[file_hash] = store
+        if not vector_stores:
+            raise FileNotFoundError("Vector store files not found or corrupted.")
+
+        combined_query = " OR ".join(rewritten_queries)
+        hits = retrieve_top_k_across(vector_stores, combined_query, payload.top_k)
+        with span("pack_context"):
+            passages, packing = pack_context(
+                hits, combined_query, {file_hash: store.get("offsets") for file_hash, store in vector_stores.items()}
+            )
+
+        # Label each passage with its document so the answer can say where it came from
+        context_chunks = [
+            f"[Document: {documents_by_hash[passage['key']].filename}]\n{passage['text']}"
+            for passage in passages
+        ]
+        with llm_usage_scope(current_user.id):
+            answer, _ = await asyncio.to_thread(run_qa_chain, llm, payload.question, context_chunks)
+
+        sources = [
+            {
+                "chunk_id": index,
+                "document_id": str(documents_by_hash[file_hash].id),
+                "filename": documents_by_hash[file_hash].filename,
+                "score": round(score, 4),
+                "page_content": chunk[:200] + "..."
+            }
+            for score, file_hash, index, chunk in hits
+        ]
         return {
             "original_question": payload.question,
             "rewritten_questions": rewritten_queries,
             "answer": answer,
-            "sources": sources
+            "sources": sources,
+            "context": packing,
+            "documents_searched": len(vector_stores),
+            "skipped": skipped
         }
 
     except FileNotFoundError as fnf:
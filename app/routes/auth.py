@@ -11,6 +11,8 @@ from app.auth.auth_utils import (
     ACCESS_TOKEN_EXPIRE_MINUTES
 )
 from app.database import get_db
+from app.utils.llm_providers import validates_api_keys
+from app.config import VERIFY_EMAIL_DOMAIN
 from uuid import UUID
 from typing import Optional
 import google.generativeai as genai
@@ -28,6 +30,8 @@ def is_valid_email_domain(email: str) -> bool:
     Checks if the domain of an email address has MX records.
     This helps verify if the domain is configured to receive emails.
     """
+    if not VERIFY_EMAIL_DOMAIN:
+        return True
     try:
         domain = email.split('@')[1]
         # Attempt to resolve MX records for the domain
@@ -54,6 +58,11 @@ async def validate_gemini_api_key(api_key: str, timeout: int = 10) -> bool:
     if not api_key or api_key.strip() == "":
         print("Validation failed: API key is empty or whitespace.")
         return False
+
+    # The offline stub provider never talks to Google, so any non-empty key will do
+    if not validates_api_keys():
+        print("--- LLM provider does not validate keys; skipping Gemini check.")
+        return True
     
     original_google_api_key_env = os.environ.get("GOOGLE_API_KEY")
     if original_google_api_key_env:
@@ -0,0 +1,143 @@
+from fastapi import APIRouter, HTTPException, Depends
+from sqlalchemy.orm import Session
+from pydantic import BaseModel
+from typing import Optional
+from uuid import UUID
+from datetime import datetime, timedelta, timezone
+import asyncio
+import json
+import logging
+
+from app.database import get_db
+from app.routes.auth import get_current_user
+from app.models.user import User
+from app.models.document import Document
+from app.models.chat_session import ChatSession
+from app.config import CHAT_SESSION_TTL_SECONDS
+from app.utils.llm_usage import llm_usage_scope
+from app.utils.chat import chat_turn, pinned_store
+from app.utils.qa_utils import get_llm
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+class ChatSessionCreate(BaseModel):
+    filename: Optional[str] = None
+    document_id: Optional[UUID] = None
+
+
+class ChatMessage(BaseModel):
+    question: str
+
+
+def _session_response(session: ChatSession) -> dict:
+    return {
+        "session_id": str(session.id),
+        "document_id": str(session.document_id),
+        "turns": json.loads(session.turns),
+        "history_summary": session.history_summary,
+        "summarized_turns": session.summarized_turns,
+        "context_chunks": len(json.loads(session.chunk_window)),
+        "expires_in_seconds": CHAT_SESSION_TTL_SECONDS,
+    }
+
+
+def _get_session(db: Session, session_id: UUID, user: User) -> ChatSession:
+    """The user's session, 404 when it does not exist or was idle past CHAT_SESSION_TTL_SECONDS."""
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=CHAT_SESSION_TTL_SECONDS)
+    session = db.query(ChatSession).filter(
+        ChatSession.id == session_id,
+        ChatSession.user_id == user.id,
+        ChatSession.updated_at >= cutoff
+    ).first()
+    if not session:
+        raise HTTPException(status_code=404, detail="Chat session not found or expired")
+    return session
+
+
+@router.post("/chat/sessions")
+async def create_chat_session(payload: ChatSessionCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    """
+    Start a conversation about one vectorized document (by filename or
+    document_id). Follow-up questions go to /chat/sessions/{session_id}/messages.
+    """
+    query = db.query(Document).filter(Document.user_id == current_user.id)
+    if payload.document_id is not None:
+        query = query.filter(Document.id == payload.document_id)
+    elif payload.filename:
+        query = query.filter(Document.filename == payload.filename)
+    else:
+        raise HTTPException(status_code=400, detail="filename or document_id is required")
+    document = query.first()
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found in database")
+    if not document.file_hash or not document.content or not document.content.is_vectorized:
+        raise HTTPException(status_code=400, detail="Document is not properly vectorized. Please re-vectorize.")
+
+    session = ChatSession(user_id=current_user.id, document_id=document.id, file_hash=document.file_hash)
+    db.add(session)
+    db.commit()
+    db.refresh(session)
+    return _session_response(session)
+
+
+@router.get("/chat/sessions/{session_id}")
+async def get_chat_session(session_id: UUID, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    return _session_response(_get_session(db, session_id, current_user))
+
+
+@router.delete("/chat/sessions/{session_id}")
+async def delete_chat_session(session_id: UUID, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    db.delete(_get_session(db, session_id, current_user))
+    db.commit()
+    return {"message": "Chat session deleted", "session_id": str(session_id)}
+
+
+@router.post("/chat/sessions/{session_id}/messages")
+async def send_chat_message(session_id: UUID, payload: ChatMessage, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    """
+    Answer a question in the context of the session: the vector store stays
+    pinned in the worker, only chunks not already in the session's window
+    are added to the context, and older turns are summarized.
+    """
+    session = _get_session(db, session_id, current_user)
+
+    user_gemini_api_key = current_user.gemini_api_key
+    if not user_gemini_api_key or user_gemini_api_key.strip() == "":
+        logger.error("Gemini API key is missing or empty for the current user during chat.")
+        raise HTTPException(
+            status_code=400,
+            detail="Gemini API key not found for user. Please ensure it is provided during signup."
+        )
+
+    state = {
+        "turns": json.loads(session.turns),
+        "history_summary": session.history_summary or "",
+        "summarized_turns": session.summarized_turns,
+        "chunk_window": json.loads(session.chunk_window),
+    }
+    try:
+        store = await asyncio.to_thread(pinned_store, session.file_hash)
+        llm = get_llm(api_key=user_gemini_api_key)
+        with llm_usage_scope(current_user.id):
+            result = await asyncio.to_thread(chat_turn, llm, store, state, payload.question)
+    except FileNotFoundError as fnf:
+        raise HTTPException(status_code=404, detail=str(fnf))
+    except RuntimeError as e:
+        logger.error(f"Chat failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Chat failed: {str(e)}")
+    except Exception as e:
+        logger.error(f"An unexpected error occurred during chat: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
+
+    # Concurrent messages to one session: the last one to finish keeps its state
+    session.turns = json.dumps(state["turns"])
+    session.history_summary = state["history_summary"] or None
+    session.summarized_turns = state["summarized_turns"]
+    session.chunk_window = json.dumps(state["chunk_window"])
+    session.updated_at = datetime.now(timezone.utc)
+    db.add(session)
+    db.commit()
+    return {"session_id": str(session.id), "turn": state["summarized_turns"] + len(state["turns"]), **result}
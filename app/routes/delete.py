@@ -1,16 +1,21 @@
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Depends, status
 from app.database import get_db
+from app.models.chat_session import delete_document_sessions
 from app.models.document import Document
+from app.models.document_tombstone import record_deletions
 import os
 import logging
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
+from uuid import UUID
 import shutil
 from app.routes.auth import get_current_user
 from app.models.user import User
+from app.config import UPLOAD_DIR
+from app.utils.chat import unpin_store
+from app.utils.vector_store_gc import run_gc
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
-UPLOAD_DIR = "uploaded_files"  # Same upload directory as in other routes
 router = APIRouter()
 
 class DeleteRequest(BaseModel):
@@ -19,12 +24,17 @@ class DeleteRequest(BaseModel):
 @router.delete("/documents/{filename}")
 def delete_document(
     filename: str, 
-    document_id: str = None,
+    background_tasks: BackgroundTasks,
+    document_id: UUID = None,
+    current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Delete a document from the database and file system"""
+    """Delete one of the current user's documents from the database and file system"""
     # Find the document in the database
-    document = db.query(Document).filter(Document.filename == filename).first()
+    query = db.query(Document).filter(Document.filename == filename, Document.user_id == current_user.id)
+    if document_id:
+        query = query.filter(Document.id == document_id)
+    document = query.first()
     if not document:
         raise HTTPException(
             status_code=404,
@@ -43,9 +53,16 @@ def delete_document(
                 shutil.rmtree(user_folder)
 
         # Delete from database
+        file_hash = document.file_hash
         db.delete(document)
+        delete_document_sessions(db, [document.id])
+        record_deletions(db, [(document.id, document.user_id)])  # Lets cached clients drop it via /documents/changes
         db.commit()
-        
+        # Other workers' pinned copies are released after CHAT_SESSION_TTL_SECONDS unused
+        unpin_store(file_hash)
+
+        # The vector store is shared by content hash; GC removes it only if nothing else references it
+        background_tasks.add_task(run_gc, file_hashes=[file_hash])
         return {"message": "Document deleted successfully"}
     except Exception as e:
         db.rollback()
@@ -55,20 +72,27 @@ def delete_document(
         )
 
 @router.post("/delete-document")
-def delete_document_body(request: DeleteRequest, db: Session = Depends(get_db)):
+def delete_document_body(
+    request: DeleteRequest,
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
     """Alternative endpoint that accepts a request body with filename"""
-    return delete_document(request.filename, db)
+    return delete_document(request.filename, background_tasks, current_user=current_user, db=db)
 
 
 
 @router.delete("/delete/my-account")
 async def delete_my_account(
+    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """
     Allows an authenticated user to delete their own account.
-    This will also delete all documents and associated vector stores for that user.
+    This will also delete all documents for that user; vector stores no other
+    user references are removed by the GC in the background.
     """
     user_id = current_user.id
     logger.info(f"User {user_id} attempting to delete their account.")
@@ -76,22 +100,18 @@ async def delete_my_account(
     try:
         # 1. Delete documents and their associated files/vector stores
         documents = db.query(Document).filter(Document.user_id == user_id).all()
+        file_hashes = {doc.file_hash for doc in documents}
         for doc in documents:
             # Delete file from file system
             if os.path.exists(doc.path):
                 os.remove(doc.path)
                 logger.info(f"Deleted document file: {doc.path}")
-            
-            # Delete associated vector store directory
-            if doc.file_hash: # Assuming file_hash is used for vector store naming
-                vector_store_path = os.path.join(VECTOR_STORE_DIR, doc.file_hash)
-                if os.path.exists(vector_store_path):
-                    shutil.rmtree(vector_store_path)
-                    logger.info(f"Deleted vector store directory: {vector_store_path}")
+
 
             # Delete document from database
             db.delete(doc)
             logger.info(f"Deleted document record from DB: {doc.filename} (ID: {doc.id})")
+        delete_document_sessions(db, [doc.id for doc in documents])
         
         # 2. Delete the user's main upload folder if it becomes empty
         user_upload_dir = os.path.join(UPLOAD_DIR, str(user_id))
@@ -103,6 +123,12 @@ async def delete_my_account(
         db.delete(current_user)
         db.commit()
         logger.info(f"Account for user ID {user_id} successfully deleted.")
+        for file_hash in file_hashes:
+            unpin_store(file_hash)
+
+        # Vector stores are shared across users by content hash, so they are
+        # only swept once no remaining document references them.
+        background_tasks.add_task(run_gc, file_hashes=file_hashes)
 
         return {"message": "Account and all associated data deleted successfully"}
 
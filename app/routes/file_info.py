@@ -1,25 +1,200 @@
-from fastapi import APIRouter, Depends, HTTPException
+import hashlib
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Set
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlmodel import Session, select
+from sqlalchemy import and_, func, null, or_
+from sqlalchemy.orm import load_only
 from app.models.document import Document
+from app.models.content import Content
+from app.models.document_tombstone import DocumentTombstone
 from app.database import get_db as get_session
 from uuid import UUID
 from app.routes.auth import get_current_user
 from app.models.user import User
+from app.utils.pagination import encode_cursor, decode_cursor, parse_fields
+from app.config import TOMBSTONE_RETENTION_SECONDS
 
 router = APIRouter()
 
+# Fields a client may request with ?fields=. `summary` is opt-in: it can be
+# very large, and listings only need `has_summary`.
+DOCUMENT_COLUMN_FIELDS = {"filename", "file_type", "upload_time", "updated_at", "path", "user_id", "file_hash", "previous_version_id"}
+CONTENT_FIELDS = {"is_vectorized", "has_summary", "summary", "chunk_count"}
+DOCUMENT_LIST_FIELDS = {"id"} | DOCUMENT_COLUMN_FIELDS | CONTENT_FIELDS
+DEFAULT_DOCUMENT_LIST_FIELDS = DOCUMENT_LIST_FIELDS - {"summary"}
+MAX_PAGE_SIZE = 100
+MAX_CHANGES = 500  # Beyond this the change feed asks the client to reload instead
+
+
+def _serialize_value(value):
+    if value is None:
+        return None
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    if isinstance(value, UUID):
+        return str(value)
+    return value
+
+
+def _listing_etag(session: Session, user_id: UUID, request: Request) -> str:
+    """
+    Weak ETag for a listing request: the user's document count and latest
+    updated_at (both served from ix_document_user_id_updated_at) plus the
+    query string, so any insert, update or delete produces a new tag.
+    """
+    count, last_updated = session.exec(
+        select(func.count(Document.id), func.max(Document.updated_at))
+        .where(Document.user_id == user_id)
+    ).one()
+    fingerprint = f"{user_id}|{count}|{last_updated}|{request.url.query}"
+    return f'W/"{hashlib.md5(fingerprint.encode("utf-8")).hexdigest()}"'
+
+
+def _document_rows(selected_fields: Set[str]):
+    """
+    SELECT for listing rows: only the requested Document columns (upload_time
+    is always loaded for cursors) plus per-content state from the shared
+    Content row (primary-key join).
+    """
+    column_fields = selected_fields & DOCUMENT_COLUMN_FIELDS
+    load_columns = {getattr(Document, name) for name in column_fields | {"upload_time"}}
+    content_columns = [
+        Content.is_vectorized,
+        Content.summary.isnot(None).label("has_summary"),
+        Content.chunk_count,
+        (Content.summary if "summary" in selected_fields else null()).label("summary"),
+    ]
+    return (
+        select(Document, *content_columns)
+        .outerjoin(Content, Content.file_hash == Document.file_hash)
+        .options(load_only(*load_columns))
+    )
+
+
+def _serialize_row(row, selected_fields: Set[str]) -> dict:
+    doc = row[0]
+    item = {"id": str(doc.id)}
+    for name in selected_fields & DOCUMENT_COLUMN_FIELDS:
+        item[name] = _serialize_value(getattr(doc, name))
+    for name in selected_fields & CONTENT_FIELDS:
+        value = getattr(row, name)
+        item[name] = bool(value) if name in ("is_vectorized", "has_summary") else value
+    return item
+
+
+def _parse_since(since: str) -> datetime:
+    try:
+        value = datetime.fromisoformat(since)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid since timestamp")
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
 @router.get("/documents")
 def get_all_documents(
+    request: Request,
+    response: Response,
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    fields: Optional[str] = Query(None, description="Comma separated list of fields to return"),
+    q: Optional[str] = Query(None, description="Case-insensitive filename search"),
     current_user: User = Depends(get_current_user),
     session: Session = Depends(get_session)
 ):
-    # Filter documents by user_id and sort by upload_time descending
-    documents = session.exec(
-        select(Document)
-        .where(Document.user_id == current_user.id)
-        .order_by(Document.upload_time.desc())
+    """
+    List the user's documents, newest first, with keyset pagination on
+    (upload_time, id). Supports If-None-Match so polling clients get a 304
+    when nothing changed.
+    """
+    try:
+        selected_fields = parse_fields(fields, DOCUMENT_LIST_FIELDS, DEFAULT_DOCUMENT_LIST_FIELDS)
+        cursor_position = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    server_time = datetime.now(timezone.utc)
+    etag = _listing_etag(session, current_user.id, request)
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+
+    statement = _document_rows(selected_fields).where(Document.user_id == current_user.id)
+    if q:
+        statement = statement.where(Document.filename.icontains(q, autoescape=True))
+    if cursor_position:
+        last_time, last_id = cursor_position
+        statement = statement.where(
+            or_(
+                Document.upload_time < last_time,
+                and_(Document.upload_time == last_time, Document.id < last_id),
+            )
+        )
+    statement = statement.order_by(Document.upload_time.desc(), Document.id.desc()).limit(limit + 1)
+
+    rows = session.exec(statement).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    documents = [_serialize_row(row, selected_fields) for row in rows]
+
+    next_cursor = None
+    if has_more and rows:
+        last_doc = rows[-1][0]
+        next_cursor = encode_cursor(last_doc.upload_time, last_doc.id)
+
+    response.headers["ETag"] = etag
+    # server_time is the `since` to pass to /documents/changes to keep this page current
+    return {"documents": documents, "next_cursor": next_cursor, "server_time": server_time.isoformat()}
+
+
+@router.get("/documents/changes")
+def get_document_changes(
+    since: str = Query(..., description="server_time from a previous listing or change feed response"),
+    fields: Optional[str] = Query(None, description="Comma separated list of fields to return"),
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
+):
+    """
+    Incremental change feed: documents created or updated since `since`
+    (including summary/vectorization changes, which bump updated_at) and the
+    ids of documents deleted since then. Pass the returned server_time as
+    the next `since`. `reset: true` means the client is too far behind
+    (tombstones were pruned, or too many changes) and should reload.
+    """
+    try:
+        selected_fields = parse_fields(fields, DOCUMENT_LIST_FIELDS, DEFAULT_DOCUMENT_LIST_FIELDS)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    since_time = _parse_since(since)
+
+    # Taken before querying, so anything committed meanwhile shows up next time
+    server_time = datetime.now(timezone.utc)
+    reset = {"documents": [], "deleted": [], "reset": True, "server_time": server_time.isoformat()}
+    if since_time < server_time - timedelta(seconds=TOMBSTONE_RETENTION_SECONDS):
+        return reset
+
+    rows = session.exec(
+        _document_rows(selected_fields)
+        .where(Document.user_id == current_user.id, Document.updated_at >= since_time)
+        .order_by(Document.updated_at)
+        .limit(MAX_CHANGES + 1)
+    ).all()
+    deleted = session.exec(
+        select(DocumentTombstone.document_id)
+        .where(DocumentTombstone.user_id == current_user.id, DocumentTombstone.deleted_at >= since_time)
+        .limit(MAX_CHANGES + 1)
     ).all()
-    return documents
+    if len(rows) > MAX_CHANGES or len(deleted) > MAX_CHANGES:
+        return reset
+
+    return {
+        "documents": [_serialize_row(row, selected_fields) for row in rows],
+        "deleted": [str(document_id) for document_id in deleted],
+        "reset": False,
+        "server_time": server_time.isoformat(),
+    }
 
 @router.get("/documents/{document_id}")
 def get_document(
@@ -34,5 +209,11 @@ def get_document(
     # Check if the document belongs to the current user
     if document.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to access this document")
-    
-    return document
+
+    content = document.content
+    return {
+        **document.model_dump(mode="json"),
+        "summary": content.summary if content else None,
+        "is_vectorized": bool(content and content.is_vectorized),
+        "chunk_count": content.chunk_count if content else None,
+    }
@@ -0,0 +1,11 @@
+from fastapi import APIRouter
+from fastapi.responses import Response
+
+from app.utils.metrics import render_metrics, CONTENT_TYPE
+
+router = APIRouter()
+
+@router.get("/metrics")
+def metrics():
+    """Request, stage, LLM call and queue metrics in the Prometheus text format."""
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE)
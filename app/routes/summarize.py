@@ -1,11 +1,20 @@
 from fastapi import APIRouter, HTTPException, Depends, status # Import status for better HTTP codes
-from app.utils.extractor import extract_text_from_pdf, extract_text_from_docx
+from app.utils.extractor import load_text
 import google.generativeai as genai 
-from app.database import get_db
+from app.database import get_db, engine
 from app.models.document import Document
-import os, mimetypes
+from app.models.content import Content, get_or_create_content, touch_documents
+import os
 from sqlalchemy.orm import Session
-from app.utils.hierarchical_summarizer import HierarchicalSummarizer
+from app.utils.hierarchical_summarizer import HierarchicalSummarizer, LLMCallBudget, LLMBudgetExceeded
+from app.utils.vectorizer import compute_file_hash
+from app.utils.batch import BatchDocumentsRequest, group_documents_by_content, set_group_status, batch_response
+from app.config import MAX_BATCH_DOCUMENTS, SUMMARIZE_BATCH_LLM_CALLS
+from app.utils.llm_usage import llm_usage_scope
+from app.utils.single_flight import run_once, SingleFlightTimeout
+from app.utils.chunk_map_cache import ChunkMapCache
+from app.utils.metrics import CHUNK_REUSE
+from sqlmodel import Session as SQLModelSession
 import logging
 from app.routes.auth import get_current_user
 from app.models.user import User
@@ -15,9 +24,165 @@ from pydantic import BaseModel
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-UPLOAD_DIR = "uploaded_files"
 router = APIRouter()
 
+MAX_DOC_SIZE_KB = 1000
+
+
+def _too_large_summary(doc_size_kb: float) -> str:
+    """Placeholder stored instead of a summary for documents over MAX_DOC_SIZE_KB"""
+    return (
+        f"This document is too large to summarize due to current API usage limitations. "
+        f"To ensure a smooth and reliable experience for all users, we've placed a processing limit "
+        f"on very large documents.\n\n"
+        f"The extracted plain text from your document is approximately {int(doc_size_kb)}KB — "
+        f"this size is calculated *after* removing all formatting (like layout, fonts, or embedded elements), "
+        f"leaving only the raw text content.\n\n"
+        f"For reference, {MAX_DOC_SIZE_KB}KB of raw text represents a very large amount of content "
+        f"and typically corresponds to over five-hundreds pages of plain text at Times New Roman, 12 pt). Please try uploading a smaller document"
+    )
+
+
+SUMMARY_MODEL = "gemini-1.5-flash-latest"
+
+
+def _make_summarizer(api_key: str, budget: LLMCallBudget = None) -> HierarchicalSummarizer:
+    return HierarchicalSummarizer(
+        model_name=SUMMARY_MODEL,
+        temperature=0.1,
+        max_tokens_per_chunk=4000,
+        chunk_overlap=400,
+        max_retries=3,
+        api_key=api_key,
+        budget=budget,
+        # Passages summarized for an earlier document are not sent to the LLM again
+        map_cache=ChunkMapCache(SUMMARY_MODEL)
+    )
+
+
+def _require_api_key(current_user: User) -> str:
+    user_gemini_api_key = current_user.gemini_api_key
+    if not user_gemini_api_key or user_gemini_api_key.strip() == "":
+        logger.error("Gemini API key is missing or empty for the current user.")
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, 
+            detail="Gemini API key not found for user. Please ensure it is provided during signup."
+        )
+    return user_gemini_api_key
+
+
+def _store_summary(file_hash: str, summary: str) -> None:
+    """Save a finished summary on the shared Content row (own session: runs inside the single-flight lease)."""
+    with SQLModelSession(engine) as db:
+        content = get_or_create_content(db, file_hash)
+        content.summary = summary
+        touch_documents(db, file_hash)
+        db.commit()
+
+
+def _summarized_elsewhere(file_hash: str):
+    """Result stand-in when another worker summarized this content while we waited, else None."""
+    with SQLModelSession(engine) as db:
+        content = db.get(Content, file_hash)
+        if content is None or not content.summary:
+            return None
+        return {"summary": content.summary, "sections_used": 0, "batches_used": 0, "api_calls": 0, "chunks_reused": 0, "reuse_ratio": 0.0}
+
+
+def summarize_once(file_hash: str, summarizer: HierarchicalSummarizer, text: str, user_id) -> tuple:
+    """
+    Summarize and store one content unless the same content is being
+    summarized already, in which case wait for that run and reuse its
+    summary. Returns (result, did_the_work).
+    """
+    def work():
+        with llm_usage_scope(user_id):
+            result = summarizer.summarize(text)
+        _store_summary(file_hash, result["summary"])
+        CHUNK_REUSE.labels(stage="summarize", outcome="reused").inc(result["chunks_reused"])
+        CHUNK_REUSE.labels(stage="summarize", outcome="new").inc(result["sections_used"] - result["chunks_reused"])
+        return result
+    return run_once("summarize", file_hash, work, lambda: _summarized_elsewhere(file_hash))
+
+
+# Declared before /summarize/{filename} so "batch" is not taken for a filename
+@router.post("/summarize/batch")
+def summarize_files(request: BatchDocumentsRequest, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    """
+    Summarize several of the user's documents in one request. Documents are
+    deduplicated by file_hash and all summarizations share one LLM call
+    budget (SUMMARIZE_BATCH_LLM_CALLS) on the user's key: a document whose
+    estimated calls no longer fit is skipped rather than started, and a
+    quota error stops the rest of the batch. Reports a status per document.
+    """
+    if len(request.document_ids) > MAX_BATCH_DOCUMENTS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"At most {MAX_BATCH_DOCUMENTS} documents per batch")
+    api_key = _require_api_key(current_user)
+
+    results, groups = group_documents_by_content(db, current_user.id, request.document_ids)
+    budget = LLMCallBudget(SUMMARIZE_BATCH_LLM_CALLS)
+    summarizer = _make_summarizer(api_key, budget)
+
+    pending = []
+    for file_hash, documents in groups.items():
+        content = get_or_create_content(db, file_hash)
+        if not content.is_vectorized:
+            set_group_status(results, documents, "not_vectorized", detail="Document must be vectorized before summarization.")
+        elif content.summary:
+            set_group_status(results, documents, "already_summarized")
+        else:
+            pending.append((file_hash, documents, content))
+    db.commit()
+
+    for index, (file_hash, documents, content) in enumerate(pending):
+        try:
+            text = load_text(documents[0].path, content.text_path)
+        except Exception as e:
+            set_group_status(results, documents, "failed", detail=f"Text extraction error: {str(e)}")
+            continue
+        if not text.strip():
+            set_group_status(results, documents, "failed", detail="Extracted text is empty")
+            continue
+
+        doc_size_kb = len(text) / 1024
+        if doc_size_kb > MAX_DOC_SIZE_KB:
+            content.summary = _too_large_summary(doc_size_kb)
+            touch_documents(db, file_hash)
+            db.commit()
+            set_group_status(results, documents, "too_large", document_size_kb=round(doc_size_kb, 2))
+            continue
+
+        estimated_calls = summarizer.estimate_api_calls(text)
+        if estimated_calls > budget.remaining:
+            set_group_status(results, documents, "skipped", detail="LLM call budget for this batch exhausted", estimated_api_calls=estimated_calls)
+            continue
+
+        try:
+            result, did_work = summarize_once(file_hash, summarizer, text, current_user.id)
+        except LLMBudgetExceeded as e:
+            set_group_status(results, documents, "skipped", detail=str(e))
+            continue
+        except SingleFlightTimeout as e:
+            set_group_status(results, documents, "in_progress", detail=str(e))
+            continue
+        except gcp_exceptions.ResourceExhausted as re:
+            logger.error(f"⚠️ Batch summarization stopped by quota exhaustion: {str(re)}")
+            for _, remaining_documents, _ in pending[index:]:
+                set_group_status(results, remaining_documents, "rate_limited", detail="API quota exhausted, try again later")
+            break
+        except Exception as e:
+            logger.error(f"⚠️ Summarization of {file_hash} failed: {str(e)}")
+            set_group_status(results, documents, "failed", detail=f"Summarization failed: {str(e)}")
+            continue
+
+        set_group_status(
+            results, documents, "summarized", api_calls=result["api_calls"] if did_work else 0,
+            reuse_ratio=result["reuse_ratio"], coalesced=not did_work
+        )
+
+    return batch_response(results, api_calls_used=budget.used, api_call_budget=budget.max_calls)
+
+
 @router.post("/summarize/{filename}")
 def summarize_file(filename: str, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     """
@@ -27,76 +192,43 @@ def summarize_file(filename: str, db: Session = Depends(get_db), current_user: U
     if not document:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found in DB")
 
-    # Ensure document is vectorized before summarization
-    if not document.is_vectorized:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Document must be vectorized before summarization.")
-
     # Calculate and set file hash if not already set (important for shared summaries)
+    file_path = document.path
     if not document.file_hash:
-        file_path = document.path
         if not os.path.exists(file_path):
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"File not found at path: {file_path}")
-        import hashlib
-        with open(file_path, "rb") as f:
-            file_bytes = f.read()
-            file_hash = hashlib.md5(file_bytes).hexdigest()
-        document.file_hash = file_hash
-        db.commit()
-    else:
-        file_hash = document.file_hash # Assign file_hash from document if it already exists
-        file_path = document.path
+        document.file_hash = compute_file_hash(file_path)
+    file_hash = document.file_hash
 
-    # If this document already has a summary for this user, return it
-    if document.summary:
-        return {
-            "filename": filename,
-            "summary": document.summary,
-            "message": "Summary already generated by you, fetched from database"
-        }
+    # Summary and vectorization state are stored once per content (primary-key lookup)
+    content = get_or_create_content(db, file_hash)
+    db.commit()
 
-    # Check for existing summary by file_hash (e.g., another user summarized the same file)
-    existing_summary_doc = db.query(Document).filter(
-        Document.file_hash == file_hash,
-        Document.summary != None
-    ).first()
-    if existing_summary_doc and existing_summary_doc.summary:
-        document.summary = existing_summary_doc.summary
-        db.commit()
-        msg = "Summary already generated by you, fetched from database" if existing_summary_doc.user_id == current_user.id else "Summary already generated by another user, fetched from database"
+    # Ensure document is vectorized before summarization
+    if not content.is_vectorized:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Document must be vectorized before summarization.")
+
+    # The same content may already have been summarized (by this user or another one)
+    if content.summary:
         return {
             "filename": filename,
-            "summary": document.summary,
-            "message": msg
+            "summary": content.summary,
+            "message": "Summary already generated, fetched from database"
         }
 
     # Retrieve the user's Gemini API key from the current_user object
-    user_gemini_api_key = current_user.gemini_api_key
-    
-    if not user_gemini_api_key or user_gemini_api_key.strip() == "":
-        logger.error("Gemini API key is missing or empty for the current user.")
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, 
-            detail="Gemini API key not found for user. Please ensure it is provided during signup."
-        )
+    user_gemini_api_key = _require_api_key(current_user)
 
     logger.info(f"➡️ Requested file for summarization: {file_path}")
 
-    if not os.path.exists(file_path):
+    if not os.path.exists(file_path) and not (content.text_path and os.path.exists(content.text_path)):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"File not found at path: {file_path}")
 
-    mime_type, _ = mimetypes.guess_type(file_path)
-    logger.info(f"📦 MIME type: {mime_type}")
-
     try:
-        if mime_type == "application/pdf":
-            text = extract_text_from_pdf(file_path)
-        elif mime_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-            text = extract_text_from_docx(file_path)
-        elif mime_type == "text/plain":
-            with open(file_path, 'r', encoding='utf-8') as file:
-                text = file.read()
-        else:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Unsupported file type")
+        # Reuse the text extracted at vectorize time when we have it
+        text = load_text(file_path, content.text_path)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Unsupported file type")
     except Exception as extract_err:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Text extraction error: {str(extract_err)}")
 
@@ -104,24 +236,14 @@ def summarize_file(filename: str, db: Session = Depends(get_db), current_user: U
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Extracted text is empty")
 
     doc_size_kb = len(text) / 1024
-    MAX_DOC_SIZE_KB = 1000
     
     if doc_size_kb > MAX_DOC_SIZE_KB:
         logger.warning(f"⚠️ Document too large ({doc_size_kb:.2f}KB) - skipping API processing")
         
-        placeholder_summary = (
-
-            f"This document is too large to summarize due to current API usage limitations. "
-            f"To ensure a smooth and reliable experience for all users, we've placed a processing limit "
-            f"on very large documents.\n\n"
-            f"The extracted plain text from your document is approximately {int(doc_size_kb)}KB — "
-            f"this size is calculated *after* removing all formatting (like layout, fonts, or embedded elements), "
-            f"leaving only the raw text content.\n\n"
-            f"For reference, {MAX_DOC_SIZE_KB}KB of raw text represents a very large amount of content "
-            f"and typically corresponds to over five-hundreds pages of plain text at Times New Roman, 12 pt). Please try uploading a smaller document"
-        )
+        placeholder_summary = _too_large_summary(doc_size_kb)
 
-        document.summary = placeholder_summary
+        content.summary = placeholder_summary
+        touch_documents(db, file_hash)
         db.commit()
         
         return {
@@ -132,31 +254,31 @@ def summarize_file(filename: str, db: Session = Depends(get_db), current_user: U
         }
 
     try:
-        summarizer = HierarchicalSummarizer(
-            model_name="gemini-1.5-flash-latest",
-            temperature=0.1,
-            max_tokens_per_chunk=4000,
-            chunk_overlap=400,
-            max_retries=3,
-            api_key=user_gemini_api_key
-        )
+        summarizer = _make_summarizer(user_gemini_api_key)
         
-        result = summarizer.summarize(text)
+        # Concurrent requests for the same content wait for one summarization
+        result, did_work = summarize_once(file_hash, summarizer, text, current_user.id)
         final_summary = result["summary"]
+        if not did_work:
+            return {
+                "filename": filename,
+                "summary": final_summary,
+                "message": "Summary already generated, fetched from database"
+            }
         
         logger.info("✅ Summary complete.")
         logger.info(f"📊 Used {result['api_calls']} API calls for {result['sections_used']} sections")
         
-        document.summary = final_summary
-        db.commit()
-        
         return {
             "filename": filename,
             "summary": final_summary,
             "sections_used": result["sections_used"],
             "batches_used": result["batches_used"],
-            "api_calls": result["api_calls"]
+            "api_calls": result["api_calls"],
+            "reuse_ratio": result["reuse_ratio"]
         }
+    except SingleFlightTimeout as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
     except gcp_exceptions.ResourceExhausted as re: # NEW: Catch specific quota error
         logger.error(f"⚠️ Summarization failed due to quota exhaustion: {str(re)}")
         raise HTTPException(
@@ -1,7 +1,8 @@
-from fastapi import APIRouter, File, UploadFile, HTTPException, Depends
+from fastapi import APIRouter, File, Form, UploadFile, HTTPException, Depends
 from fastapi.responses import JSONResponse
 from app.database import get_db
 from app.models.document import Document
+from app.models.content import get_or_create_content
 from sqlmodel import Session
 from app.config import UPLOAD_DIR
 from app.utils.unique import get_unique_filename
@@ -12,15 +13,28 @@ import os
 import hashlib
 import traceback
 from datetime import datetime, timezone
+from typing import Optional
+from uuid import UUID
 
 router = APIRouter()
 
 @router.post("/upload")
 async def upload_file(
     file: UploadFile = File(...),
+    previous_version_id: Optional[UUID] = Form(None),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
+    """
+    Store an uploaded file. With previous_version_id (one of the user's
+    documents) the file is recorded as a new version of it, so vectorizing
+    only processes what changed (see build_vector_store).
+    """
+    if previous_version_id is not None:
+        previous = db.get(Document, previous_version_id)
+        if previous is None or previous.user_id != current_user.id:
+            raise HTTPException(status_code=404, detail="Previous version not found")
+
     # Update upload directory path to use config path
     user_upload_dir = os.path.join(UPLOAD_DIR, str(current_user.id))
     os.makedirs(user_upload_dir, exist_ok=True)
@@ -67,10 +81,13 @@ async def upload_file(
         upload_time=datetime.now(timezone.utc),  # Store as UTC
         path=file_location,
         user_id=current_user.id,
-        file_hash=file_hash  # Save the hash
+        file_hash=file_hash,  # Save the hash
+        previous_version_id=previous_version_id
     )
 
     try:
+        # Identical content uploaded by someone else shares its summary/vector store
+        content = get_or_create_content(db, file_hash)
         db.add(document)
         db.commit()
         print("[INFO] Document committed.")
@@ -89,7 +106,9 @@ async def upload_file(
             "file_type": document.file_type,
             "upload_time": document.upload_time.isoformat(),
             "path": document.path,
-            "summary": document.summary
+            "previous_version_id": str(previous_version_id) if previous_version_id else None,
+            "summary": content.summary,
+            "is_vectorized": content.is_vectorized
         },
         status_code=201
     )
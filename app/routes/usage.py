@@ -0,0 +1,20 @@
+from datetime import datetime, timedelta, timezone
+from fastapi import APIRouter, Depends, Query
+from sqlmodel import Session
+
+from app.database import get_db
+from app.models.llm_usage import usage_report
+from app.models.user import User
+from app.routes.auth import get_current_user
+
+router = APIRouter()
+
+@router.get("/usage/me")
+def my_usage(
+    days: int = Query(30, ge=1, le=366),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """LLM calls, tokens and latency of the current user over the last `days` days, by endpoint, model and day"""
+    since = (datetime.now(timezone.utc) - timedelta(days=days - 1)).date()
+    return usage_report(db, since, current_user.id)
@@ -1,20 +1,153 @@
 import os
-import hashlib
+import asyncio
+import logging
 import joblib
 from fastapi import APIRouter, HTTPException, Depends
 from sqlmodel import Session
-from app.database import get_db
+from app.database import get_db, engine
 from app.models.document import Document
+from app.models.content import Content, get_or_create_content, touch_documents
+from app.models.chunk import register_content_chunks
 from app.routes.auth import get_current_user
 from app.models.user import User
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from app.utils.extractor import extract_text_from_pdf, extract_text_from_docx
-from app.config import VECTOR_STORE_DIR
-from sklearn.feature_extraction.text import TfidfVectorizer
+from app.config import MAX_BATCH_DOCUMENTS, VECTOR_STORE_DIR
+from app.utils.vectorizer import build_vector_store, compute_file_hash, get_process_pool, discard_broken_pool
+from app.utils.batch import BatchDocumentsRequest, group_documents_by_content, set_group_status, batch_response
+from app.utils.metrics import queued, span, CHUNK_REUSE
+from app.utils.single_flight import run_once, SingleFlightTimeout
+
+logger = logging.getLogger(__name__)
 
 # Initialize the FastAPI Router
 router = APIRouter()
 
+
+def _mark_vectorized(file_hash: str, result: dict) -> None:
+    """
+    Record a finished build on the shared Content row and list its chunks in
+    the chunk store, adding result["chunk_reuse"] (own session: runs inside
+    the single-flight lease).
+    """
+    chunks = joblib.load(os.path.join(VECTOR_STORE_DIR, file_hash, "chunks.pkl"))
+    with Session(engine) as db:
+        with span("register_chunks"):
+            result["chunk_reuse"] = register_content_chunks(db, file_hash, chunks)
+        content = get_or_create_content(db, file_hash)
+        content.text_path = result["text_path"]
+        content.chunk_count = result["chunk_count"]
+        content.is_vectorized = True
+        touch_documents(db, file_hash)
+        db.commit()
+
+
+def _has_vector_store(content) -> bool:
+    """Vectorized per the Content row, and the store is still on disk (a swept store is rebuilt)."""
+    return content is not None and content.is_vectorized and os.path.isdir(os.path.join(VECTOR_STORE_DIR, content.file_hash))
+
+
+def _vectorized_elsewhere(file_hash: str):
+    """Result stand-in when another worker vectorized this content while we waited, else None."""
+    with Session(engine) as db:
+        content = db.get(Content, file_hash)
+        if not _has_vector_store(content):
+            return None
+        return {"file_hash": file_hash, "text_path": content.text_path, "chunk_count": content.chunk_count, "storage": None, "chunk_reuse": None}
+
+
+def _previous_version_hash(db: Session, document: Document):
+    """file_hash of the vectorized version `document` is a new version of, if there is one."""
+    if document.previous_version_id is None:
+        return None
+    previous = db.get(Document, document.previous_version_id)
+    if previous is None or not previous.file_hash or previous.file_hash == document.file_hash:
+        return None
+    content = db.get(Content, previous.file_hash)
+    return previous.file_hash if _has_vector_store(content) else None
+
+
+def vectorize_once(file_hash: str, build) -> tuple:
+    """
+    Build (via `build()`) and record the vector store of one content, unless
+    the same content is being vectorized already, in which case wait for
+    that run. Returns (result, did_the_work); blocking.
+    """
+    def work():
+        result = build()
+        _mark_vectorized(file_hash, result)
+        reuse = result["chunk_reuse"]
+        CHUNK_REUSE.labels(stage="vectorize", outcome="reused").inc(reuse["reused"])
+        CHUNK_REUSE.labels(stage="vectorize", outcome="new").inc(reuse["new"])
+        return result
+    return run_once("vectorize", file_hash, work, lambda: _vectorized_elsewhere(file_hash))
+
+# Declared before /vectorize/{filename} so "batch" is not taken for a filename
+@router.post("/vectorize/batch")
+async def vectorize_documents(
+    request: BatchDocumentsRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Vectorize several of the user's documents in one request. Documents are
+    deduplicated by file_hash, and extraction plus TF-IDF fitting for the
+    distinct contents run in parallel on the process pool. Reports a status
+    per requested document.
+    """
+    if len(request.document_ids) > MAX_BATCH_DOCUMENTS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_DOCUMENTS} documents per batch")
+
+    results, groups = group_documents_by_content(db, current_user.id, request.document_ids)
+
+    jobs = {}
+    for file_hash, documents in groups.items():
+        content = get_or_create_content(db, file_hash)
+        if _has_vector_store(content):
+            set_group_status(results, documents, "already_vectorized")
+            continue
+        source = next((doc for doc in documents if os.path.exists(doc.path)), None)
+        if source is None:
+            set_group_status(results, documents, "file_missing")
+            continue
+        previous_hash = next(filter(None, (_previous_version_hash(db, doc) for doc in documents)), None)
+        jobs[file_hash] = (source.path, previous_hash)
+    db.commit()
+
+    pool = get_process_pool()
+
+    def build_on_pool(file_hash: str, path: str, previous_hash):
+        return lambda: pool.submit(build_vector_store, file_hash, path, previous_hash).result()
+
+    # Each content is built on the process pool; the single-flight wait happens on a thread
+    futures = {
+        file_hash: asyncio.to_thread(vectorize_once, file_hash, build_on_pool(file_hash, path, previous_hash))
+        for file_hash, (path, previous_hash) in jobs.items()
+    }
+    with queued("vectorize_pool", len(futures)):
+        outcomes = await asyncio.gather(*futures.values(), return_exceptions=True)
+
+    for file_hash, outcome in zip(futures, outcomes):
+        documents = groups[file_hash]
+        if isinstance(outcome, ValueError):
+            set_group_status(results, documents, "failed", detail=str(outcome))
+            continue
+        if isinstance(outcome, SingleFlightTimeout):
+            set_group_status(results, documents, "in_progress", detail=str(outcome))
+            continue
+        if isinstance(outcome, BaseException):
+            logger.error(f"Vectorizing {file_hash} failed: {str(outcome)}")
+            discard_broken_pool(outcome)
+            set_group_status(results, documents, "failed", detail=f"Vectorization error: {str(outcome)}")
+            continue
+        result, did_work = outcome
+        set_group_status(
+            results, documents, "vectorized",
+            chunk_count=result["chunk_count"], storage=result["storage"], chunk_reuse=result["chunk_reuse"],
+            incremental=result.get("incremental"), coalesced=not did_work
+        )
+
+    return batch_response(results, contents_processed=len(jobs))
+
+
 @router.post("/vectorize/{filename}")
 async def vectorize_document(filename: str, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     document = db.query(Document).filter(Document.filename == filename, Document.user_id == current_user.id).first()
@@ -27,64 +160,31 @@ async def vectorize_document(filename: str, db: Session = Depends(get_db), curre
 
     # Calculate file hash if not already set
     if not document.file_hash:
-        with open(document_path, "rb") as f:
-            file_bytes = f.read()
-            file_hash = hashlib.md5(file_bytes).hexdigest()
-        document.file_hash = file_hash
-        db.commit()
-    else:
-        file_hash = document.file_hash
-
-    # Check for existing vectorized file
-    existing_vectorized = db.query(Document).filter(
-        Document.file_hash == file_hash,
-        Document.is_vectorized == True
-    ).first()
-
-    if existing_vectorized:
-        if not document.is_vectorized:
-            document.is_vectorized = True
-            db.commit()
-        msg = "already vectorized by you, marked as vectorized" if existing_vectorized.user_id == current_user.id else "already vectorized by another user, marked as vectorized"
-        return {"message": msg}
-
-    if document.is_vectorized:
-        return {"message": "Document already vectorized", "filename": filename}
+        document.file_hash = compute_file_hash(document_path)
+    file_hash = document.file_hash
 
-    # Create vector store path
-    vector_store_path = os.path.join(VECTOR_STORE_DIR, file_hash)
-    os.makedirs(vector_store_path, exist_ok=True)
-
-    # Extract text
-    if filename.lower().endswith('.pdf'):
-        text = extract_text_from_pdf(document_path)
-    elif filename.lower().endswith('.docx'):
-        text = extract_text_from_docx(document_path)
-    else:
-        try:
-            with open(document_path, 'r', encoding='utf-8') as f:
-                text = f.read()
-        except:
-            raise HTTPException(status_code=400, detail="Unsupported file type")
-
-    # Split into chunks
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-    chunks = text_splitter.split_text(text)
-
-    if not chunks:
-        raise HTTPException(status_code=400, detail="No text chunks could be extracted.")
-
-    # TF-IDF vectorization
-    vectorizer = TfidfVectorizer()
-    tfidf_matrix = vectorizer.fit_transform(chunks)
-
-    # Save all components
-    joblib.dump(vectorizer, os.path.join(vector_store_path, "vectorizer.pkl"))
-    joblib.dump(tfidf_matrix, os.path.join(vector_store_path, "matrix.pkl"))
-    joblib.dump(chunks, os.path.join(vector_store_path, "chunks.pkl"))
-
-    # Mark document as vectorized
-    document.is_vectorized = True
+    # Vectorization state is shared by every document with this content (primary-key lookup)
+    content = get_or_create_content(db, file_hash)
     db.commit()
 
-    return {"message": "Document vectorized successfully", "filename": filename}
+    if _has_vector_store(content):
+        return {"message": "Document already vectorized", "filename": filename}
+    previous_hash = _previous_version_hash(db, document)
+
+    # Extract, chunk, fit TF-IDF (or patch the previous version's store), save the vector
+    # store and mark the content vectorized; a concurrent request for the same content waits for this one
+    try:
+        result, did_work = await asyncio.to_thread(
+            vectorize_once, file_hash, lambda: build_vector_store(file_hash, document_path, previous_hash)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except SingleFlightTimeout as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    if not did_work:
+        return {"message": "Document already vectorized", "filename": filename}
+    return {
+        "message": "Document vectorized successfully", "filename": filename,
+        "storage": result["storage"], "chunk_reuse": result["chunk_reuse"], "incremental": result.get("incremental")
+    }
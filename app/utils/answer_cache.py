@@ -0,0 +1,88 @@
+"""
+Answer cache for /ask, per content (file_hash).
+
+A question is answered from the cache when an unexpired answer exists for
+the same normalized question, or for a cached question whose TF-IDF cosine
+similarity to it reaches ANSWER_CACHE_SIMILARITY. The TF-IDF space is fitted
+over the content's cached questions plus the new one, so words common to all
+of them weigh little. Filler words are dropped ("who is the landlord" and
+"who's the landlord" match), but not the ones that change what is asked:
+question words, negations and before/after style relations, and single
+digits stay ("clause 7" vs "clause 8"). Entries live in the database
+(CachedAnswer), so all workers share them.
+"""
+from typing import Any, Dict, Optional
+
+from sqlmodel import Session
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS, TfidfVectorizer
+
+from app.config import LLM_PROVIDER, ANSWER_CACHE_TTL_SECONDS, ANSWER_CACHE_MAX_PER_DOCUMENT, ANSWER_CACHE_SIMILARITY
+from app.models.cached_answer import fresh_answers, normalize_question, record_hit, store_answer
+from app.utils.metrics import ANSWER_CACHE, span
+from app.utils.qa_utils import QA_MODEL
+
+# Answers of the stub provider must never be served for the real model
+CACHE_MODEL = f"{LLM_PROVIDER}:{QA_MODEL}"
+
+_MEANINGFUL_STOP_WORDS = {
+    "what", "when", "where", "who", "whom", "whose", "why", "how", "which",
+    "no", "not", "nor", "never", "none", "nothing", "nobody", "neither", "cannot", "without",
+    "before", "after", "above", "below", "first", "last", "more", "less", "least", "most",
+    "under", "over", "between", "within", "until", "during", "against", "only",
+    "all", "any", "each", "every", "few", "many", "much", "some",
+}
+QUESTION_STOP_WORDS = sorted(ENGLISH_STOP_WORDS - _MEANINGFUL_STOP_WORDS)
+# Words of two or more characters, and single digits
+QUESTION_TOKEN_PATTERN = r"(?u)\b(?:\w\w+|\d)\b"
+
+
+def _best_similar(question_key: str, entries) -> Optional[tuple]:
+    """(entry, similarity) of the cached question closest to question_key, if any scores above 0."""
+    vectorizer = TfidfVectorizer(token_pattern=QUESTION_TOKEN_PATTERN, stop_words=QUESTION_STOP_WORDS)
+    try:
+        matrix = vectorizer.fit_transform([question_key] + [entry.question_key for entry in entries])
+    except ValueError:  # No tokens at all (e.g. only punctuation)
+        return None
+    similarities = (matrix[1:] @ matrix[0].T).toarray().ravel()
+    best = int(similarities.argmax())
+    return (entries[best], float(similarities[best])) if similarities[best] > 0 else None
+
+
+@span("answer_cache_lookup")
+def lookup_answer(db: Session, file_hash: str, question: str) -> Optional[Dict[str, Any]]:
+    """
+    The cached /ask response for this question about this content, with
+    cached=True and how it matched, or None. Counts the hit.
+    """
+    if ANSWER_CACHE_TTL_SECONDS <= 0:
+        return None
+    entries = fresh_answers(db, file_hash, CACHE_MODEL, ANSWER_CACHE_TTL_SECONDS)
+    question_key = normalize_question(question)
+    match, similarity = next((entry for entry in entries if entry.question_key == question_key), None), 1.0
+    outcome = "exact"
+    if match is None and entries and ANSWER_CACHE_SIMILARITY <= 1:
+        best = _best_similar(question_key, entries)
+        if best is not None and best[1] >= ANSWER_CACHE_SIMILARITY:
+            (match, similarity), outcome = best, "similar"
+    if match is None:
+        ANSWER_CACHE.labels(outcome="miss").inc()
+        return None
+
+    ANSWER_CACHE.labels(outcome=outcome).inc()
+    response = match.to_response()
+    record_hit(db, match)
+    response.update({
+        "original_question": question,
+        "cached": True,
+        "cache_match": outcome,
+        "cached_question": match.question,
+        "similarity": round(similarity, 4),
+    })
+    return response
+
+
+def cache_answer(db: Session, file_hash: str, question: str, response: Dict[str, Any]) -> None:
+    """Store a fresh /ask response for later questions about this content."""
+    if ANSWER_CACHE_TTL_SECONDS <= 0:
+        return
+    store_answer(db, file_hash, CACHE_MODEL, question, response, ANSWER_CACHE_TTL_SECONDS, ANSWER_CACHE_MAX_PER_DOCUMENT)
@@ -0,0 +1,62 @@
+"""Shared plumbing for the batch vectorize/summarize endpoints."""
+import os
+from collections import Counter
+from typing import Any, Dict, List, Sequence, Tuple
+from uuid import UUID
+
+from pydantic import BaseModel
+from sqlmodel import Session, select
+
+from app.models.document import Document
+from app.utils.file_cleanup import chunked
+from app.utils.vectorizer import compute_file_hash
+
+
+class BatchDocumentsRequest(BaseModel):
+    """Body of POST /vectorize/batch and POST /summarize/batch."""
+    document_ids: List[UUID]
+
+
+def group_documents_by_content(
+    db: Session, user_id: UUID, document_ids: Sequence[UUID]
+) -> Tuple[Dict[UUID, Dict[str, Any]], Dict[str, List[Document]]]:
+    """
+    Resolve a batch request into the user's documents grouped by file_hash,
+    so every distinct content is processed once however many copies the
+    batch names. Returns (results, groups): results has one entry per
+    requested id, already marked "not_found" / "file_missing" where needed.
+    Legacy documents without a hash get one computed (caller commits).
+    """
+    requested = list(dict.fromkeys(document_ids))
+    documents: Dict[UUID, Document] = {}
+    for batch in chunked(requested):
+        for document in db.exec(select(Document).where(Document.id.in_(batch), Document.user_id == user_id)):
+            documents[document.id] = document
+
+    results: Dict[UUID, Dict[str, Any]] = {}
+    groups: Dict[str, List[Document]] = {}
+    for document_id in requested:
+        document = documents.get(document_id)
+        if document is None:
+            results[document_id] = {"document_id": str(document_id), "status": "not_found"}
+            continue
+        results[document_id] = {"document_id": str(document_id), "filename": document.filename, "status": "pending"}
+        if not document.file_hash:
+            if not os.path.exists(document.path):
+                results[document_id]["status"] = "file_missing"
+                continue
+            document.file_hash = compute_file_hash(document.path)
+        groups.setdefault(document.file_hash, []).append(document)
+    return results, groups
+
+
+def set_group_status(results: Dict[UUID, Dict[str, Any]], documents: List[Document], status: str, **extra: Any) -> None:
+    """Record the same outcome for every document sharing one content."""
+    for document in documents:
+        results[document.id].update(status=status, **extra)
+
+
+def batch_response(results: Dict[UUID, Dict[str, Any]], **extra: Any) -> Dict[str, Any]:
+    """Per-document results in request order plus a count per status."""
+    items = list(results.values())
+    return {"results": items, "counts": dict(Counter(item["status"] for item in items)), **extra}
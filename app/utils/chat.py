@@ -0,0 +1,192 @@
+"""
+Multi-turn chat over one document.
+
+A stateless /ask reloads the vector store, rewrites the question and sends
+TOP_K_CHUNKS fresh chunks every time. A chat session instead:
+
+- pins the loaded store in this worker's memory (LRU of CHAT_PINNED_STORES
+  stores), so follow-ups skip the load;
+- keeps a rolling window of the chunk IDs retrieved so far (at most
+  CHAT_WINDOW_CHUNKS, least recently used dropped first). Each turn
+  retrieves CHAT_TURN_CHUNKS candidates; chunks already in the window are
+  marked as used again, and the new ones are added;
+- packs the prompt context like /ask (app/utils/context_packer.py) within
+  CONTEXT_TOKEN_BUDGET: this turn's chunks rank first, chunks carried over
+  from earlier turns rank below them, so they are cut to their sentences
+  that match the question, or left out once the budget is spent. A turn's
+  context is never larger than an /ask context;
+- retrieves follow-ups with the previous question as context instead of an
+  LLM rewrite;
+- keeps the last turns verbatim and folds older ones into a running summary
+  (one LLM call every CHAT_RECENT_TURNS turns), so the prompt stays bounded
+  however long the conversation gets.
+
+The session state itself is stored in ChatSession rows (see
+app/routes/chat.py); only the pinned stores are per worker.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+
+from app.config import (
+    VECTOR_STORE_DIR, QUERY_REWRITE, CHAT_PINNED_STORES, CHAT_SESSION_TTL_SECONDS, CHAT_TURN_CHUNKS,
+    CHAT_WINDOW_CHUNKS, CHAT_RECENT_TURNS,
+)
+from app.utils.context_packer import pack_context
+from app.utils.llm_usage import invoke_llm, estimate_tokens
+from app.utils.metrics import CHAT_STORE_PINS, span
+from app.utils.qa_utils import load_vector_store, rewrite_queries, score_top_k
+
+# file_hash -> (vector store, last used), least recently used first
+_pinned: "OrderedDict[str, Tuple[Dict[str, Any], float]]" = OrderedDict()
+_pin_lock = threading.Lock()
+
+CHAT_PROMPT = """
+You are a helpful AI assistant in a conversation about a document. Answer the user's latest question using ONLY the following context from the document and the conversation so far.
+
+<context>
+{context}
+</context>
+{history}
+Question: {question}
+
+Rules:
+- If the answer is not found in the context or the conversation, say "The answer is not found in the document."
+- Be precise and concise.
+"""
+
+SUMMARY_PROMPT = """
+Summarize this conversation about a document in a few sentences. Keep the facts that were established, names, numbers and what the user was trying to find out, so the conversation can continue from the summary.
+
+{summary}{turns}
+"""
+
+
+def pinned_store(file_hash: str) -> Dict[str, Any]:
+    """The vector store of a content, loaded once per worker while chats use it."""
+    now = time.monotonic()
+    with _pin_lock:
+        # Stores nobody chatted with for a session lifetime are released first
+        for stale_hash, (_, last_used) in list(_pinned.items()):
+            if now - last_used > CHAT_SESSION_TTL_SECONDS:
+                del _pinned[stale_hash]
+        if file_hash in _pinned:
+            store = _pinned.pop(file_hash)[0]
+            _pinned[file_hash] = (store, now)
+            CHAT_STORE_PINS.labels(outcome="hit").inc()
+            return store
+
+    store = load_vector_store(os.path.join(VECTOR_STORE_DIR, file_hash))
+    CHAT_STORE_PINS.labels(outcome="load").inc()
+    with _pin_lock:
+        _pinned[file_hash] = (store, time.monotonic())
+        while len(_pinned) > CHAT_PINNED_STORES:
+            _pinned.popitem(last=False)
+    return store
+
+
+def unpin_store(file_hash: str) -> None:
+    with _pin_lock:
+        _pinned.pop(file_hash, None)
+
+
+def update_window(window: List[int], retrieved: List[int], limit: int = CHAT_WINDOW_CHUNKS) -> Tuple[List[int], List[int], List[int]]:
+    """
+    Mark the retrieved chunk IDs as most recently used in the window and
+    drop the least recently used beyond `limit`. Returns (window, new IDs,
+    IDs that were already in the window).
+    """
+    known = set(window)
+    new = [chunk_id for chunk_id in retrieved if chunk_id not in known]
+    reused = [chunk_id for chunk_id in retrieved if chunk_id in known]
+    retrieved_set = set(retrieved)
+    # Best retrieved chunk last, so it is the last to be dropped
+    window = [chunk_id for chunk_id in window if chunk_id not in retrieved_set] + list(reversed(retrieved))
+    return window[-limit:], new, reused
+
+
+def _history_text(summary: str, turns: List[Dict[str, Any]]) -> str:
+    parts = []
+    if summary:
+        parts.append(f"\n<conversation_summary>\n{summary}\n</conversation_summary>\n")
+    if turns:
+        parts.append("\nConversation so far:\n" + "\n".join(
+            f"User: {turn['question']}\nAssistant: {turn['answer']}" for turn in turns
+        ) + "\n")
+    return "".join(parts)
+
+
+def fold_old_turns(llm, summary: str, turns: List[Dict[str, Any]]) -> Tuple[str, List[Dict[str, Any]], int]:
+    """
+    Once 2 * CHAT_RECENT_TURNS turns are kept verbatim, fold the oldest
+    CHAT_RECENT_TURNS into the summary. Returns (summary, turns, turns folded).
+    """
+    if len(turns) < 2 * CHAT_RECENT_TURNS:
+        return summary, turns, 0
+    old, recent = turns[:CHAT_RECENT_TURNS], turns[CHAT_RECENT_TURNS:]
+    previous = f"Summary of the conversation before:\n{summary}\n\n" if summary else ""
+    text = "\n".join(f"User: {turn['question']}\nAssistant: {turn['answer']}" for turn in old)
+    with span("chat_summarize_history"):
+        response = invoke_llm(llm, SUMMARY_PROMPT.format(summary=previous, turns=text), "chat_summary")
+    return (response.content if hasattr(response, "content") else str(response)).strip(), recent, len(old)
+
+
+def _retrieval_query(llm, question: str, turns: List[Dict[str, Any]]) -> Tuple[str, List[str]]:
+    if turns:
+        # A follow-up ("and the second one?") is retrieved together with the question before it
+        return f"{turns[-1]['question']} {question}", []
+    if QUERY_REWRITE:
+        rewritten = rewrite_queries(llm, question, num_rephrasals=4)
+        return " OR ".join(rewritten), rewritten
+    return question, []
+
+
+@span("chat_turn")
+def chat_turn(llm, store: Dict[str, Any], state: Dict[str, Any], question: str) -> Dict[str, Any]:
+    """
+    Answer one question of a session. `state` holds turns, history_summary,
+    summarized_turns and chunk_window and is updated in place.
+    """
+    chunks = store["chunks"]
+    turns = state["turns"]
+    query, rewritten = _retrieval_query(llm, question, turns)
+    with span("retrieve_top_k_chunks"):
+        scored = score_top_k(store, query, CHAT_TURN_CHUNKS)
+    retrieved = [index for _, index in scored]
+    # IDs from before a re-vectorization that produced fewer chunks are dropped
+    window = [chunk_id for chunk_id in state["chunk_window"] if chunk_id < len(chunks)]
+    window, new, reused = update_window(window, retrieved)
+
+    # This turn's chunks first, then the ones carried over, most recently used first
+    retrieved_set = set(retrieved)
+    hits = [(score, None, index, chunks[index]) for score, index in scored]
+    hits += [(0.0, None, chunk_id, chunks[chunk_id]) for chunk_id in reversed(window) if chunk_id not in retrieved_set]
+    with span("pack_context"):
+        passages, packing = pack_context(hits, query, {None: store.get("offsets")})
+    context = "\n\n".join(passage["text"] for passage in passages)
+    prompt = CHAT_PROMPT.format(
+        context=context, history=_history_text(state["history_summary"], turns), question=question
+    )
+    response = invoke_llm(llm, prompt, "chat")
+    answer = (response.content if hasattr(response, "content") else str(response)).strip()
+    if not answer:
+        raise RuntimeError("QA processing error: Empty response from LLM")
+
+    turns.append({"question": question, "answer": answer, "new_chunk_ids": new})
+    state["history_summary"], state["turns"], folded = fold_old_turns(llm, state["history_summary"], turns)
+    state["summarized_turns"] += folded
+    state["chunk_window"] = window
+    return {
+        "question": question,
+        "rewritten_questions": rewritten,
+        "answer": answer,
+        "sources": [{"chunk_id": chunk_id, "page_content": chunks[chunk_id][:200] + "..."} for chunk_id in retrieved],
+        "new_chunk_ids": new,
+        "reused_chunk_ids": reused,
+        "context_chunks": len(window),
+        "context": packing,
+        "prompt_tokens": estimate_tokens(prompt),
+        "summarized_turns": state["summarized_turns"],
+    }
@@ -0,0 +1,35 @@
+"""
+Map summaries shared across documents through the Chunk table.
+
+HierarchicalSummarizer asks the cache for the map units of a document
+before its map phase and only sends the ones without a stored summary to
+the LLM; the summaries it produces are stored for the next document that
+contains the same passages (see app/models/chunk.py).
+"""
+from typing import Dict, Iterable, Tuple
+
+from sqlmodel import Session
+
+from app.config import LLM_PROVIDER
+from app.database import engine
+from app.models.chunk import get_map_summaries, store_map_summaries
+
+
+class ChunkMapCache:
+    """Map summaries by chunk hash, for one model."""
+
+    def __init__(self, model: str):
+        # Summaries of the stub provider must never be served for the real model
+        self.model = f"{LLM_PROVIDER}:{model}"
+
+    def get(self, hashes: Iterable[str]) -> Dict[str, str]:
+        with Session(engine) as db:
+            summaries = get_map_summaries(db, hashes, self.model)
+            db.commit()
+        return summaries
+
+    def put(self, summaries: Dict[str, Tuple[str, str]]) -> None:
+        """Store {chunk_hash: (text, map summary)}."""
+        with Session(engine) as db:
+            store_map_summaries(db, summaries, self.model)
+            db.commit()
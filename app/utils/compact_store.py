@@ -0,0 +1,283 @@
+"""
+Compact on-disk / in-memory form of a fitted TF-IDF store.
+
+A pickled TfidfVectorizer keeps its vocabulary as a dict of Python strings
+(one object per term) and fit_transform produces float64 values. The compact
+form keeps:
+
+- the vocabulary as one sorted UTF-8 blob plus int32 offsets, looked up by
+  binary search (sklearn numbers columns in sorted term order, so a term's
+  position in the sorted array is its column);
+- float32 values, or int8 values with a float32 scale per row;
+- int32 indices / indptr.
+
+CompactTfidfIndex.transform() reproduces TfidfVectorizer.transform() for
+the analyzer settings stored with the index, so retrieval code can use it
+in place of the vectorizer.
+"""
+import io
+import os
+import sys
+import json
+import bisect
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional
+
+import joblib
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.feature_extraction.text import CountVectorizer
+
+MANIFEST_FILE = "manifest.json"
+COMPACT_FILE = "compact.npz"
+COMPACT_FORMATS = ("float32", "int8")
+
+# TfidfVectorizer parameters that decide how a query is turned into a vector
+ANALYZER_PARAMS = ("lowercase", "token_pattern", "ngram_range", "strip_accents", "stop_words", "analyzer", "preprocessor", "tokenizer")
+WEIGHTING_PARAMS = ("norm", "use_idf", "sublinear_tf")
+
+
+class SortedVocabulary:
+    """Sorted terms packed into a UTF-8 blob; supports len(), [i] (bytes) and lookup()."""
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray):
+        self.blob = blob
+        self.offsets = offsets
+        self._bytes = blob.tobytes()
+
+    @classmethod
+    def from_terms(cls, terms: List[str]) -> "SortedVocabulary":
+        encoded = [term.encode("utf-8") for term in terms]
+        lengths = np.fromiter((len(term) for term in encoded), dtype=np.int64, count=len(encoded))
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        offset_dtype = np.int32 if offsets[-1] < np.iinfo(np.int32).max else np.int64
+        blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        return cls(blob, offsets.astype(offset_dtype))
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> bytes:
+        return self._bytes[self.offsets[index]:self.offsets[index + 1]]
+
+    def lookup(self, term: str) -> int:
+        """Column of `term`, or -1 if it is not in the vocabulary."""
+        key = term.encode("utf-8")
+        index = bisect.bisect_left(self, key)
+        if index < len(self) and self[index] == key:
+            return index
+        return -1
+
+    @property
+    def nbytes(self) -> int:
+        return self.blob.nbytes + self.offsets.nbytes
+
+
+class CompactTfidfIndex:
+    """TF-IDF vocabulary, idf weights and chunk matrix in compact arrays."""
+
+    def __init__(
+        self,
+        vocabulary: SortedVocabulary,
+        idf: Optional[np.ndarray],
+        data: np.ndarray,
+        indices: np.ndarray,
+        indptr: np.ndarray,
+        shape,
+        row_scale: Optional[np.ndarray] = None,
+        params: Optional[Dict[str, Any]] = None,
+    ):
+        self.vocabulary = vocabulary
+        self.idf = idf
+        self.row_scale = row_scale
+        self.params = params or {}
+        self.matrix = csr_matrix((data, indices, indptr), shape=tuple(shape))
+        self._analyzer = None
+        self._quantized_norms = None
+
+    @property
+    def format(self) -> str:
+        return "int8" if self.row_scale is not None else "float32"
+
+    @classmethod
+    def from_sklearn(cls, vectorizer, tfidf_matrix, fmt: str = "float32") -> "CompactTfidfIndex":
+        if fmt not in COMPACT_FORMATS:
+            raise ValueError(f"Unknown compact store format: {fmt}")
+        vectorizer_params = vectorizer.get_params()
+        if vectorizer_params["analyzer"] != "word" or vectorizer_params["tokenizer"] or vectorizer_params["preprocessor"]:
+            raise ValueError("Only the built-in word analyzer can be stored compactly")
+
+        terms = vectorizer.get_feature_names_out().tolist()  # Sorted; position == column
+        params = {name: vectorizer_params[name] for name in ANALYZER_PARAMS + WEIGHTING_PARAMS}
+        params["ngram_range"] = list(params["ngram_range"])
+        idf = vectorizer.idf_.astype(np.float32) if params["use_idf"] else None
+        return cls.from_matrix(SortedVocabulary.from_terms(terms), idf, params, tfidf_matrix, fmt)
+
+    @classmethod
+    def from_matrix(
+        cls, vocabulary: SortedVocabulary, idf: Optional[np.ndarray], params: Dict[str, Any], tfidf_matrix, fmt: str = "float32"
+    ) -> "CompactTfidfIndex":
+        """Index over an existing vocabulary / idf and a chunk matrix in that vocabulary's columns."""
+        if fmt not in COMPACT_FORMATS:
+            raise ValueError(f"Unknown compact store format: {fmt}")
+        matrix = csr_matrix(tfidf_matrix, dtype=np.float32, copy=True)  # sort_indices() below must not touch the caller's arrays
+        matrix.sort_indices()
+        row_scale = None
+        data = matrix.data
+        if fmt == "int8":
+            # Symmetric per-row quantization: value ~= int8 * row_scale[row]
+            row_max = abs(matrix).max(axis=1).toarray().ravel()
+            row_scale = (row_max / 127.0).astype(np.float32)
+            per_value_scale = np.repeat(row_scale, np.diff(matrix.indptr))
+            data = np.round(data / np.maximum(per_value_scale, 1e-12)).astype(np.int8)
+
+        return cls(
+            vocabulary,
+            idf,
+            data,
+            matrix.indices.astype(np.int32),
+            matrix.indptr.astype(np.int32),
+            matrix.shape,
+            row_scale,
+            params,
+        )
+
+    def dequantized_matrix(self) -> csr_matrix:
+        """The chunk matrix as float32 TF-IDF values (int8 rows multiplied back by their scale)."""
+        if self.row_scale is None:
+            return self.matrix
+        per_value_scale = np.repeat(self.row_scale, np.diff(self.matrix.indptr))
+        return csr_matrix(
+            (self.matrix.data.astype(np.float32) * per_value_scale, self.matrix.indices, self.matrix.indptr),
+            shape=self.matrix.shape,
+        )
+
+    # --- query side -------------------------------------------------------
+
+    def analyze(self, text: str) -> List[str]:
+        """Terms of a text as the fitted vectorizer's analyzer produces them."""
+        if self._analyzer is None:
+            self._analyzer = CountVectorizer(
+                lowercase=self.params.get("lowercase", True),
+                token_pattern=self.params.get("token_pattern", r"(?u)\b\w\w+\b"),
+                ngram_range=tuple(self.params.get("ngram_range", (1, 1))),
+                strip_accents=self.params.get("strip_accents"),
+                stop_words=self.params.get("stop_words"),
+            ).build_analyzer()
+        return self._analyzer(text)
+
+    def transform(self, texts: Iterable[str]) -> csr_matrix:
+        """Same vectors as the original TfidfVectorizer.transform() (as float32)."""
+        data: List[float] = []
+        indices: List[int] = []
+        indptr = [0]
+        for text in texts:
+            counts = Counter(
+                column for column in (self.vocabulary.lookup(term) for term in self.analyze(text)) if column >= 0
+            )
+            columns = sorted(counts)
+            values = np.array([counts[column] for column in columns], dtype=np.float32)
+            if self.params.get("sublinear_tf"):
+                values = np.log(values) + 1
+            if self.idf is not None and columns:
+                values *= self.idf[columns]
+            if self.params.get("norm") == "l2" and values.size:
+                values /= max(float(np.linalg.norm(values)), 1e-12)
+            elif self.params.get("norm") == "l1" and values.size:
+                values /= max(float(np.abs(values).sum()), 1e-12)
+            data.extend(values.tolist())
+            indices.extend(columns)
+            indptr.append(len(indices))
+        return csr_matrix(
+            (np.array(data, dtype=np.float32), np.array(indices, dtype=np.int32), np.array(indptr, dtype=np.int32)),
+            shape=(len(indptr) - 1, len(self.vocabulary)),
+        )
+
+    def similarities(self, query_vector: csr_matrix) -> np.ndarray:
+        """Cosine similarity of one (l2-normalized) query vector with every chunk."""
+        scores = np.asarray(self.matrix @ query_vector.T.toarray().astype(np.float32)).ravel()
+        if self.row_scale is not None:
+            # Dividing by the norm of each quantized row both undoes the
+            # per-row scale and keeps the scores true cosines
+            if self._quantized_norms is None:
+                squared = self.matrix.astype(np.float32).multiply(self.matrix).sum(axis=1)
+                self._quantized_norms = np.sqrt(np.asarray(squared, dtype=np.float32).ravel())
+            scores /= np.maximum(self._quantized_norms, 1e-12)
+        return scores
+
+    # --- persistence ------------------------------------------------------
+
+    @property
+    def nbytes(self) -> int:
+        total = self.vocabulary.nbytes + self.matrix.data.nbytes + self.matrix.indices.nbytes + self.matrix.indptr.nbytes
+        if self.idf is not None:
+            total += self.idf.nbytes
+        if self.row_scale is not None:
+            total += self.row_scale.nbytes
+        return total
+
+    def save(self, directory: str) -> int:
+        """Write compact.npz plus manifest.json (written last) and return the bytes written."""
+        arrays = {
+            "vocab_blob": self.vocabulary.blob,
+            "vocab_offsets": self.vocabulary.offsets,
+            "data": self.matrix.data,
+            "indices": self.matrix.indices,
+            "indptr": self.matrix.indptr,
+            "shape": np.array(self.matrix.shape, dtype=np.int64),
+        }
+        if self.idf is not None:
+            arrays["idf"] = self.idf
+        if self.row_scale is not None:
+            arrays["row_scale"] = self.row_scale
+        compact_path = os.path.join(directory, COMPACT_FILE)
+        np.savez(compact_path, **arrays)
+        manifest = {"format": self.format, "params": self.params, "n_chunks": int(self.matrix.shape[0])}
+        manifest_path = os.path.join(directory, MANIFEST_FILE)
+        with open(manifest_path, "w") as f:
+            json.dump(manifest, f)
+        return os.path.getsize(compact_path) + os.path.getsize(manifest_path)
+
+    @classmethod
+    def load(cls, directory: str) -> "CompactTfidfIndex":
+        with open(os.path.join(directory, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+        with np.load(os.path.join(directory, COMPACT_FILE)) as arrays:
+            return cls(
+                SortedVocabulary(arrays["vocab_blob"], arrays["vocab_offsets"]),
+                arrays["idf"] if "idf" in arrays.files else None,
+                arrays["data"],
+                arrays["indices"],
+                arrays["indptr"],
+                arrays["shape"],
+                arrays["row_scale"] if "row_scale" in arrays.files else None,
+                manifest.get("params"),
+            )
+
+
+def read_manifest(directory: str) -> Optional[Dict[str, Any]]:
+    """The store's manifest, or None for a classic pickle store."""
+    path = os.path.join(directory, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def sklearn_memory_bytes(vectorizer, tfidf_matrix) -> int:
+    """Approximate in-memory size of a loaded classic store (vocabulary dict, idf, matrix)."""
+    vocabulary = vectorizer.vocabulary_
+    vocabulary_bytes = sys.getsizeof(vocabulary) + sum(sys.getsizeof(term) + sys.getsizeof(column) for term, column in vocabulary.items())
+    matrix_bytes = tfidf_matrix.data.nbytes + tfidf_matrix.indices.nbytes + tfidf_matrix.indptr.nbytes
+    return vocabulary_bytes + vectorizer.idf_.nbytes + matrix_bytes
+
+
+def pickled_size(*objects) -> int:
+    """Bytes joblib.dump would write for these objects."""
+    total = 0
+    for obj in objects:
+        buffer = io.BytesIO()
+        joblib.dump(obj, buffer)
+        total += buffer.tell()
+    return total
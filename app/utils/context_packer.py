@@ -0,0 +1,185 @@
+"""
+Packing retrieved chunks into the /ask (and chat) prompt context.
+
+Chunks overlap by CHUNK_OVERLAP characters, so the top TOP_K_CHUNKS hits of
+a question often repeat text, and joined verbatim they put no bound on the
+prompt. Before the hits go to the LLM they are packed:
+
+1. Chunks whose word-shingle Jaccard similarity to a better-scoring hit is
+   at least CONTEXT_DEDUP_SIMILARITY (repeated boilerplate, headers) are
+   dropped.
+2. Chunks of the same store whose offsets in the extracted text overlap or
+   touch are merged into one passage, with the overlap written once. Stores
+   vectorized before offsets were recorded skip this step.
+3. Passages scoring below CONTEXT_TRIM_RATIO times the best score are cut
+   down to the CONTEXT_TRIM_SENTENCES sentences sharing the most terms with
+   the question.
+4. Passages are added best score first until CONTEXT_TOKEN_BUDGET tokens. A
+   passage that does not fit is tried trimmed, then left out.
+
+Token counts use the same estimate as the LLM usage records (len / 4).
+"""
+import re
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+
+from app.config import (
+    CONTEXT_PACKING, CONTEXT_TOKEN_BUDGET, CONTEXT_DEDUP_SIMILARITY, CONTEXT_TRIM_RATIO, CONTEXT_TRIM_SENTENCES,
+)
+from app.utils.llm_usage import estimate_tokens
+from app.utils.metrics import CONTEXT_TOKENS
+
+# (score, store key, chunk index, chunk), best first, as returned by retrieve_top_k_across
+Hit = Tuple[float, Hashable, int, str]
+
+# Consecutive chunks at most this far apart (the whitespace the splitter stripped) are merged too
+MAX_MERGE_GAP = 4
+SHINGLE_WORDS = 3
+# Between kept sentences that were not next to each other
+TRIM_MARKER = " ... "
+
+_WORDS = re.compile(r"(?u)\w+")
+_TERMS = re.compile(r"(?u)\b\w\w+\b")
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+|\n+")
+
+
+def _shingles(text: str) -> set:
+    words = _WORDS.findall(text.lower())
+    if len(words) < SHINGLE_WORDS:
+        return {tuple(words)}
+    return {tuple(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+
+def drop_near_duplicates(hits: List[Hit], threshold: float = CONTEXT_DEDUP_SIMILARITY) -> List[Hit]:
+    """The hits without those too similar to a better one (hits come best first)."""
+    kept, kept_shingles = [], []
+    for hit in hits:
+        shingles = _shingles(hit[3])
+        if any(len(shingles & other) / len(shingles | other) >= threshold for other in kept_shingles):
+            continue
+        kept.append(hit)
+        kept_shingles.append(shingles)
+    return kept
+
+
+def merge_overlapping(hits: List[Hit], offsets: Optional[Dict[Hashable, np.ndarray]] = None) -> List[Dict[str, Any]]:
+    """
+    One passage {"score", "key", "chunk_ids", "text"} per run of overlapping
+    or adjacent chunks of the same store, best score first. `offsets` maps
+    a store key to its (chunks, 2) [start, end) array; hits of stores
+    without one, or at unknown offsets, stay passages of their own.
+    """
+    passages = []
+    located = []
+    for score, key, index, chunk in hits:
+        spans = (offsets or {}).get(key)
+        if spans is not None and index < len(spans) and spans[index][0] >= 0:
+            located.append((key, int(spans[index][0]), int(spans[index][1]), score, index, chunk))
+        else:
+            passages.append({"score": score, "key": key, "chunk_ids": [index], "text": chunk})
+
+    current, current_end = None, 0
+    for key, start, end, score, index, chunk in sorted(located, key=lambda hit: (str(hit[0]), hit[1], hit[2])):
+        joins = current is not None and current["key"] == key and (
+            start <= current_end or (index == current["chunk_ids"][-1] + 1 and start - current_end <= MAX_MERGE_GAP)
+        )
+        if not joins:
+            current, current_end = {"score": score, "key": key, "chunk_ids": [index], "text": chunk}, end
+            passages.append(current)
+            continue
+        if end > current_end:
+            # The part of the chunk past what the passage already has
+            current["text"] += chunk[current_end - start:] if start <= current_end else "\n" + chunk
+            current_end = end
+        current["score"] = max(current["score"], score)
+        current["chunk_ids"].append(index)
+
+    passages.sort(key=lambda passage: passage["score"], reverse=True)
+    return passages
+
+
+def question_terms(question: str) -> set:
+    return {term for term in _TERMS.findall(question.lower()) if term not in ENGLISH_STOP_WORDS}
+
+
+def trim_to_best_sentences(text: str, terms: set, max_sentences: int = CONTEXT_TRIM_SENTENCES) -> str:
+    """The `max_sentences` sentences of text sharing the most terms with the question, in their order."""
+    sentences = [sentence.strip() for sentence in _SENTENCE_BREAK.split(text) if sentence.strip()]
+    if len(sentences) <= max_sentences:
+        return text
+    ranked = sorted(
+        range(len(sentences)),
+        key=lambda i: (-len(terms & set(_TERMS.findall(sentences[i].lower()))), i)
+    )
+    kept = sorted(ranked[:max_sentences])
+    parts = [sentences[kept[0]]]
+    for previous, i in zip(kept, kept[1:]):
+        parts.append((" " if i == previous + 1 else TRIM_MARKER) + sentences[i])
+    return "".join(parts)
+
+
+def pack_context(
+    hits: List[Hit],
+    question: str,
+    offsets: Optional[Dict[Hashable, np.ndarray]] = None,
+    budget: int = CONTEXT_TOKEN_BUDGET,
+) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Pack the hits into passages for the prompt (see the module docstring),
+    best first. Returns (passages, report); the report compares the tokens
+    of the hits joined as they were with the packed context.
+    """
+    retrieved_tokens = estimate_tokens("\n\n".join(hit[3] for hit in hits))
+    if not CONTEXT_PACKING:
+        passages = [{"score": score, "key": key, "chunk_ids": [index], "text": chunk} for score, key, index, chunk in hits]
+        kept, duplicates, over_budget = hits, 0, 0
+    else:
+        kept = drop_near_duplicates(hits)
+        duplicates = len(hits) - len(kept)
+        merged = merge_overlapping(kept, offsets)
+        terms = question_terms(question)
+
+        best_score = merged[0]["score"] if merged else 0.0
+        for passage in merged:
+            if passage["score"] < CONTEXT_TRIM_RATIO * best_score:
+                trimmed = trim_to_best_sentences(passage["text"], terms)
+                passage["trimmed"] = len(trimmed) < len(passage["text"])
+                passage["text"] = trimmed
+
+        passages, used, over_budget = [], 0, 0
+        for passage in merged:
+            tokens = estimate_tokens(passage["text"])
+            if budget and used + tokens > budget:
+                trimmed = trim_to_best_sentences(passage["text"], terms)
+                if used + estimate_tokens(trimmed) <= budget:
+                    passage["trimmed"] = passage.get("trimmed") or len(trimmed) < len(passage["text"])
+                    passage["text"] = trimmed
+                elif not passages:
+                    # Even the best passage is over budget: keep its start
+                    passage["trimmed"] = True
+                    passage["text"] = trimmed[:budget * 4]
+                else:
+                    over_budget += 1
+                    continue
+                tokens = estimate_tokens(passage["text"])
+            passages.append(passage)
+            used += tokens
+
+    packed_tokens = estimate_tokens("\n\n".join(passage["text"] for passage in passages))
+    CONTEXT_TOKENS.labels(stage="retrieved").inc(retrieved_tokens)
+    CONTEXT_TOKENS.labels(stage="packed").inc(packed_tokens)
+    report = {
+        "packed": CONTEXT_PACKING,
+        "chunks": len(hits),
+        "duplicates_dropped": duplicates,
+        "merged": len(kept) - len(passages) - over_budget,
+        "trimmed": sum(1 for passage in passages if passage.get("trimmed")),
+        "over_budget": over_budget,
+        "passages": len(passages),
+        "retrieved_tokens": retrieved_tokens,
+        "packed_tokens": packed_tokens,
+        "token_reduction": round(1 - packed_tokens / retrieved_tokens, 4) if retrieved_tokens else 0.0,
+    }
+    return passages, report
@@ -0,0 +1,113 @@
+"""
+Streaming text extraction for DOCX files.
+
+A .docx is a zip of WordprocessingML parts. Instead of building
+python-docx's object model for the whole document, the parts are parsed
+straight out of the zip with ElementTree.iterparse and every finished
+top-level block is dropped again, so memory stays flat however long the
+document is. Unlike `Document(path).paragraphs`, this also reads table
+cells (nested tables included), text boxes, headers and footers.
+"""
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+from typing import IO, Iterator, List
+
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+MC = "{http://schemas.openxmlformats.org/markup-compatibility/2006}"
+
+_PARAGRAPH = W + "p"
+_TEXT = W + "t"
+_TAB = W + "tab"
+_BREAKS = (W + "br", W + "cr")
+_CELL = W + "tc"
+_CONTAINERS = (W + "body", W + "hdr", W + "ftr")
+# Skipped with everything inside: Word stores a legacy (VML) copy of text boxes and shapes next to the
+# modern one (mc:Fallback), and paragraph properties define tab stops with w:tab elements too (w:pPr/w:tabs)
+_SKIPPED = (MC + "Fallback", W + "pPr")
+
+DOCUMENT_PART = "word/document.xml"
+_HEADER_PART = re.compile(r"word/header\d*\.xml$")
+_FOOTER_PART = re.compile(r"word/footer\d*\.xml$")
+
+
+def iter_part_text(stream: IO[bytes]) -> Iterator[str]:
+    """Non-empty paragraph and table-cell texts of one WordprocessingML part, in document order."""
+    paragraphs: List[List[str]] = []  # Runs of the open paragraphs; text boxes nest a paragraph inside another
+    cells: List[List[str]] = []  # Paragraphs of the open table cells, innermost last
+    container = None
+    container_depth = 0
+    depth = 0
+    skipping = 0
+
+    for event, element in ET.iterparse(stream, events=("start", "end")):
+        tag = element.tag
+        if event == "start":
+            depth += 1
+            if skipping or tag in _SKIPPED:
+                skipping += 1
+            elif tag == _PARAGRAPH:
+                paragraphs.append([])
+            elif tag == _CELL:
+                cells.append([])
+            elif tag in _CONTAINERS:
+                container, container_depth = element, depth
+            continue
+
+        depth -= 1
+        if skipping:
+            skipping -= 1
+            continue
+        if tag == _TEXT:
+            if paragraphs and element.text:
+                paragraphs[-1].append(element.text)
+        elif tag == _TAB:
+            if paragraphs:
+                paragraphs[-1].append("\t")
+        elif tag in _BREAKS:
+            if paragraphs:
+                paragraphs[-1].append("\n")
+        elif tag == _PARAGRAPH:
+            text = "".join(paragraphs.pop())
+            if cells:
+                cells[-1].append(text)
+            elif text.strip():
+                yield text
+        elif tag == _CELL:
+            text = "\n".join(paragraph for paragraph in cells.pop() if paragraph.strip())
+            if cells:
+                cells[-1].append(text)  # Cell of a table nested in another cell
+            elif text:
+                yield text
+
+        # A finished top-level block (paragraph, table, ...) has been read; free it
+        if container is not None and depth == container_depth:
+            container.clear()
+
+
+def iter_docx_text(file_path: str) -> Iterator[str]:
+    """
+    Paragraph and table-cell texts of a .docx: the headers first, then the
+    body in document order, then the footers. A header or footer text that
+    repeats across sections (first page, even pages, ...) is yielded once.
+    Raises zipfile.BadZipFile, KeyError (no word/document.xml) or
+    xml.etree.ElementTree.ParseError for files that are not valid DOCX.
+    """
+    with zipfile.ZipFile(file_path) as archive:
+        names = archive.namelist()
+        headers = sorted(name for name in names if _HEADER_PART.match(name))
+        footers = sorted(name for name in names if _FOOTER_PART.match(name))
+
+        def repeated_parts(parts: List[str]) -> Iterator[str]:
+            seen = set()
+            for name in parts:
+                with archive.open(name) as stream:
+                    for text in iter_part_text(stream):
+                        if text not in seen:
+                            seen.add(text)
+                            yield text
+
+        yield from repeated_parts(headers)
+        with archive.open(DOCUMENT_PART) as stream:
+            yield from iter_part_text(stream)
+        yield from repeated_parts(footers)
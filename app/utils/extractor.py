@@ -1,4 +1,11 @@
+import os
+import threading
+from typing import Iterable, Iterator
 import fitz  # PyMuPDF
+from app.config import EXTRACTED_TEXT_DIR
+from app.utils.metrics import span
+from app.utils.docx_stream import iter_docx_text
+from app.utils.text_stream import read_text
 
 def extract_text_from_pdf(file_path: str) -> str:
     full_text = []
@@ -8,12 +15,68 @@ def extract_text_from_pdf(file_path: str) -> str:
     return "\n".join(full_text)
 
 
-from docx import Document
-
 def extract_text_from_docx(file_path: str) -> str:
+    # Streams the XML out of the zip (see app/utils/docx_stream.py) instead of loading python-docx's object model
     try:
-        doc = Document(file_path)
-        full_text = [para.text for para in doc.paragraphs if para.text.strip()]
-        return "\n".join(full_text)
+        return "\n".join(iter_docx_text(file_path))
     except Exception as e:
         raise ValueError(f"Error while extracting DOCX: {str(e)}")
+
+
+@span("extract_text")
+def extract_text(file_path: str) -> str:
+    """Extract plain text from a PDF, DOCX or text file, dispatching on the extension."""
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension == ".pdf":
+        return extract_text_from_pdf(file_path)
+    if extension == ".docx":
+        return extract_text_from_docx(file_path)
+    return read_text(file_path)
+
+
+def is_plain_text(file_path: str) -> bool:
+    """Whether extract_text() treats the file as plain text (anything but PDF and DOCX)."""
+    return os.path.splitext(file_path)[1].lower() not in (".pdf", ".docx")
+
+
+
+def extracted_text_path(file_hash: str) -> str:
+    return os.path.join(EXTRACTED_TEXT_DIR, f"{file_hash}.txt")
+
+
+def cache_extracted_text(file_hash: str, text: str) -> str:
+    """Persist extracted text as EXTRACTED_TEXT_DIR/<file_hash>.txt (shared per content) and return the path."""
+    os.makedirs(EXTRACTED_TEXT_DIR, exist_ok=True)
+    text_path = extracted_text_path(file_hash)
+    tmp_path = f"{text_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, text_path)
+    return text_path
+
+
+def cache_extracted_text_stream(file_hash: str, blocks: Iterable[str]) -> Iterator[str]:
+    """
+    Pass `blocks` through while writing them to EXTRACTED_TEXT_DIR/<file_hash>.txt,
+    which appears only once the stream was read to the end.
+    """
+    os.makedirs(EXTRACTED_TEXT_DIR, exist_ok=True)
+    text_path = extracted_text_path(file_hash)
+    tmp_path = f"{text_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for block in blocks:
+                f.write(block)
+                yield block
+        os.replace(tmp_path, text_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def load_text(file_path: str, text_path: str = None) -> str:
+    """Return the cached extracted text if available, otherwise extract it from the original file."""
+    if text_path and os.path.exists(text_path):
+        with open(text_path, "r", encoding="utf-8") as f:
+            return f.read()
+    return extract_text(file_path)
@@ -0,0 +1,56 @@
+import os
+import shutil
+import logging
+from typing import Iterable, Iterator, List, Sequence, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Keep IN (...) lists well below SQLite's bound-parameter limit
+SQL_IN_BATCH_SIZE = 500
+
+
+def chunked(items: Sequence[T], size: int = SQL_IN_BATCH_SIZE) -> Iterator[Sequence[T]]:
+    """Yield consecutive slices of `items` with at most `size` elements."""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def unlink_files(paths: Iterable[str]) -> int:
+    """
+    Remove uploaded files in one batch, then prune per-user upload folders that
+    became empty. Meant to run as a background task after the DB rows are gone,
+    so a slow or failing filesystem never holds up the request.
+    Returns the number of files removed.
+    """
+    removed = 0
+    parent_dirs = set()
+    for path in paths:
+        if not path:
+            continue
+        try:
+            os.remove(path)
+            removed += 1
+            parent_dirs.add(os.path.dirname(path))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Could not remove file {path}: {str(e)}")
+
+    for directory in parent_dirs:
+        try:
+            if os.path.isdir(directory) and not os.listdir(directory):
+                os.rmdir(directory)
+        except OSError as e:
+            logger.warning(f"Could not remove directory {directory}: {str(e)}")
+
+    logger.info(f"Background cleanup removed {removed} file(s)")
+    return removed
+
+
+def remove_directories(directories: List[str]) -> None:
+    """Recursively remove directories (e.g. a deleted user's upload folder), ignoring missing ones."""
+    for directory in directories:
+        if os.path.isdir(directory):
+            shutil.rmtree(directory, ignore_errors=True)
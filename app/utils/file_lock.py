@@ -0,0 +1,58 @@
+"""
+Advisory file locks shared by the worker processes of one deployment.
+
+The OS drops the lock when its holder exits, so a crashed worker never
+leaves one behind. Uses fcntl.flock on POSIX and msvcrt.locking on Windows.
+"""
+import os
+from contextlib import contextmanager
+from typing import IO, Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+def _lock(handle: IO, blocking: bool) -> bool:
+    try:
+        if fcntl is not None:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        else:
+            handle.seek(0)  # msvcrt locks bytes from the current position
+            # LK_LOCK retries for ~10 seconds before failing; loop for a truly blocking lock
+            while True:
+                try:
+                    msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    if not blocking:
+                        raise
+        return True
+    except OSError:
+        return False
+
+
+def acquire_file_lock(path: str, blocking: bool = True) -> Optional[IO]:
+    """
+    Lock `path` (created if missing) and return its open handle, which holds
+    the lock until it is closed or the process exits. Returns None when
+    `blocking` is False and another process holds the lock.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    handle = open(path, "a+")
+    if not _lock(handle, blocking):
+        handle.close()
+        return None
+    return handle
+
+
+@contextmanager
+def file_lock(path: str) -> Iterator[None]:
+    """Hold an exclusive lock on `path` for the block, waiting for other processes first."""
+    handle = acquire_file_lock(path)
+    try:
+        yield
+    finally:
+        handle.close()
@@ -1,12 +1,18 @@
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_google_genai import ChatGoogleGenerativeAI
 from typing import List, Dict, Any, Optional, Tuple
 import os
+import re
 import time
+import threading
 import nltk
 from nltk.tokenize import sent_tokenize
 import logging
 
+from app.utils.metrics import span
+from app.utils.llm_usage import invoke_llm
+from app.utils.llm_providers import get_chat_model
+from app.models.chunk import chunk_hash
+
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -17,6 +23,60 @@ try:
 except LookupError:
     nltk.download('punkt')
 
+# Map units cut at content-defined boundaries: a unit ends after a paragraph whose hash is
+# divisible by this (once the unit holds a quarter of max_tokens_per_chunk), so an edit
+# only changes the units around it and the rest keep their cached map summaries
+MAP_UNIT_BOUNDARY_MODULUS = 8
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+# "### Excerpt 3" headings of per-excerpt map summaries
+_EXCERPT_HEADING = re.compile(r"^[ \t]*#{1,6}[ \t]*Excerpt[ \t]+(\d+)\b.*$", re.MULTILINE | re.IGNORECASE)
+
+
+def split_excerpt_summaries(response: str, count: int) -> Optional[List[str]]:
+    """
+    The per-excerpt summaries of a map response ("### Excerpt n" headings),
+    or None unless it has exactly excerpts 1..count in order, each non-empty.
+    """
+    headings = list(_EXCERPT_HEADING.finditer(response))
+    if [int(heading.group(1)) for heading in headings] != list(range(1, count + 1)):
+        return None
+    parts = []
+    for heading, following in zip(headings, headings[1:] + [None]):
+        part = response[heading.end():following.start() if following else len(response)].strip()
+        if not part:
+            return None
+        parts.append(part)
+    return parts
+
+
+class LLMBudgetExceeded(Exception):
+    """Raised when a shared LLMCallBudget has no calls left."""
+
+
+class LLMCallBudget:
+    """
+    A number of LLM calls that several summarizations share, e.g. every
+    document of one batch request running on the same user's API key.
+    Retries count too, since they consume quota just the same.
+    """
+
+    def __init__(self, max_calls: int):
+        self.max_calls = max_calls
+        self.used = 0
+        self._lock = threading.Lock()
+
+    @property
+    def remaining(self) -> int:
+        return max(self.max_calls - self.used, 0)
+
+    def spend(self) -> None:
+        """Take one call from the budget, or raise LLMBudgetExceeded."""
+        with self._lock:
+            if self.used >= self.max_calls:
+                raise LLMBudgetExceeded(f"LLM call budget of {self.max_calls} calls exhausted")
+            self.used += 1
+
+
 class HierarchicalSummarizer:
     """
     A hierarchical map-reduce summarizer for extremely large documents.
@@ -31,7 +91,9 @@ class HierarchicalSummarizer:
         chunk_overlap: int = 2000,
         max_retries: int = 3,
         retry_delay: int = 2,
-        api_key: Optional[str] = None # MODIFIED: api_key is now a required parameter
+        api_key: Optional[str] = None, # MODIFIED: api_key is now a required parameter
+        budget: Optional[LLMCallBudget] = None,
+        map_cache=None
     ):
         """
         Initialize the hierarchical summarizer.
@@ -44,6 +106,10 @@ class HierarchicalSummarizer:
             max_retries: Maximum number of retries for failed API calls
             retry_delay: Delay between retries in seconds
             api_key: Optional API key (if not provided, will use environment variables)
+            budget: Optional LLM call budget shared with other summarizations
+            map_cache: Optional store of map summaries by chunk hash (get(hashes) -> {hash: summary},
+                put({hash: (text, summary)})), e.g. ChunkMapCache; documents are then split at
+                content-defined boundaries and passages summarized before are not sent again
         """
         self.model_name = model_name
         self.temperature = temperature
@@ -51,15 +117,17 @@ class HierarchicalSummarizer:
         self.chunk_overlap = chunk_overlap
         self.max_retries = max_retries
         self.retry_delay = retry_delay
+        self.budget = budget
+        self.map_cache = map_cache
         
         # MODIFIED: Ensure API key is provided and use it directly
         if not api_key:
             raise ValueError("Gemini API key must be provided for HierarchicalSummarizer.")
         
-        self.llm = ChatGoogleGenerativeAI(
+        self.llm = get_chat_model(
             model=model_name,
-            google_api_key=api_key,
-            temperature=temperature
+            temperature=temperature,
+            api_key=api_key
         )
         
         # Initialize text splitter
@@ -115,6 +183,44 @@ class HierarchicalSummarizer:
         logger.info(f"Split document into {len(processed_chunks)} semantic chunks")
         return processed_chunks
     
+    def _split_into_map_units(self, text: str) -> List[Tuple[str, int]]:
+        """
+        Split text into map units at content-defined boundaries, so the same
+        passage yields the same unit in every document that contains it.
+        
+        Args:
+            text: The text to split
+            
+        Returns:
+            List of (unit, position) tuples, like _split_into_semantic_chunks
+        """
+        min_tokens = self.max_tokens_per_chunk // 4
+        units, current, size = [], [], 0
+        for paragraph in _PARAGRAPH_BREAK.split(text):
+            if not paragraph.strip():
+                continue
+            # Paragraphs longer than a unit are split on their own, which depends only on the paragraph
+            pieces = [paragraph] if self._count_tokens(paragraph) <= self.max_tokens_per_chunk else self.text_splitter.split_text(paragraph)
+            for piece in pieces:
+                tokens = self._count_tokens(piece)
+                if current and size + tokens > self.max_tokens_per_chunk:
+                    units.append("\n\n".join(current))
+                    current, size = [], 0
+                current.append(piece)
+                size += tokens
+                if size >= min_tokens and int(chunk_hash(piece)[:8], 16) % MAP_UNIT_BOUNDARY_MODULUS == 0:
+                    units.append("\n\n".join(current))
+                    current, size = [], 0
+        if current:
+            units.append("\n\n".join(current))
+        logger.info(f"Split document into {len(units)} map units")
+        return [(unit, position) for position, unit in enumerate(units)]
+    
+    def _split(self, text: str) -> List[Tuple[str, int]]:
+        if self.map_cache is not None:
+            return self._split_into_map_units(text)
+        return self._split_into_semantic_chunks(text)
+    
     def _create_chunk_batches(self, chunks: List[Tuple[str, int]], batch_size: int = 8) -> List[List[Tuple[str, int]]]:
         """
         Group chunks into batches for more efficient processing.
@@ -187,8 +293,10 @@ class HierarchicalSummarizer:
             Exception: If all retries fail
         """
         for attempt in range(self.max_retries):
+            if self.budget is not None:
+                self.budget.spend()  # LLMBudgetExceeded is not retried
             try:
-                response = self.llm.invoke(prompt)
+                response = invoke_llm(self.llm, prompt, "summarize")
                 return response.content
             except Exception as e:
                 logger.warning(f"API call failed (attempt {attempt+1}/{self.max_retries}): {str(e)}")
@@ -201,17 +309,21 @@ class HierarchicalSummarizer:
                     logger.error(f"All {self.max_retries} attempts failed")
                     raise
     
-    def _map_phase(self, batches: List[List[Tuple[str, int]]]) -> List[str]:
+    def _map_phase(self, batches: List[List[Tuple[str, int]]], last_position: Optional[int] = None, per_excerpt: bool = False) -> List[str]:
         """
         Map phase: Summarize each batch of chunks.
         
         Args:
             batches: List of batches, where each batch is a list of (chunk, position) tuples
+            last_position: Position of the document's last chunk (default: the last chunk of the last batch)
+            per_excerpt: Ask for a separate summary per chunk under "### Excerpt n" headings
             
         Returns:
             List of summaries, one per batch
         """
         batch_summaries = []
+        if last_position is None:
+            last_position = batches[-1][-1][1]
         
         for i, batch in enumerate(batches):
             logger.info(f"Processing batch {i+1}/{len(batches)}")
@@ -222,20 +334,31 @@ class HierarchicalSummarizer:
                 # Determine section name based on position in the document
                 if position == 0:
                     section_name = "Beginning Section"
-                elif position == batches[-1][-1][1]:  # Last chunk's position
+                elif position == last_position:  # Last chunk's position
                     section_name = "Ending Section"
                 else:
                     # Calculate approximate position in document
-                    relative_position = position / batches[-1][-1][1]
+                    relative_position = position / last_position
                     section_name = f"Section {position} (approx. {int(relative_position * 100)}% through document)"
                 
-                combined_text += f"\n\n--- {section_name} ---\n{chunk}\n"
+                if per_excerpt:
+                    combined_text += f"\n\n--- Excerpt {j+1}: {section_name} ---\n{chunk}\n"
+                else:
+                    combined_text += f"\n\n--- {section_name} ---\n{chunk}\n"
+            
+            if per_excerpt:
+                # Each excerpt's summary is stored on its own and reused by other documents containing it
+                instructions = f"""Summarize each of the {len(batch)} excerpts separately, in order. Start each summary with
+            a line "### Excerpt <n>" where <n> is the excerpt number, and write nothing before the first of these lines.
+            Focus on the main points, key information, and important details of that excerpt alone."""
+            else:
+                instructions = """Create a detailed summary of this section focusing on the main points, key information, and important details."""
             
             # Create a prompt for this batch
             prompt = f"""You are summarizing section {i+1} of {len(batches)} of a document.
             I've provided key excerpts from this section of the document.
             
-            Create a detailed summary of this section focusing on the main points, key information, and important details.
+            {instructions}
             Maintain the original tone and purpose of the content.
             Preserve important narrative elements, character development, and key plot points if this is a narrative text.
             
@@ -298,6 +421,63 @@ class HierarchicalSummarizer:
         
         return final_summary
     
+    def estimate_api_calls(self, text: str) -> int:
+        """
+        Number of LLM calls summarize() will make for this text (without retries).
+        
+        Args:
+            text: The document text to summarize
+            
+        Returns:
+            Map calls plus the reduce call, if any
+        """
+        batches = self._create_chunk_batches(self._split(text))
+        return len(batches) + (1 if len(batches) > 1 else 0)
+    
+    def _map_reduce_with_cache(self, chunks: List[Tuple[str, int]]) -> Tuple[str, int, int]:
+        """
+        Map phase over the chunks without a cached map summary only, then
+        reduce over cached and fresh summaries in document order.
+        
+        Args:
+            chunks: List of (chunk, position) tuples of the whole document
+            
+        Returns:
+            (final summary, number of chunks reused from the cache, LLM calls made)
+        """
+        hashes = [chunk_hash(chunk) for chunk, _ in chunks]
+        cached = self.map_cache.get(set(hashes))
+        sections = [(position, cached[digest]) for (_, position), digest in zip(chunks, hashes) if digest in cached]
+        reused = len(sections)
+        novel = [chunk for chunk, digest in zip(chunks, hashes) if digest not in cached]
+        logger.info(f"Map cache: {reused}/{len(chunks)} chunks already summarized")
+        
+        calls = 0
+        if novel:
+            batches = self._create_chunk_batches(novel)
+            with span("summarize_map"):
+                responses = self._map_phase(batches, last_position=chunks[-1][1], per_excerpt=True)
+            calls += len(batches)
+            fresh = {}
+            for batch, response in zip(batches, responses):
+                parts = split_excerpt_summaries(response, len(batch))
+                if parts is None:
+                    # The model ignored the excerpt headings: use the response as one section, cache nothing
+                    logger.warning("Map response has no per-excerpt summaries; not caching this batch")
+                    sections.append((batch[0][1], response))
+                    continue
+                for (chunk, position), part in zip(batch, parts):
+                    sections.append((position, part))
+                    fresh[chunk_hash(chunk)] = (chunk, part)
+            if fresh:
+                self.map_cache.put(fresh)
+        
+        sections.sort(key=lambda section: section[0])
+        with span("summarize_reduce"):
+            final_summary = self._reduce_phase([summary for _, summary in sections])
+        calls += 1 if len(sections) > 1 else 0
+        return final_summary, reused, calls
+    
     def summarize(self, text: str) -> Dict[str, Any]:
         """
         Summarize a document using the hierarchical map-reduce approach.
@@ -311,18 +491,34 @@ class HierarchicalSummarizer:
         logger.info("Starting hierarchical summarization process")
         
         # Step 1: Split the document into semantic chunks
-        chunks = self._split_into_semantic_chunks(text)
-        
-        # Step 2: Create batches of chunks
-        batches = self._create_chunk_batches(chunks)
+        with span("summarize_split"):
+            chunks = self._split(text)
+            
+            # Step 2: Create batches of chunks
+            batches = self._create_chunk_batches(chunks)
+        
+        # A single batch is one call either way; larger documents reuse cached map summaries
+        if self.map_cache is not None and len(batches) > 1:
+            final_summary, reused, calls = self._map_reduce_with_cache(chunks)
+            logger.info("Summarization complete")
+            return {
+                "summary": final_summary,
+                "sections_used": len(chunks),
+                "batches_used": len(batches),
+                "api_calls": calls,
+                "chunks_reused": reused,
+                "reuse_ratio": round(reused / len(chunks), 4),
+            }
         
         # Step 3: Map phase - summarize each batch
         logger.info(f"Starting map phase with {len(batches)} batches")
-        batch_summaries = self._map_phase(batches)
+        with span("summarize_map"):
+            batch_summaries = self._map_phase(batches)
         
         # Step 4: Reduce phase - combine all summaries
         logger.info("Starting reduce phase")
-        final_summary = self._reduce_phase(batch_summaries)
+        with span("summarize_reduce"):
+            final_summary = self._reduce_phase(batch_summaries)
         
         logger.info("Summarization complete")
         
@@ -330,5 +526,7 @@ class HierarchicalSummarizer:
             "summary": final_summary,
             "sections_used": len(chunks),
             "batches_used": len(batches),
-            "api_calls": len(batches) + (1 if len(batches) > 1 else 0)  # Map calls + reduce call
+            "api_calls": len(batches) + (1 if len(batches) > 1 else 0),  # Map calls + reduce call
+            "chunks_reused": 0,
+            "reuse_ratio": 0.0,
         }
\ No newline at end of file
@@ -0,0 +1,125 @@
+"""
+Chat model backends, selected with LLM_PROVIDER.
+
+gemini: ChatGoogleGenerativeAI with the user's own API key (the default).
+stub:   StubChatModel, a local model for load testing and profiling the ask
+        and summarize pipelines offline. Replies are a pure function of the
+        prompt, latency and token throughput are simulated, and a share of
+        the calls can fail with the same 429 (ResourceExhausted) Gemini
+        raises, so the rate-limit paths get exercised too. API keys are not
+        checked against Google while it is active.
+
+Both return LangChain chat models, so callers only ever use .invoke().
+"""
+import re
+import random
+import hashlib
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import google.api_core.exceptions as gcp_exceptions
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_google_genai import ChatGoogleGenerativeAI
+
+from app.config import (
+    LLM_PROVIDER, LLM_STUB_LATENCY_SECONDS, LLM_STUB_TOKENS_PER_SECOND, LLM_STUB_REPLY_TOKENS,
+    LLM_STUB_ERROR_RATE, LLM_STUB_SEED,
+)
+
+# Failures are drawn from one seeded sequence, so a run with the same call order fails the same calls
+_error_lock = threading.Lock()
+_error_random = random.Random(LLM_STUB_SEED)
+
+
+_EXCERPT_MARKER = re.compile(r"^--- Excerpt (\d+):.*$", re.MULTILINE)
+
+
+class StubChatModel(BaseChatModel):
+    """Deterministic offline chat model with simulated latency, throughput and 429s."""
+
+    model: str = "stub"
+    latency_seconds: float = 0.0  # Fixed per-call delay (network round trip, time to first token)
+    tokens_per_second: float = 0.0  # Generation speed; 0 returns the whole reply at once
+    reply_tokens: int = 120
+    error_rate: float = 0.0  # Share of calls that raise ResourceExhausted
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def _words(self, text: str, count: int) -> str:
+        # Words of the text itself, picked by a hash of it
+        words = text.split() or ["empty"]
+        seed = int(hashlib.sha256(text.encode("utf-8")).hexdigest(), 16)
+        return " ".join(words[(seed >> (i % 64)) % len(words)] for i in range(count))
+
+    def _reply(self, prompt: str) -> str:
+        # Per-excerpt map prompts (HierarchicalSummarizer) get one "### Excerpt n" section per excerpt
+        excerpts = _EXCERPT_MARKER.split(prompt)[1:]
+        if excerpts:
+            count = len(excerpts) // 2
+            return "\n\n".join(
+                f"### Excerpt {number}\n{self._words(text, max(1, self.reply_tokens // count))}"
+                for number, text in zip(excerpts[0::2], excerpts[1::2])
+            )
+        return self._words(prompt, self.reply_tokens)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        prompt = "\n".join(str(message.content) for message in messages)
+        self.calls += 1
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        if self.error_rate:
+            with _error_lock:
+                failed = _error_random.random() < self.error_rate
+            if failed:
+                raise gcp_exceptions.ResourceExhausted("Resource has been exhausted (simulated by the stub LLM provider)")
+
+        reply = self._reply(prompt)
+        if self.tokens_per_second:
+            time.sleep(self.reply_tokens / self.tokens_per_second)
+        message = AIMessage(
+            content=reply,
+            usage_metadata={
+                "input_tokens": len(prompt) // 4,
+                "output_tokens": self.reply_tokens,
+                "total_tokens": len(prompt) // 4 + self.reply_tokens,
+            }
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+def _gemini(model: str, temperature: float, api_key: str) -> BaseChatModel:
+    return ChatGoogleGenerativeAI(model=model, temperature=temperature, google_api_key=api_key)
+
+
+def _stub(model: str, temperature: float, api_key: str) -> BaseChatModel:
+    return StubChatModel(
+        latency_seconds=LLM_STUB_LATENCY_SECONDS,
+        tokens_per_second=LLM_STUB_TOKENS_PER_SECOND,
+        reply_tokens=LLM_STUB_REPLY_TOKENS,
+        error_rate=LLM_STUB_ERROR_RATE,
+    )
+
+
+LLM_PROVIDERS: Dict[str, Callable[[str, float, str], BaseChatModel]] = {
+    "gemini": _gemini,
+    "stub": _stub,
+}
+
+
+def get_chat_model(model: str, temperature: float, api_key: str) -> BaseChatModel:
+    """Chat model from the configured provider. Raises ValueError for an unknown LLM_PROVIDER."""
+    factory = LLM_PROVIDERS.get(LLM_PROVIDER)
+    if factory is None:
+        raise ValueError(f"Unknown LLM_PROVIDER: {LLM_PROVIDER} (expected one of {', '.join(LLM_PROVIDERS)})")
+    return factory(model, temperature, api_key)
+
+
+def validates_api_keys() -> bool:
+    """Whether user API keys must be checked against the provider (not for the local stub)."""
+    return LLM_PROVIDER == "gemini"
@@ -0,0 +1,94 @@
+"""
+Accounting for every LLM call.
+
+All LLM calls go through invoke_llm(), which times the call, reads the
+prompt/completion token counts the provider reports (usage_metadata on the
+returned message; len // 4 estimates when there is none), counts it in the
+metrics, and, inside an llm_usage_scope(user_id), appends it to the
+LLMUsage table with the route and operation it belongs to. Recording is
+best effort: a failed write is logged and never fails the request.
+"""
+import time
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator, Optional, Tuple
+from uuid import UUID
+
+from sqlmodel import Session
+
+from app.database import engine
+from app.models.llm_usage import record_llm_usage
+from app.utils.metrics import current_route, record_llm_call
+
+logger = logging.getLogger(__name__)
+
+# User the LLM calls in the current request are billed to
+_usage_user: ContextVar[Optional[UUID]] = ContextVar("llm_usage_user", default=None)
+
+
+@contextmanager
+def llm_usage_scope(user_id: UUID) -> Iterator[None]:
+    """Attribute LLM calls made inside the block (and in threads started from it) to `user_id`."""
+    token = _usage_user.set(user_id)
+    try:
+        yield
+    finally:
+        _usage_user.reset(token)
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4
+
+
+def model_name(llm: Any) -> str:
+    name = getattr(llm, "model", None) or getattr(llm, "model_name", None) or type(llm).__name__
+    return str(name).removeprefix("models/")
+
+
+def _token_counts(prompt: str, response: Any) -> Tuple[int, int, bool]:
+    """(prompt tokens, completion tokens, estimated?) for one response."""
+    usage = getattr(response, "usage_metadata", None) or {}
+    if usage.get("input_tokens") or usage.get("output_tokens"):
+        return int(usage.get("input_tokens") or 0), int(usage.get("output_tokens") or 0), False
+    content = getattr(response, "content", response)
+    return estimate_tokens(prompt), estimate_tokens(content if isinstance(content, str) else str(content)), True
+
+
+def _record(llm: Any, operation: str, prompt: str, response: Any, latency_ms: float, error: Optional[BaseException]) -> None:
+    record_llm_call(operation, error)
+    user_id = _usage_user.get()
+    if user_id is None:
+        return
+    if error is None:
+        prompt_tokens, completion_tokens, estimated = _token_counts(prompt, response)
+    else:
+        prompt_tokens, completion_tokens, estimated = estimate_tokens(prompt), 0, True
+    try:
+        with Session(engine) as db:
+            record_llm_usage(db, {
+                "user_id": user_id,
+                "endpoint": current_route(),
+                "operation": operation,
+                "model": model_name(llm),
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "tokens_estimated": estimated,
+                "latency_ms": round(latency_ms, 1),
+                "success": error is None,
+            })
+            db.commit()
+    except Exception as e:
+        logger.warning(f"Could not record LLM usage: {str(e)}")
+
+
+def invoke_llm(llm: Any, prompt: str, operation: str) -> Any:
+    """llm.invoke(prompt), counted and recorded; the response (or exception) is passed through unchanged."""
+    started = time.perf_counter()
+    try:
+        response = llm.invoke(prompt)
+    except Exception as e:
+        _record(llm, operation, prompt, None, (time.perf_counter() - started) * 1000, e)
+        raise
+    _record(llm, operation, prompt, response, (time.perf_counter() - started) * 1000, None)
+    return response
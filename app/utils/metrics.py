@@ -0,0 +1,412 @@
+"""
+In-process metrics in the Prometheus text exposition format.
+
+A small registry of counters, gauges and histograms (no extra dependency),
+served by GET /metrics. MetricsMiddleware records per-route request latency
+and keeps the request scope in a context variable; the router writes the
+matched route into that scope, so timing spans deeper in the call stack
+(store loading, query rewriting, retrieval, answer generation, extraction,
+summarizer phases) are labelled with the template of the route that
+triggered them. Context variables follow asyncio.to_thread and FastAPI's
+threadpool for sync endpoints; jobs on the vectorization process pool show
+up as queue depth in the parent.
+
+Every worker process keeps its own registry. With several uvicorn workers
+(WEB_CONCURRENCY > 1) each one also writes a snapshot of it to METRICS_DIR
+every METRICS_FLUSH_SECONDS, and /metrics serves the sum over all workers of
+the running server: whichever worker answers, counters never go backwards.
+Snapshots of workers that exited keep their counters and histograms; their
+gauges are left out.
+"""
+import glob
+import json
+import os
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from app.config import METRICS_DIR, METRICS_FLUSH_SECONDS, METRICS_MULTIPROCESS
+
+# ASGI scope of the request being handled
+_current_scope: ContextVar[Optional[dict]] = ContextVar("current_scope", default=None)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def labels(self, **labels: str):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = self._new_child()
+            return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def empty_copy(self) -> "_Metric":
+        return type(self)(self.name, self.documentation, self.labelnames)
+
+    def snapshot(self) -> List[list]:
+        """[[label values, state], ...] of every child, JSON-serializable."""
+        with self._lock:
+            children = list(self._children.items())
+        return [[list(key), child.state()] for key, child in children]
+
+    def merge(self, snapshot: List[list]) -> None:
+        """Add another process' snapshot to this metric."""
+        for key, state in snapshot:
+            self.labels(**dict(zip(self.labelnames, key))).add_state(state)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            children = sorted(self._children.items())
+        for key, child in children:
+            lines.extend(child.samples(self.name, self.labelnames, key))
+        return lines
+
+
+class _Value:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float) -> None:
+        with self._lock:
+            self.value = value
+
+    def state(self) -> float:
+        return self.value
+
+    def add_state(self, state: float) -> None:
+        self.inc(state)
+
+    def samples(self, name: str, labelnames, key) -> List[str]:
+        return [f"{name}{_format_labels(labelnames, key)} {_format_number(self.value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+
+class _HistogramValue:
+    def __init__(self, buckets: Sequence[float]):
+        self._lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self.sum += value
+            self.count += 1
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+
+    def state(self) -> list:
+        with self._lock:
+            return [list(self.counts), self.sum, self.count]
+
+    def add_state(self, state: list) -> None:
+        counts, total, count = state
+        with self._lock:
+            self.counts = [mine + theirs for mine, theirs in zip(self.counts, counts)]
+            self.sum += total
+            self.count += count
+
+    def samples(self, name: str, labelnames, key) -> List[str]:
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            lines.append(f"{name}_bucket{_format_labels(labelnames, key, ('le', _format_number(bound)))} {cumulative}")
+        lines.append(f"{name}_bucket{_format_labels(labelnames, key, ('le', '+Inf'))} {count}")
+        lines.append(f"{name}_sum{_format_labels(labelnames, key)} {_format_number(total)}")
+        lines.append(f"{name}_count{_format_labels(labelnames, key)} {count}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def empty_copy(self) -> "Histogram":
+        return Histogram(self.name, self.documentation, self.labelnames, self.buckets)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "smartdoc_http_request_duration_seconds", "HTTP request latency.", ("method", "route", "status")
+))
+REQUESTS_IN_FLIGHT = REGISTRY.register(Gauge(
+    "smartdoc_http_requests_in_flight", "Requests currently being handled.", ("method",)
+))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "smartdoc_stage_duration_seconds", "Time spent in one pipeline stage.", ("route", "stage")
+))
+STAGE_ERRORS = REGISTRY.register(Counter(
+    "smartdoc_stage_errors_total", "Pipeline stages that raised.", ("route", "stage", "error")
+))
+LLM_CALLS = REGISTRY.register(Counter(
+    "smartdoc_llm_calls_total", "LLM calls, including retries.", ("route", "operation", "outcome")
+))
+SINGLE_FLIGHT = REGISTRY.register(Counter(
+    "smartdoc_single_flight_total", "Vectorize/summarize runs by role: leader did the work, follower waited for it.", ("operation", "role")
+))
+CHUNK_REUSE = REGISTRY.register(Counter(
+    "smartdoc_chunk_reuse_total", "Chunks of ingested documents that were already known (reused) or new.", ("stage", "outcome")
+))
+ANSWER_CACHE = REGISTRY.register(Counter(
+    "smartdoc_answer_cache_total", "/ask answer cache lookups: exact or similar hit, or miss.", ("outcome",)
+))
+CONTEXT_TOKENS = REGISTRY.register(Counter(
+    "smartdoc_context_tokens_total", "Estimated /ask context tokens: retrieved chunks as they were, and after packing.", ("stage",)
+))
+CHAT_STORE_PINS = REGISTRY.register(Counter(
+    "smartdoc_chat_store_pins_total", "Vector stores chat turns used: already pinned in the worker (hit) or loaded.", ("outcome",)
+))
+QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "smartdoc_queue_depth", "Jobs submitted to a worker queue and not finished yet.", ("queue",)
+))
+
+
+def _route_label(scope: Optional[dict]) -> str:
+    """Path template of the matched route; keeps label cardinality bounded."""
+    if scope is None:
+        return "-"
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+def current_route() -> str:
+    """Route template of the request being handled ("-" outside of a request)."""
+    return _route_label(_current_scope.get())
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """
+    Time a block (or, as a decorator, a function) into STAGE_SECONDS under
+    the current route; exceptions are counted in STAGE_ERRORS and re-raised.
+    """
+    route = current_route()
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        STAGE_ERRORS.labels(route=route, stage=stage, error=type(e).__name__).inc()
+        raise
+    finally:
+        STAGE_SECONDS.labels(route=route, stage=stage).observe(time.perf_counter() - started)
+
+
+def record_llm_call(operation: str, error: Optional[BaseException] = None) -> None:
+    """Count one LLM call attempt; quota errors (429 / ResourceExhausted) are kept apart from other failures."""
+    if error is None:
+        outcome = "ok"
+    elif type(error).__name__ in ("ResourceExhausted", "TooManyRequests"):
+        outcome = "rate_limited"
+    else:
+        outcome = "error"
+    LLM_CALLS.labels(route=current_route(), operation=operation, outcome=outcome).inc()
+
+
+@contextmanager
+def queued(queue: str, jobs: int = 1) -> Iterator[None]:
+    """Count `jobs` in QUEUE_DEPTH for the duration of the block."""
+    gauge = QUEUE_DEPTH.labels(queue=queue)
+    gauge.inc(jobs)
+    try:
+        yield
+    finally:
+        gauge.dec(jobs)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request latency and in-flight requests per route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        token = _current_scope.set(scope)
+        status = {"code": 500}
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        # The route is only known once the router has run, so in-flight
+        # requests are counted per method
+        in_flight = REQUESTS_IN_FLIGHT.labels(method=scope["method"])
+        in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            in_flight.dec()
+            REQUEST_SECONDS.labels(
+                method=scope["method"], route=_route_label(scope), status=status["code"]
+            ).observe(time.perf_counter() - started)
+            _current_scope.reset(token)
+
+
+def _snapshot_path(pid: int) -> str:
+    # Named after the uvicorn supervisor too, so snapshots of an earlier run of the server are not summed in
+    return os.path.join(METRICS_DIR, f"{os.getppid()}-{pid}.json")
+
+
+def write_snapshot() -> None:
+    """Publish this worker's registry to METRICS_DIR (atomically, readers never see half a file)."""
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    path = _snapshot_path(os.getpid())
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({metric.name: metric.snapshot() for metric in REGISTRY._metrics}, f)
+    os.replace(tmp_path, path)
+
+
+def _is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _read_snapshots() -> List[Tuple[bool, Dict[str, Any]]]:
+    """(worker still running, snapshot) of every worker of this server; removes snapshots of earlier runs."""
+    snapshots = []
+    for path in glob.glob(os.path.join(METRICS_DIR, "*-*.json")):
+        supervisor, pid = (int(part) for part in os.path.basename(path)[:-len(".json")].split("-"))
+        if supervisor != os.getppid():
+            if not _is_alive(supervisor):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            continue
+        try:
+            with open(path) as f:
+                snapshots.append((_is_alive(pid), json.load(f)))
+        except (OSError, ValueError):
+            continue  # Replaced or removed while being read
+    return snapshots
+
+
+def start_snapshot_writer(interval: int = METRICS_FLUSH_SECONDS) -> None:
+    """Write this worker's snapshot every `interval` seconds on a daemon thread (multi-worker mode only)."""
+    if not METRICS_MULTIPROCESS:
+        return
+    write_snapshot()
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                write_snapshot()
+            except OSError:
+                pass
+
+    threading.Thread(target=loop, name="metrics-snapshot", daemon=True).start()
+
+
+def render_metrics() -> str:
+    if not METRICS_MULTIPROCESS:
+        return REGISTRY.render()
+    # Own values fresh, the other workers' as of their last snapshot
+    write_snapshot()
+    merged = Registry()
+    metrics = {metric.name: merged.register(metric.empty_copy()) for metric in REGISTRY._metrics}
+    for alive, snapshot in _read_snapshots():
+        for name, children in snapshot.items():
+            metric = metrics.get(name)
+            # Gauges describe the present: an exited worker has nothing in flight or queued
+            if metric is None or (isinstance(metric, Gauge) and not alive):
+                continue
+            metric.merge(children)
+    return merged.render()
@@ -0,0 +1,32 @@
+import base64
+import json
+from datetime import datetime
+from typing import Optional, Tuple
+from uuid import UUID
+
+
+def encode_cursor(timestamp: datetime, row_id: UUID) -> str:
+    """Encode a keyset position (sort timestamp + tie-breaking id) as an opaque URL-safe token."""
+    payload = json.dumps({"t": timestamp.isoformat(), "id": str(row_id)})
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, UUID]:
+    """Inverse of encode_cursor. Raises ValueError for malformed tokens."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return datetime.fromisoformat(payload["t"]), UUID(payload["id"])
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {str(e)}")
+
+
+def parse_fields(fields: Optional[str], allowed: set, default: set) -> set:
+    """Parse a comma separated `fields=` projection. Raises ValueError on unknown names."""
+    if not fields:
+        return set(default)
+    requested = {f.strip() for f in fields.split(",") if f.strip()}
+    unknown = requested - allowed
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return requested
@@ -1,13 +1,18 @@
 import os
+import heapq
 import logging
 import joblib
 import numpy as np
-from typing import Tuple, List, Dict, Any
+from typing import Tuple, List, Dict, Any, Hashable
 from sklearn.metrics.pairwise import cosine_similarity
-from app.config import VECTOR_STORE_DIR, TOP_K_CHUNKS
-from langchain.chains import RetrievalQA
+from app.config import VECTOR_STORE_DIR, TOP_K_CHUNKS, RETRIEVAL_MODE, HYBRID_DENSE_WEIGHT
+from app.utils.vectorizer import LSA_COMPONENTS_FILE, LSA_EMBEDDINGS_FILE, CHUNK_OFFSETS_FILE
+from app.utils.compact_store import CompactTfidfIndex, read_manifest
+from app.utils.metrics import span
+from app.utils.llm_usage import invoke_llm
+from app.utils.context_packer import pack_context
 from langchain.prompts import PromptTemplate
-from langchain_google_genai import ChatGoogleGenerativeAI
+from app.utils.llm_providers import get_chat_model
 
 logger = logging.getLogger(__name__)
 
@@ -26,61 +31,139 @@ Rules:
 - Be precise and concise.
 """)
 
+QA_MODEL = "gemini-1.5-flash-latest"
+
 def get_llm(api_key: str) -> Any:
     """
-    Initializes and returns a ChatGoogleGenerativeAI instance with the provided API key.
+    Initializes and returns the chat model of the configured LLM_PROVIDER with the provided API key.
     """
     if not api_key:
         raise ValueError("API key must be provided to initialize the LLM.")
-    return ChatGoogleGenerativeAI(
-        model="gemini-1.5-flash-latest",
+    return get_chat_model(
+        model=QA_MODEL,
         temperature=0.3,
-        google_api_key=api_key # Use the provided api_key
+        api_key=api_key # Use the provided api_key
     )
 
-def build_qa_chain(llm, context: str) -> RetrievalQA:
-    """Builds a RetrievalQA chain with injected context."""
-    from langchain.chains import LLMChain
-    from langchain_core.prompts import PromptTemplate as CorePromptTemplate
-    from langchain_core.language_models.chat_models import BaseChatModel
-    from langchain_core.runnables import RunnableLambda
-    prompt = CorePromptTemplate.from_template(QA_PROMPT.template)
-    return LLMChain(prompt=prompt, llm=llm)
-
+@span("load_vector_store")
 def load_vector_store(vector_store_path: str) -> Dict[str, Any]:
-    """Loads TF-IDF vectorizer, matrix, and chunk list from disk."""
+    """Loads TF-IDF vectorizer, matrix, and chunk list from disk (classic pickles or a compact store)."""
     try:
-        vectorizer = joblib.load(os.path.join(vector_store_path, "vectorizer.pkl"))
-        matrix = joblib.load(os.path.join(vector_store_path, "matrix.pkl"))
         chunks = joblib.load(os.path.join(vector_store_path, "chunks.pkl"))
-        return {
-            "vectorizer": vectorizer,
-            "matrix": matrix,
-            "chunks": chunks
-        }
+        if read_manifest(vector_store_path):
+            # Compact store: the index transforms queries like the vectorizer would
+            index = CompactTfidfIndex.load(vector_store_path)
+            vector_store = {"vectorizer": index, "matrix": index.matrix, "index": index, "chunks": chunks}
+        else:
+            vector_store = {
+                "vectorizer": joblib.load(os.path.join(vector_store_path, "vectorizer.pkl")),
+                "matrix": joblib.load(os.path.join(vector_store_path, "matrix.pkl")),
+                "chunks": chunks
+            }
+        # Optional latent semantic index (only written when BUILD_LSA_INDEX is on)
+        components_path = os.path.join(vector_store_path, LSA_COMPONENTS_FILE)
+        if os.path.exists(components_path):
+            vector_store["lsa_components"] = np.load(components_path)
+            vector_store["lsa_embeddings"] = np.load(os.path.join(vector_store_path, LSA_EMBEDDINGS_FILE))
+        # Chunk offsets in the extracted text (stores vectorized before they were recorded have none)
+        offsets_path = os.path.join(vector_store_path, CHUNK_OFFSETS_FILE)
+        if os.path.exists(offsets_path):
+            vector_store["offsets"] = np.load(offsets_path)
+        return vector_store
     except Exception as e:
         logger.error(f"Failed to load vector store from {vector_store_path}: {str(e)}")
         raise FileNotFoundError("Vector store files not found or corrupted.")
 
-def retrieve_top_k_chunks(vector_store: Dict[str, Any], question: str, k: int = TOP_K_CHUNKS) -> List[str]:
-    """Uses TF-IDF + cosine similarity to retrieve top-k most relevant chunks."""
-    vectorizer = vector_store["vectorizer"]
-    matrix = vector_store["matrix"]
+def _sparse_scores(vector_store: Dict[str, Any], query_vector) -> np.ndarray:
+    if "index" in vector_store:
+        return vector_store["index"].similarities(query_vector)
+    return cosine_similarity(query_vector, vector_store["matrix"]).flatten()
+
+def score_chunks(vector_store: Dict[str, Any], question: str, mode: str = RETRIEVAL_MODE) -> np.ndarray:
+    """
+    Relevance of every chunk to the question, in [0, 1].
+
+    sparse: TF-IDF cosine similarity.
+    dense:  cosine similarity in the LSA space (one matrix-vector product
+            against the normalized float32 chunk embeddings).
+    hybrid: HYBRID_DENSE_WEIGHT * dense + (1 - HYBRID_DENSE_WEIGHT) * sparse.
+    Stores without an LSA index are always scored sparse.
+    """
+    query_vector = vector_store["vectorizer"].transform([question])
+    if mode == "sparse" or "lsa_embeddings" not in vector_store:
+        return _sparse_scores(vector_store, query_vector)
+
+    query_embedding = np.asarray(query_vector @ vector_store["lsa_components"].T, dtype=np.float32).ravel()
+    norm = np.linalg.norm(query_embedding)
+    if norm == 0:
+        dense = np.zeros(len(vector_store["chunks"]), dtype=np.float32)
+    else:
+        dense = np.clip(vector_store["lsa_embeddings"] @ (query_embedding / norm), 0.0, 1.0)
+    if mode == "dense":
+        return dense
+    sparse = _sparse_scores(vector_store, query_vector)
+    return HYBRID_DENSE_WEIGHT * dense + (1 - HYBRID_DENSE_WEIGHT) * sparse
+
+def score_top_k(vector_store: Dict[str, Any], question: str, k: int = TOP_K_CHUNKS, mode: str = RETRIEVAL_MODE) -> List[Tuple[float, int]]:
+    """(score, chunk index) of the k best chunks of one store, best first."""
+    similarities = score_chunks(vector_store, question, mode)
+    if k < len(similarities):
+        top_indices = np.argpartition(similarities, -k)[-k:]
+        top_indices = top_indices[np.argsort(similarities[top_indices])[::-1]]
+    else:
+        top_indices = np.argsort(similarities)[::-1]
+    return [(float(similarities[i]), int(i)) for i in top_indices]
+
+@span("retrieve_top_k_chunks")
+def retrieve_top_k_chunks(vector_store: Dict[str, Any], question: str, k: int = TOP_K_CHUNKS, mode: str = RETRIEVAL_MODE) -> List[str]:
+    """Retrieve the top-k most relevant chunks (TF-IDF, LSA or hybrid scoring, see score_chunks)."""
     chunks = vector_store["chunks"]
+    return [chunks[i] for _, i in score_top_k(vector_store, question, k, mode)]
 
-    query_vector = vectorizer.transform([question])
-    similarities = cosine_similarity(query_vector, matrix).flatten()
-    top_indices = np.argsort(similarities)[::-1][:k]
-    top_chunks = [chunks[i] for i in top_indices]
-    return top_chunks
+@span("retrieve_packed_context")
+def retrieve_packed_context(
+    vector_store: Dict[str, Any], question: str, k: int = TOP_K_CHUNKS, mode: str = RETRIEVAL_MODE
+) -> Tuple[List[str], Dict[str, Any]]:
+    """
+    The top-k chunks packed for the prompt (deduplicated, overlapping chunks
+    merged, trimmed to the token budget, see app/utils/context_packer.py):
+    (passages best first, packing report). Retrieval and packing are also
+    timed apart, as retrieve_top_k_chunks and pack_context.
+    """
+    chunks = vector_store["chunks"]
+    with span("retrieve_top_k_chunks"):
+        hits = [(score, None, index, chunks[index]) for score, index in score_top_k(vector_store, question, k, mode)]
+    with span("pack_context"):
+        passages, report = pack_context(hits, question, {None: vector_store.get("offsets")})
+    return [passage["text"] for passage in passages], report
+
+@span("retrieve_top_k_across")
+def retrieve_top_k_across(
+    vector_stores: Dict[Hashable, Dict[str, Any]], question: str, k: int = TOP_K_CHUNKS
+) -> List[Tuple[float, Hashable, int, str]]:
+    """
+    Global top-k over several stores: each store contributes its own top k,
+    then heapq merges them into (score, store key, chunk index, chunk) tuples,
+    best first. Every store has its own vocabulary and IDF weights, but
+    cosine similarities are all in [0, 1], which is close enough to rank
+    candidates from different documents together.
+    """
+    candidates = (
+        (score, key, index)
+        for key, store in vector_stores.items()
+        for score, index in score_top_k(store, question, k)
+    )
+    best = heapq.nlargest(k, candidates, key=lambda candidate: candidate[0])
+    return [(score, key, index, vector_stores[key]["chunks"][index]) for score, key, index in best]
 
+@span("run_qa_chain")
 def run_qa_chain(llm: Any, question: str, context_chunks: List[str]) -> Tuple[str, List[Dict[str, str]]]:
     try:
         context = "\n\n".join(context_chunks)
-        qa_chain = build_qa_chain(llm, context)
-        response = qa_chain.invoke({"question": question, "context": context})
+        # Invoked directly (not through a chain) so the message keeps its token usage
+        response = invoke_llm(llm, QA_PROMPT.format(context=context, question=question), "answer")
 
-        answer = response.get("text", "").strip() or response.get("result", "").strip()
+        answer = (response.content if hasattr(response, "content") else str(response)).strip()
         if not answer:
             raise ValueError("Empty response from LLM")
 
@@ -94,6 +177,7 @@ def run_qa_chain(llm: Any, question: str, context_chunks: List[str]) -> Tuple[st
         logger.error(f"QA chain failed: {str(e)}")
         raise RuntimeError(f"QA processing error: {str(e)}")
 
+@span("rewrite_queries")
 def rewrite_queries(llm, original_question: str, num_rephrasals: int = 4) -> list[str]:
     prompt = f"""
     Rephrase the following question to optimize for document retrieval.
@@ -111,7 +195,7 @@ def rewrite_queries(llm, original_question: str, num_rephrasals: int = 4) -> lis
     """
 
     try:
-        response = llm.invoke(prompt)
+        response = invoke_llm(llm, prompt, "rewrite")
         text = response.content.strip() if hasattr(response, "content") else response
         rephrased_questions = []
 
@@ -0,0 +1,129 @@
+"""
+Single-flight execution of per-content work (vectorize, summarize).
+
+Two requests for the same (operation, file_hash) must not both do the full
+extraction / LLM work. run_once() coalesces them at two levels:
+
+- In the process: the first caller becomes the leader and registers a
+  Future; later callers wait on it and get the leader's result (or its
+  exception) without doing anything.
+- Across worker processes: the leader takes an OperationLease row first. A
+  worker that finds the lease held polls until it is released, then asks
+  `already_done()` whether the other worker's result is in the database.
+  The lease is renewed while the work runs; one whose holder died simply
+  expires and is taken over.
+
+`work()` must persist its outcome before returning (the lease is released
+right after), so another worker's `already_done()` can see it.
+"""
+import os
+import time
+import socket
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional, Tuple, TypeVar
+from uuid import uuid4
+
+from sqlmodel import Session
+
+from app.config import SINGLE_FLIGHT_LEASE_SECONDS, SINGLE_FLIGHT_WAIT_SECONDS
+from app.database import engine
+from app.models.operation_lease import acquire_lease, renew_lease, release_lease
+from app.utils.metrics import SINGLE_FLIGHT
+
+T = TypeVar("T")
+
+LEASE_POLL_SECONDS = 0.5
+
+_inflight: Dict[Tuple[str, str], Future] = {}
+_inflight_lock = threading.Lock()
+
+
+class SingleFlightTimeout(Exception):
+    """The same work is still running elsewhere after SINGLE_FLIGHT_WAIT_SECONDS."""
+
+
+@contextmanager
+def _keep_lease(operation: str, file_hash: str, owner: str) -> Iterator[None]:
+    """Renew the lease in the background until the block exits."""
+    stop = threading.Event()
+
+    def renew():
+        while not stop.wait(SINGLE_FLIGHT_LEASE_SECONDS / 3):
+            with Session(engine) as db:
+                renew_lease(db, operation, file_hash, owner, SINGLE_FLIGHT_LEASE_SECONDS)
+
+    thread = threading.Thread(target=renew, name=f"lease-{operation}-{file_hash[:8]}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def _run_under_lease(
+    operation: str, file_hash: str, work: Callable[[], T], already_done: Optional[Callable[[], Optional[T]]]
+) -> Tuple[T, bool]:
+    owner = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex}"
+    deadline = time.monotonic() + SINGLE_FLIGHT_WAIT_SECONDS
+    while True:
+        with Session(engine) as db:
+            if acquire_lease(db, operation, file_hash, owner, SINGLE_FLIGHT_LEASE_SECONDS):
+                break
+        if time.monotonic() > deadline:
+            raise SingleFlightTimeout(f"{operation} of this document is still in progress, try again later")
+        time.sleep(LEASE_POLL_SECONDS)
+    try:
+        # Another worker may have finished between the caller's check and our lease
+        if already_done is not None:
+            result = already_done()
+            if result is not None:
+                SINGLE_FLIGHT.labels(operation=operation, role="done_elsewhere").inc()
+                return result, False
+        SINGLE_FLIGHT.labels(operation=operation, role="leader").inc()
+        with _keep_lease(operation, file_hash, owner):
+            return work(), True
+    finally:
+        with Session(engine) as db:
+            release_lease(db, operation, file_hash, owner)
+
+
+def run_once(
+    operation: str,
+    file_hash: str,
+    work: Callable[[], T],
+    already_done: Optional[Callable[[], Optional[T]]] = None,
+) -> Tuple[T, bool]:
+    """
+    Run `work()` unless the same (operation, file_hash) is already running,
+    in which case wait for that run instead. Returns (result, did_the_work).
+    `already_done()` returns the stored result when another worker completed
+    the work, else None. Blocking: call it from a thread, not the event loop.
+    Raises SingleFlightTimeout after SINGLE_FLIGHT_WAIT_SECONDS of waiting.
+    """
+    key = (operation, file_hash)
+    with _inflight_lock:
+        future = _inflight.get(key)
+        leader = future is None
+        if leader:
+            future = _inflight[key] = Future()
+
+    if not leader:
+        SINGLE_FLIGHT.labels(operation=operation, role="follower").inc()
+        try:
+            return future.result(timeout=SINGLE_FLIGHT_WAIT_SECONDS), False
+        except FutureTimeoutError:
+            raise SingleFlightTimeout(f"{operation} of this document is still in progress, try again later")
+
+    try:
+        result, did_work = _run_under_lease(operation, file_hash, work, already_done)
+        future.set_result(result)
+        return result, did_work
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
@@ -0,0 +1,81 @@
+"""
+Streaming reader for plain-text uploads (logs, transcripts, exports).
+
+The file is memory-mapped and decoded block by block with an incremental
+decoder, so a multi-hundred-MB upload is never held as bytes and text at
+the same time, and the chunking pipeline can consume it as it is decoded.
+The encoding is detected from a sample at the start of the file: a BOM,
+else UTF-8 if the sample is valid UTF-8, else charset_normalizer's best
+guess. Line endings are normalized to "\\n" as in text-mode open().
+"""
+import io
+import mmap
+import codecs
+from typing import Iterator, Optional
+
+from charset_normalizer import from_bytes
+
+SAMPLE_BYTES = 64 * 1024
+BLOCK_BYTES = 1024 * 1024
+PREFERRED_LEGACY_ENCODING = "cp1252"
+
+# Longest first: the UTF-32 LE BOM starts with the UTF-16 LE one
+_BOMS = (
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+
+def detect_encoding(sample: bytes) -> str:
+    """
+    Encoding of a file from its first bytes. Raises ValueError("Unsupported
+    file type") when the sample does not look like text at all.
+    """
+    for bom, encoding in _BOMS:
+        if sample.startswith(bom):
+            return encoding
+    try:
+        # final=False: a multi-byte character cut off at the end of the sample is fine
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+    matches = from_bytes(sample)
+    best = matches.best()
+    if best is None:
+        raise ValueError("Unsupported file type")
+    # Single-byte code pages often tie on a sample; Windows-1252 is by far the most common of them
+    tied = {match.encoding for match in matches if (match.chaos, match.coherence) == (best.chaos, best.coherence)}
+    return PREFERRED_LEGACY_ENCODING if PREFERRED_LEGACY_ENCODING in tied else best.encoding
+
+
+def iter_text_blocks(file_path: str, encoding: Optional[str] = None, block_bytes: int = BLOCK_BYTES) -> Iterator[str]:
+    """
+    Decoded text of the file, one block (about `block_bytes` of input) at a
+    time. Undecodable bytes past the sample become U+FFFD instead of failing
+    the whole file. Raises ValueError for files that are not text.
+    """
+    with open(file_path, "rb") as f:
+        size = f.seek(0, io.SEEK_END)
+        if size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            encoding = encoding or detect_encoding(mapped[:SAMPLE_BYTES])
+            decoder = io.IncrementalNewlineDecoder(
+                codecs.getincrementaldecoder(encoding)(errors="replace"), translate=True
+            )
+            for start in range(0, size, block_bytes):
+                text = decoder.decode(mapped[start:start + block_bytes])
+                if text:
+                    yield text
+            tail = decoder.decode(b"", final=True)
+            if tail:
+                yield tail
+
+
+def read_text(file_path: str) -> str:
+    """Whole decoded text of a plain-text file (see iter_text_blocks)."""
+    return "".join(iter_text_blocks(file_path))
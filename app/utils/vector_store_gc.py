@@ -0,0 +1,343 @@
+"""
+Reference-counted garbage collection for per-content artifacts.
+
+Vector stores (VECTOR_STORE_DIR/<file_hash>), extracted text
+(EXTRACTED_TEXT_DIR/<file_hash>.txt) and Content rows are shared by every
+document with that hash, so they can only go once no Document references the
+hash any more. Instead of reference-counting on every delete path, the
+collector periodically computes the live hash set with a single query and
+sweeps whatever is not in it. A grace period protects artifacts that are
+still being written, or whose document row is being created right now.
+A hash whose Content row changed within the grace period is live as well,
+so its artifacts and its Content row always go in the same sweep: a
+Content row never claims a vector store or extracted text that is gone.
+Temporary directories of vector store builds (TEMP_PREFIX) that outlive the
+grace period belong to crashed builds and are swept as well. Stored chunks
+go with the last content listing them, once unused for CHUNK_RETENTION_DAYS.
+"""
+import os
+import shutil
+import threading
+import time
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from sqlmodel import Session, select
+
+from sqlalchemy import delete, exists, union
+
+from app.config import (
+    DB_DIR, VECTOR_STORE_DIR, EXTRACTED_TEXT_DIR, GC_GRACE_PERIOD_SECONDS, GC_INTERVAL_SECONDS,
+    TOMBSTONE_RETENTION_SECONDS, LLM_USAGE_RETENTION_DAYS, CHUNK_RETENTION_DAYS, ANSWER_CACHE_TTL_SECONDS,
+    CHAT_SESSION_TTL_SECONDS,
+)
+from app.database import engine
+from app.models.cached_answer import delete_expired_answers
+from app.models.chat_session import ChatSession
+from app.models.chunk import Chunk, ContentChunk
+from app.models.content import Content
+from app.models.document import Document
+from app.models.document_tombstone import DocumentTombstone
+from app.models.llm_usage import LLMUsage
+from app.models.operation_lease import OperationLease
+from app.utils.file_lock import acquire_file_lock
+from app.utils.vectorizer import TEMP_PREFIX
+
+logger = logging.getLogger(__name__)
+
+# (kind, directory) pairs. Every entry directly under a directory is named
+# after the file_hash it belongs to (an optional extension is ignored).
+ARTIFACT_ROOTS = [
+    ("vector_store", VECTOR_STORE_DIR),
+    ("extracted_text", EXTRACTED_TEXT_DIR),
+]
+
+_gc_lock = threading.Lock()
+_last_report: Optional[Dict[str, Any]] = None
+_scheduler_started = False
+
+# Held for life by the one worker process that runs the periodic sweep
+SCHEDULER_LOCK_PATH = os.path.join(DB_DIR, ".gc-scheduler.lock")
+_scheduler_lock = None
+
+
+def get_live_hashes(db: Session, file_hashes: Optional[Set[str]] = None, cutoff: Optional[datetime] = None) -> Set[str]:
+    """
+    File hashes still referenced by at least one document, plus those whose
+    Content row changed since `cutoff` (one query), optionally limited to
+    `file_hashes`.
+    """
+    documents = select(Document.file_hash).where(Document.file_hash.isnot(None))
+    contents = select(Content.file_hash).where(Content.updated_at >= cutoff) if cutoff is not None else None
+    if file_hashes is not None:
+        documents = documents.where(Document.file_hash.in_(list(file_hashes)))
+        if contents is not None:
+            contents = contents.where(Content.file_hash.in_(list(file_hashes)))
+    statement = documents.distinct() if contents is None else union(documents, contents)
+    return set(db.execute(statement).scalars())
+
+
+def _artifact_hash(entry_name: str) -> str:
+    return entry_name.split(".", 1)[0]
+
+
+def _path_size(path: str) -> int:
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _last_modified(path: str) -> float:
+    """Newest mtime of the entry or anything inside it."""
+    latest = os.path.getmtime(path)
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            for name in dirs + files:
+                try:
+                    latest = max(latest, os.path.getmtime(os.path.join(root, name)))
+                except OSError:
+                    pass
+    return latest
+
+
+def find_garbage(
+    db: Session,
+    grace_period: int = GC_GRACE_PERIOD_SECONDS,
+    file_hashes: Optional[Set[str]] = None,
+) -> Dict[str, Any]:
+    """
+    List unreferenced artifacts older than the grace period, without deleting
+    anything. `file_hashes` limits the sweep to those hashes (used right after
+    deletes); by default every artifact is considered.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=grace_period)
+    live_hashes = get_live_hashes(db, file_hashes, cutoff)
+    now = time.time()
+    candidates: List[Dict[str, Any]] = []
+    scanned = 0
+    skipped_recent = 0
+
+    for kind, root in ARTIFACT_ROOTS:
+        if not os.path.isdir(root):
+            continue
+        for entry in os.scandir(root):
+            temporary = entry.name.startswith(TEMP_PREFIX)
+            file_hash = None if temporary else _artifact_hash(entry.name)
+            if file_hashes is not None and (temporary or file_hash not in file_hashes):
+                continue
+            scanned += 1
+            if file_hash in live_hashes:
+                continue
+            try:
+                age = now - _last_modified(entry.path)
+            except FileNotFoundError:
+                continue
+            if age < grace_period:
+                skipped_recent += 1
+                continue
+            candidates.append({
+                "kind": f"{kind}_temp" if temporary else kind,
+                "file_hash": file_hash,
+                "path": entry.path,
+                "bytes": _path_size(entry.path),
+                "age_seconds": int(age),
+            })
+
+    # Content rows (summary, vectorization state) nobody references any more
+    orphan_statement = (
+        select(Content.file_hash)
+        .where(Content.updated_at < cutoff)
+        .where(~exists().where(Document.file_hash == Content.file_hash))
+    )
+    if file_hashes is not None:
+        orphan_statement = orphan_statement.where(Content.file_hash.in_(list(file_hashes)))
+    orphaned_content = list(db.exec(orphan_statement).all())
+
+    return {
+        "live_hashes": len(live_hashes),
+        "orphaned_content": orphaned_content,
+        "scanned": scanned,
+        "skipped_recent": skipped_recent,
+        "candidates": candidates,
+        "candidate_bytes": sum(c["bytes"] for c in candidates),
+        "grace_period_seconds": grace_period,
+    }
+
+
+def run_gc(
+    dry_run: bool = False,
+    grace_period: int = GC_GRACE_PERIOD_SECONDS,
+    file_hashes: Optional[Iterable[str]] = None,
+) -> Dict[str, Any]:
+    """
+    Sweep unreferenced artifacts and return a report with the bytes reclaimed.
+    Only one sweep runs at a time; a concurrent call returns {"status": "busy"}
+    and its hashes are picked up by the next periodic sweep.
+    """
+    if file_hashes is not None:
+        file_hashes = {h for h in file_hashes if h}
+        if not file_hashes:
+            return {"status": "ok", "dry_run": dry_run, "candidates": [], "removed": 0, "bytes_reclaimed": 0, "content_rows_removed": 0}
+    global _last_report
+    if not _gc_lock.acquire(blocking=False):
+        return {"status": "busy"}
+    try:
+        started_at = datetime.now(timezone.utc)
+        with Session(engine) as db:
+            report = find_garbage(db, grace_period, file_hashes)
+            candidates = report["candidates"]
+
+            if not dry_run and candidates:
+                # A document with one of these hashes may have been uploaded
+                # since the live set was computed; re-check just the candidates.
+                candidate_hashes = {c["file_hash"] for c in candidates if c["file_hash"]}
+                cutoff = datetime.now(timezone.utc) - timedelta(seconds=grace_period)
+                revived = get_live_hashes(db, candidate_hashes, cutoff)
+                candidates = [c for c in candidates if c["file_hash"] not in revived]
+
+            content_rows_removed = 0
+            if not dry_run and report["orphaned_content"]:
+                result = db.exec(
+                    delete(Content)
+                    .where(Content.file_hash.in_(report["orphaned_content"]))
+                    .where(~exists().where(Document.file_hash == Content.file_hash))
+                )
+                content_rows_removed = result.rowcount
+                # Chunk listings of the contents just removed
+                db.exec(
+                    delete(ContentChunk)
+                    .where(ContentChunk.file_hash.in_(report["orphaned_content"]))
+                    .where(~exists().where(Content.file_hash == ContentChunk.file_hash))
+                )
+                db.commit()
+
+            # Cached /ask answers past their TTL, and those of the contents just removed
+            answers_removed = 0
+            if not dry_run and (file_hashes is None or content_rows_removed):
+                answers_removed = delete_expired_answers(
+                    db, ANSWER_CACHE_TTL_SECONDS, report["orphaned_content"] if content_rows_removed else None
+                )
+                db.commit()
+
+            # Change-feed tombstones past retention (clients that far behind reload anyway)
+            tombstones_removed = 0
+            if not dry_run and file_hashes is None:
+                cutoff = datetime.now(timezone.utc) - timedelta(seconds=TOMBSTONE_RETENTION_SECONDS)
+                result = db.exec(delete(DocumentTombstone).where(DocumentTombstone.deleted_at < cutoff))
+                db.commit()
+                tombstones_removed = result.rowcount
+
+            # Single-flight leases whose holder died without releasing them
+            if not dry_run and file_hashes is None:
+                db.exec(delete(OperationLease).where(OperationLease.expires_at < datetime.now(timezone.utc)))
+                db.commit()
+
+            # Raw LLM call rows past retention (LLMUsageDaily keeps their totals)
+            usage_rows_removed = 0
+            if not dry_run and file_hashes is None:
+                cutoff = datetime.now(timezone.utc) - timedelta(days=LLM_USAGE_RETENTION_DAYS)
+                result = db.exec(delete(LLMUsage).where(LLMUsage.created_at < cutoff))
+                db.commit()
+                usage_rows_removed = result.rowcount
+
+            # Stored chunks no content lists and no summarization has reused for CHUNK_RETENTION_DAYS
+            chunks_removed = 0
+            if not dry_run and file_hashes is None:
+                cutoff = datetime.now(timezone.utc) - timedelta(days=CHUNK_RETENTION_DAYS)
+                result = db.exec(
+                    delete(Chunk)
+                    .where(Chunk.last_used_at < cutoff)
+                    .where(~exists().where(ContentChunk.chunk_hash == Chunk.chunk_hash))
+                )
+                db.commit()
+                chunks_removed = result.rowcount
+
+            # Chat sessions idle past their TTL, or whose document was deleted
+            chat_sessions_removed = 0
+            if not dry_run and file_hashes is None:
+                cutoff = datetime.now(timezone.utc) - timedelta(seconds=CHAT_SESSION_TTL_SECONDS)
+                result = db.exec(
+                    delete(ChatSession).where(
+                        (ChatSession.updated_at < cutoff) | ~exists().where(Document.id == ChatSession.document_id)
+                    )
+                )
+                db.commit()
+                chat_sessions_removed = result.rowcount
+
+        removed = 0
+        bytes_reclaimed = 0
+        if not dry_run:
+            for candidate in candidates:
+                try:
+                    if os.path.isdir(candidate["path"]):
+                        shutil.rmtree(candidate["path"])
+                    else:
+                        os.remove(candidate["path"])
+                    removed += 1
+                    bytes_reclaimed += candidate["bytes"]
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logger.warning(f"GC could not remove {candidate['path']}: {str(e)}")
+
+        report.update({
+            "status": "ok",
+            "dry_run": dry_run,
+            "candidates": candidates,
+            "removed": removed,
+            "bytes_reclaimed": bytes_reclaimed,
+            "content_rows_removed": content_rows_removed,
+            "tombstones_removed": tombstones_removed,
+            "usage_rows_removed": usage_rows_removed,
+            "chunks_removed": chunks_removed,
+            "answers_removed": answers_removed,
+            "chat_sessions_removed": chat_sessions_removed,
+            "started_at": started_at.isoformat(),
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+        })
+        if not dry_run:
+            if file_hashes is None:
+                _last_report = report
+            logger.info(f"GC removed {removed} artifact(s), reclaimed {bytes_reclaimed} bytes")
+        return report
+    finally:
+        _gc_lock.release()
+
+
+def get_last_report() -> Optional[Dict[str, Any]]:
+    return _last_report
+
+
+def start_gc_scheduler(interval: int = GC_INTERVAL_SECONDS) -> None:
+    """
+    Run run_gc() every `interval` seconds on a daemon thread (0 disables it).
+    Only one worker process schedules sweeps; when it exits its lock is
+    released and the next worker to start takes over.
+    """
+    global _scheduler_started, _scheduler_lock
+    if interval <= 0 or _scheduler_started:
+        return
+    _scheduler_lock = acquire_file_lock(SCHEDULER_LOCK_PATH, blocking=False)
+    if _scheduler_lock is None:
+        logger.info("Vector store GC is scheduled by another worker")
+        return
+    _scheduler_started = True
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                run_gc()
+            except Exception as e:
+                logger.error(f"Scheduled GC failed: {str(e)}", exc_info=True)
+
+    threading.Thread(target=loop, name="vector-store-gc", daemon=True).start()
+    logger.info(f"Vector store GC scheduled every {interval} seconds")
@@ -0,0 +1,399 @@
+"""
+Building the per-content TF-IDF vector store.
+
+build_vector_store() is a plain top-level function working only on paths, so
+it can run in a worker process: batch vectorization fans it out over a
+process pool, which keeps the CPU-bound extraction and TF-IDF fitting off
+the API process (and off the GIL).
+
+A store is written into a temporary directory next to its final location
+and renamed into place when complete, so readers never see a half-written
+store; leftovers of crashed builds are removed by the GC.
+
+A new version of an earlier document is diffed against the previous
+version's store chunk by chunk: unchanged chunks keep their TF-IDF rows (and
+LSA embeddings), and only the added ones are transformed with the previous
+fit, unless the edit brings in too many new terms (VECTOR_REFIT_DRIFT).
+"""
+import os
+import shutil
+import hashlib
+import tempfile
+from uuid import uuid4
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import joblib
+import numpy as np
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from scipy.sparse import csr_matrix, vstack
+from sklearn.decomposition import TruncatedSVD
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from app.config import (
+    VECTOR_STORE_DIR, VECTORIZE_WORKERS, BUILD_LSA_INDEX, LSA_COMPONENTS, VECTOR_STORE_FORMAT, VECTOR_REFIT_DRIFT,
+)
+from app.models.chunk import chunk_hash
+from app.utils.extractor import (
+    extract_text, cache_extracted_text, cache_extracted_text_stream, extracted_text_path, is_plain_text,
+)
+from app.utils.text_stream import iter_text_blocks
+from app.utils.compact_store import CompactTfidfIndex, COMPACT_FORMATS, read_manifest, sklearn_memory_bytes, pickled_size
+from app.utils.metrics import span
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 100
+# Plain text is chunked as it is decoded, this many characters at a time (cut at a paragraph or line break)
+STREAM_SEGMENT_CHARS = 256 * CHUNK_SIZE
+
+# Latent semantic index files, stored next to the TF-IDF store
+LSA_COMPONENTS_FILE = "lsa_components.npy"  # (k, vocabulary) projection of TF-IDF space
+LSA_EMBEDDINGS_FILE = "lsa_embeddings.npy"  # (chunks, k) L2-normalized chunk embeddings
+# [start, end) of every chunk in the extracted text, (-1, -1) when unknown; lets /ask merge overlapping hits
+CHUNK_OFFSETS_FILE = "chunk_offsets.npy"
+
+# Directories under VECTOR_STORE_DIR being written (or left over by a crash)
+TEMP_PREFIX = ".tmp-"
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def compute_file_hash(file_path: str) -> str:
+    """MD5 of the file contents (the key shared summaries and vector stores are stored under)."""
+    digest = hashlib.md5()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _segment_end(text: str, limit: int) -> int:
+    # Prefer the last paragraph break before the limit, then a line break, then a space
+    for separator in ("\n\n", "\n", " "):
+        position = text.rfind(separator, 0, limit)
+        if position > 0:
+            return position + len(separator)
+    return limit
+
+
+def locate_chunks(text: str, chunks: List[str], base: int = 0) -> List[Tuple[int, int]]:
+    """
+    [start, end) of each chunk in `text`, shifted by `base`. The splitter
+    emits chunks in order and each one starts within or just after the one
+    before, so each is only searched for in a short window past the previous
+    one; a chunk that is not found gets (-1, -1) and is never merged with
+    its neighbours at query time.
+    """
+    spans, cursor, previous_end = [], 0, 0
+    for chunk in chunks:
+        start = text.find(chunk, cursor, previous_end + CHUNK_SIZE + len(chunk))
+        if start < 0:
+            spans.append((-1, -1))
+            continue
+        spans.append((base + start, base + start + len(chunk)))
+        cursor, previous_end = start + 1, start + len(chunk)
+    return spans
+
+
+def split_text_stream_with_offsets(blocks: Iterable[str], segment_chars: int = STREAM_SEGMENT_CHARS) -> Iterator[Tuple[str, int, int]]:
+    """
+    Chunks of a text that arrives in blocks, without joining it first, with
+    their [start, end) in the whole text. The text is split a segment at a
+    time; segments end at a paragraph or line break, so only a chunk per
+    segment comes out differently (and without overlap) compared to
+    splitting the whole text at once.
+    """
+    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    buffer, base = "", 0
+    for block in blocks:
+        buffer += block
+        while len(buffer) >= segment_chars:
+            end = _segment_end(buffer, segment_chars)
+            segment = buffer[:end]
+            chunks = splitter.split_text(segment)
+            for chunk, (start, stop) in zip(chunks, locate_chunks(segment, chunks, base)):
+                yield chunk, start, stop
+            buffer, base = buffer[end:], base + end
+    if buffer:
+        chunks = splitter.split_text(buffer)
+        for chunk, (start, stop) in zip(chunks, locate_chunks(buffer, chunks, base)):
+            yield chunk, start, stop
+
+
+def split_text_stream(blocks: Iterable[str], segment_chars: int = STREAM_SEGMENT_CHARS) -> Iterator[str]:
+    """Chunks of a text that arrives in blocks (see split_text_stream_with_offsets)."""
+    for chunk, _, _ in split_text_stream_with_offsets(blocks, segment_chars):
+        yield chunk
+
+
+def _extract_chunks(file_hash: str, file_path: str) -> Tuple[List[str], np.ndarray, str]:
+    """
+    Chunk the document and cache its extracted text; returns (chunks,
+    (chunks, 2) array of their offsets in the extracted text, text_path).
+    """
+    if is_plain_text(file_path):
+        # Decoded from a memory map and chunked as it streams, so the whole text is never held in memory
+        with span("extract_text"):
+            located = list(split_text_stream_with_offsets(cache_extracted_text_stream(file_hash, iter_text_blocks(file_path))))
+        chunks = [chunk for chunk, _, _ in located]
+        offsets = np.array([(start, end) for _, start, end in located], dtype=np.int64).reshape(-1, 2)
+        return chunks, offsets, extracted_text_path(file_hash)
+
+    text = extract_text(file_path)
+    with span("chunk_text"):
+        text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+        chunks = text_splitter.split_text(text)
+        offsets = np.array(locate_chunks(text, chunks), dtype=np.int64).reshape(-1, 2)
+    # Keep the extracted text so summarization does not have to parse the file again
+    return chunks, offsets, cache_extracted_text(file_hash, text)
+
+
+def build_lsa_index(tfidf_matrix, n_components: int = LSA_COMPONENTS) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Fit TruncatedSVD over the chunk TF-IDF matrix and return float32
+    (components, normalized chunk embeddings), or None when the document is
+    too small for a meaningful latent space.
+    """
+    n_chunks, n_terms = tfidf_matrix.shape
+    n_components = min(n_components, n_chunks - 1, n_terms - 1)
+    if n_components < 2:
+        return None
+    svd = TruncatedSVD(n_components=n_components, algorithm="randomized", random_state=42)
+    embeddings = svd.fit_transform(tfidf_matrix).astype(np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    embeddings /= np.maximum(norms, 1e-12)
+    return svd.components_.astype(np.float32), embeddings
+
+
+def save_tfidf_store(vector_store_path: str, vectorizer, tfidf_matrix, fmt: str = VECTOR_STORE_FORMAT) -> Dict[str, Any]:
+    """
+    Write the fitted TF-IDF model in the configured format and report its
+    memory and disk footprint next to the classic pickle store's.
+    """
+    baseline_memory = sklearn_memory_bytes(vectorizer, tfidf_matrix)
+    if fmt not in COMPACT_FORMATS:
+        paths = [os.path.join(vector_store_path, "vectorizer.pkl"), os.path.join(vector_store_path, "matrix.pkl")]
+        joblib.dump(vectorizer, paths[0])
+        joblib.dump(tfidf_matrix, paths[1])
+        return {"format": "sklearn", "memory_bytes": baseline_memory, "disk_bytes": sum(os.path.getsize(p) for p in paths)}
+
+    index = CompactTfidfIndex.from_sklearn(vectorizer, tfidf_matrix, fmt)
+    disk_bytes = index.save(vector_store_path)
+    baseline_disk = pickled_size(vectorizer, tfidf_matrix)
+    return {
+        "format": fmt,
+        "memory_bytes": index.nbytes,
+        "disk_bytes": disk_bytes,
+        "baseline_memory_bytes": baseline_memory,
+        "baseline_disk_bytes": baseline_disk,
+        "memory_saved_pct": round(100 * (1 - index.nbytes / max(baseline_memory, 1)), 1),
+        "disk_saved_pct": round(100 * (1 - disk_bytes / max(baseline_disk, 1)), 1),
+    }
+
+
+def _store_kind(fmt: str) -> str:
+    return "compact" if fmt in COMPACT_FORMATS else "sklearn"
+
+
+def _load_tfidf(vector_store_path: str) -> Tuple[Any, Any, str]:
+    """(sklearn vectorizer or CompactTfidfIndex, chunk matrix with its TF-IDF values, format) of a store."""
+    manifest = read_manifest(vector_store_path)
+    if manifest:
+        index = CompactTfidfIndex.load(vector_store_path)
+        return index, index.dequantized_matrix(), manifest["format"]
+    vectorizer = joblib.load(os.path.join(vector_store_path, "vectorizer.pkl"))
+    return vectorizer, joblib.load(os.path.join(vector_store_path, "matrix.pkl")), "sklearn"
+
+
+def vocabulary_drift(model, chunks: List[str]) -> float:
+    """
+    Share of the terms of `chunks` missing from the fitted vocabulary,
+    relative to the vocabulary grown by them: how much a patched store
+    (which cannot index those terms) drifts from a refit one.
+    """
+    if isinstance(model, CompactTfidfIndex):
+        analyze, known, size = model.analyze, lambda term: model.vocabulary.lookup(term) >= 0, len(model.vocabulary)
+    else:
+        analyze, known, size = model.build_analyzer(), model.vocabulary_.__contains__, len(model.vocabulary_)
+    missing = {term for chunk in chunks for term in analyze(chunk) if not known(term)}
+    return len(missing) / max(size + len(missing), 1)
+
+
+def _patch_previous_store(previous_path: str, chunks: List[str], fmt: str) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Diff `chunks` against the chunks of the store at previous_path (by hash
+    of their normalized text) and, if the vocabulary drift stays within
+    VECTOR_REFIT_DRIFT, assemble the new TF-IDF rows from the previous rows
+    plus the added chunks transformed with the previous fit. Returns
+    (patched model/matrix/LSA parts, or None when a full fit is needed; report).
+    """
+    previous_chunks = joblib.load(os.path.join(previous_path, "chunks.pkl"))
+    previous_rows = {}
+    for row, chunk in enumerate(previous_chunks):
+        previous_rows.setdefault(chunk_hash(chunk), row)
+    hashes = [chunk_hash(chunk) for chunk in chunks]
+    added = [index for index, digest in enumerate(hashes) if digest not in previous_rows]
+    report = {
+        "kept": len(chunks) - len(added),
+        "added": len(added),
+        "removed": len(set(previous_rows) - set(hashes)),
+        "vocabulary_drift": None,
+        "mode": "refit",
+    }
+    if len(added) == len(chunks):
+        report["reason"] = "no_shared_chunks"
+        return None, report
+
+    model, previous_matrix, previous_format = _load_tfidf(previous_path)
+    if _store_kind(previous_format) != _store_kind(fmt):
+        report["reason"] = "store_format_changed"
+        return None, report
+    drift = vocabulary_drift(model, [chunks[index] for index in added])
+    report["vocabulary_drift"] = round(drift, 4)
+    if drift > VECTOR_REFIT_DRIFT:
+        report["reason"] = "vocabulary_drift"
+        return None, report
+
+    # Rows of the kept chunks come from the previous matrix, the added ones follow it
+    order = np.array([previous_rows.get(digest, -1) for digest in hashes], dtype=np.int64)
+    components_path = os.path.join(previous_path, LSA_COMPONENTS_FILE)
+    fold_lsa = BUILD_LSA_INDEX and os.path.exists(components_path)
+    if fold_lsa:
+        components = np.load(components_path)
+        embeddings = np.load(os.path.join(previous_path, LSA_EMBEDDINGS_FILE))
+    if not added:
+        # Only deletions or unchanged chunks (a re-saved file): nothing to transform or fold in
+        patched = {"model": model, "matrix": csr_matrix(previous_matrix)[order]}
+        if fold_lsa:
+            patched["lsa"] = (components, embeddings[order])
+        report["mode"] = "patched"
+        return patched, report
+
+    order[added] = previous_matrix.shape[0] + np.arange(len(added))
+    added_matrix = model.transform([chunks[index] for index in added]).astype(previous_matrix.dtype)
+    patched = {"model": model, "matrix": vstack([previous_matrix, added_matrix], format="csr")[order]}
+
+    if fold_lsa:
+        # Added chunks are folded into the previous latent space
+        added_embeddings = np.asarray(added_matrix @ components.T, dtype=np.float32)
+        added_embeddings /= np.maximum(np.linalg.norm(added_embeddings, axis=1, keepdims=True), 1e-12)
+        patched["lsa"] = (components, np.vstack([embeddings, added_embeddings])[order])
+    report["mode"] = "patched"
+    return patched, report
+
+
+def _save_patched_store(vector_store_path: str, patched: Dict[str, Any], fmt: str) -> Dict[str, Any]:
+    model = patched["model"]
+    if not isinstance(model, CompactTfidfIndex):
+        return save_tfidf_store(vector_store_path, model, patched["matrix"], fmt)
+    index = CompactTfidfIndex.from_matrix(model.vocabulary, model.idf, model.params, patched["matrix"], fmt)
+    return {"format": fmt, "memory_bytes": index.nbytes, "disk_bytes": index.save(vector_store_path)}
+
+
+def _publish_store(tmp_path: str, vector_store_path: str) -> None:
+    """
+    Rename a finished store into place. A directory cannot be renamed over a
+    non-empty one, so an existing store (stale, or from a re-vectorize) is
+    moved aside first and removed afterwards.
+    """
+    stale_path = None
+    if os.path.exists(vector_store_path):
+        stale_path = os.path.join(os.path.dirname(vector_store_path), f"{TEMP_PREFIX}stale-{uuid4().hex}")
+        os.rename(vector_store_path, stale_path)
+    try:
+        os.rename(tmp_path, vector_store_path)
+    except OSError:
+        if not os.path.isdir(vector_store_path):
+            raise
+        # Another build published the same content first; its store is just as good
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    if stale_path:
+        shutil.rmtree(stale_path, ignore_errors=True)
+
+
+def build_vector_store(file_hash: str, file_path: str, previous_hash: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Extract text, chunk it, fit TF-IDF and write the store (TF-IDF model in
+    VECTOR_STORE_FORMAT, chunks.pkl, the chunk offsets, and the LSA index
+    when BUILD_LSA_INDEX is set) atomically to VECTOR_STORE_DIR/<file_hash>,
+    and cache the extracted text. Plain text is streamed (see app/utils/text_stream.py).
+    With `previous_hash` (the content this one is a new version of) the
+    previous store is patched instead of refitted where possible; the
+    result then has an "incremental" report. Raises ValueError for
+    unsupported or empty documents.
+    """
+    chunks, offsets, text_path = _extract_chunks(file_hash, file_path)
+    if not chunks:
+        raise ValueError("No text chunks could be extracted.")
+
+    patched, incremental = None, None
+    previous_path = os.path.join(VECTOR_STORE_DIR, previous_hash) if previous_hash else None
+    if previous_path and os.path.isdir(previous_path):
+        with span("patch_vector_store"):
+            patched, incremental = _patch_previous_store(previous_path, chunks, VECTOR_STORE_FORMAT)
+        incremental["previous_hash"] = previous_hash
+
+    if patched is None:
+        with span("tfidf_fit"):
+            vectorizer = TfidfVectorizer()
+            tfidf_matrix = vectorizer.fit_transform(chunks)
+    else:
+        tfidf_matrix = patched["matrix"]
+
+    os.makedirs(VECTOR_STORE_DIR, exist_ok=True)
+    tmp_path = tempfile.mkdtemp(prefix=f"{TEMP_PREFIX}{file_hash}-", dir=VECTOR_STORE_DIR)
+    try:
+        with span("save_vector_store"):
+            if patched is None:
+                storage = save_tfidf_store(tmp_path, vectorizer, tfidf_matrix)
+            else:
+                storage = _save_patched_store(tmp_path, patched, VECTOR_STORE_FORMAT)
+            joblib.dump(chunks, os.path.join(tmp_path, "chunks.pkl"))
+            np.save(os.path.join(tmp_path, CHUNK_OFFSETS_FILE), offsets)
+
+        if BUILD_LSA_INDEX:
+            if patched is not None and "lsa" in patched:
+                lsa = patched["lsa"]
+            else:
+                with span("lsa_fit"):
+                    lsa = build_lsa_index(tfidf_matrix)
+            if lsa is not None:
+                np.save(os.path.join(tmp_path, LSA_COMPONENTS_FILE), lsa[0])
+                np.save(os.path.join(tmp_path, LSA_EMBEDDINGS_FILE), lsa[1])
+
+        _publish_store(tmp_path, os.path.join(VECTOR_STORE_DIR, file_hash))
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+    return {"file_hash": file_hash, "text_path": text_path, "chunk_count": len(chunks), "storage": storage, "incremental": incremental}
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """
+    Shared pool for batch vectorization, created on first use. Workers are
+    spawned rather than forked so they never inherit the server's threads
+    or locks; they stay warm for later batches.
+    """
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=VECTORIZE_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        logger.info(f"Started vectorization pool with {VECTORIZE_WORKERS} workers")
+    return _pool
+
+
+def discard_broken_pool(error: BaseException) -> None:
+    """Drop the shared pool after a worker died, so the next batch starts a fresh one."""
+    global _pool
+    if isinstance(error, BrokenProcessPool) and _pool is not None:
+        logger.warning("Vectorization pool is broken, it will be recreated")
+        _pool.shutdown(wait=False)
+        _pool = None
@@ -0,0 +1,206 @@
+"""
+/ask throughput against the number of uvicorn workers.
+
+/ask runs in FastAPI's threadpool: a worker overlaps questions waiting on
+the LLM, and CPU-bound retrieval only grows with more processes (up to the
+number of cores). For each worker count this starts a real server
+(`uvicorn --workers N`) on a fresh temporary data directory with the stub
+LLM, creates --users accounts that each upload and vectorize one document,
+then has all of them ask questions concurrently for --duration seconds:
+
+    python -m benchmarks.ask_scaling --workers 1,2,4 --users 16 --pages 50
+
+The table shows requests/s, p50/p95 latency and the speedup over the first
+worker count, with os.cpu_count(). The only recorded run (README, Multiple
+workers) is from a 1-core host, where more workers are slower; scaling
+across cores has not been measured. With --llm-latency the stub waits per
+call like a remote model would.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Dict, List
+
+import httpx
+
+from benchmarks.corpus import DEFAULT_CORPUS_DIR, corpus_file
+from benchmarks.loadtest import CONTENT_TYPES, QUESTIONS, Recorder
+
+STARTUP_TIMEOUT_SECONDS = 120
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(workers: int, data_dir: str, port: int, llm_latency: float) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "DATA_PATH": data_dir,
+        "WEB_CONCURRENCY": str(workers),
+        "LLM_PROVIDER": "stub",
+        "LLM_STUB_LATENCY_SECONDS": str(llm_latency),
+        "VERIFY_EMAIL_DOMAIN": "false",
+        "GC_INTERVAL_SECONDS": "0",
+        # Every user cycles through the same questions: measure retrieval, not answer cache hits
+        "ANSWER_CACHE_TTL_SECONDS": "0",
+    }
+    for name, default in (("SECRET_KEY", "scaling-benchmark-secret"), ("ALGORITHM", "HS256"), ("ACCESS_TOKEN_EXPIRE_MINUTES", "60")):
+        env.setdefault(name, default)
+    with open(os.path.join(data_dir, "server.log"), "wb") as log:
+        return subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+             "--workers", str(workers), "--log-level", "warning"],
+            env=env, stdout=log, stderr=subprocess.STDOUT,
+        )
+
+
+def wait_until_ready(base_url: str, server: subprocess.Popen, data_dir: str) -> None:
+    deadline = time.monotonic() + STARTUP_TIMEOUT_SECONDS
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            break
+        try:
+            if httpx.get(f"{base_url}/health", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    with open(os.path.join(data_dir, "server.log"), "rb") as f:
+        sys.stderr.write(f.read()[-4000:].decode("utf-8", "replace"))
+    raise RuntimeError("the server did not come up")
+
+
+async def prepare_user(client: httpx.AsyncClient, index: int, path: str) -> Dict:
+    """Sign up, log in, upload and vectorize one document. Returns the auth headers and filename."""
+    email = f"scaling-{index}@example.com"
+    password = "scaling-benchmark-password"
+    response = await client.post("/auth/signup", json={
+        "email": email, "username": f"scaling{index}", "password": password, "gemini_api_key": "stub-key",
+    })
+    response.raise_for_status()
+    response = await client.post("/auth/token", data={"username": email, "password": password})
+    response.raise_for_status()
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    with open(path, "rb") as f:
+        payload = f.read()
+    file_type = os.path.splitext(path)[1].lstrip(".")
+    response = await client.post(
+        "/upload", headers=headers, files={"file": (os.path.basename(path), payload, CONTENT_TYPES[file_type])}
+    )
+    response.raise_for_status()
+    filename = response.json()["filename"]
+    response = await client.post(f"/vectorize/{filename}", headers=headers)
+    response.raise_for_status()
+    return {"headers": headers, "filename": filename}
+
+
+async def measure(base_url: str, args) -> Dict:
+    limits = httpx.Limits(max_connections=args.users)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        paths = [corpus_file(args.type, args.pages, args.seed + index, args.corpus_dir) for index in range(args.users)]
+        sessions = await asyncio.gather(*(prepare_user(client, index, path) for index, path in enumerate(paths)))
+
+        recorder = Recorder()
+        stop_at = time.perf_counter() + args.duration
+
+        async def ask_loop(index: int, session: Dict):
+            n = 0
+            while time.perf_counter() < stop_at:
+                await recorder.request(client, "ask", "POST", "/ask", headers=session["headers"], json={
+                    "filename": session["filename"], "question": QUESTIONS[(index + n) % len(QUESTIONS)],
+                })
+                n += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(ask_loop(index, session) for index, session in enumerate(sessions)))
+        return recorder.report(time.perf_counter() - started)["ask"]
+
+
+def run_workers(workers: int, args) -> Dict:
+    data_dir = tempfile.mkdtemp(prefix=f"smartdoc-scaling-{workers}-")
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    server = start_server(workers, data_dir, port, args.llm_latency)
+    try:
+        wait_until_ready(base_url, server, data_dir)
+        return asyncio.run(measure(base_url, args))
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2,4", help="Comma separated uvicorn worker counts")
+    parser.add_argument("--users", type=int, default=16, help="Concurrent askers, each with its own document")
+    parser.add_argument("--type", default="txt", choices=tuple(CONTENT_TYPES))
+    parser.add_argument("--pages", type=int, default=50, help="Pages per document (1 to 2000)")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds of asking per worker count")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Simulated seconds per LLM call")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--corpus-dir", default=DEFAULT_CORPUS_DIR)
+    parser.add_argument("--timeout", type=float, default=300.0, help="Per-request timeout in seconds")
+    parser.add_argument("--output", help="Write the results JSON here")
+    args = parser.parse_args(argv)
+
+    worker_counts = [int(w) for w in args.workers.split(",") if w.strip()]
+    if any(w < 1 for w in worker_counts):
+        parser.error("worker counts must be at least 1")
+    if not 1 <= args.pages <= 2000:
+        parser.error("--pages must be between 1 and 2000")
+
+    results = {}
+    for workers in worker_counts:
+        print(f"Measuring /ask with {workers} worker(s) ...", file=sys.stderr)
+        results[str(workers)] = run_workers(workers, args)
+
+    base_rps = results[str(worker_counts[0])]["rps"]
+    print(f"{'workers':>8}{'asks':>8}{'errors':>8}{'rps':>9}{'p50 s':>9}{'p95 s':>9}{'speedup':>9}", file=sys.stderr)
+    for workers, row in results.items():
+        row["speedup"] = round(row["rps"] / base_rps, 2) if base_rps else 0.0
+        print(
+            f"{workers:>8}{row['count']:>8}{row['errors']:>8}{row['rps']:>9.2f}{row['p50_s']:>9.4f}"
+            f"{row['p95_s']:>9.4f}{row['speedup']:>9.2f}",
+            file=sys.stderr
+        )
+
+    report = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "users": args.users,
+            "type": args.type,
+            "pages": args.pages,
+            "duration": args.duration,
+            "llm_latency": args.llm_latency,
+        },
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""
+Compact TF-IDF store (float32 / int8) vs the classic pickled sklearn store:
+memory and disk footprint, load and query time, and ranking parity.
+
+    python -m benchmarks.bench_compact_store --chunks 5000 --queries 300
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from typing import Dict, List
+
+import joblib
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from app.utils.compact_store import CompactTfidfIndex, pickled_size, sklearn_memory_bytes
+from app.utils.qa_utils import load_vector_store, score_top_k
+from app.utils.vectorizer import save_tfidf_store
+from benchmarks.bench_retrieval import build_corpus, build_queries
+
+
+def _ranking(store: Dict, queries, k: int):
+    rankings, latencies = [], []
+    for query, _ in queries:
+        started = time.perf_counter()
+        rankings.append([index for _, index in score_top_k(store, query, k, "sparse")])
+        latencies.append((time.perf_counter() - started) * 1000)
+    return rankings, float(np.mean(latencies))
+
+
+def _store_report(directory: str, queries, k: int, reference=None) -> Dict:
+    started = time.perf_counter()
+    store = load_vector_store(directory)
+    load_ms = (time.perf_counter() - started) * 1000
+    rankings, query_ms = _ranking(store, queries, k)
+    report = {"load_ms": round(load_ms, 2), "query_ms_mean": round(query_ms, 3)}
+    if reference is not None:
+        overlap = [len(set(a) & set(b)) / k for a, b in zip(reference, rankings)]
+        report[f"overlap@{k}"] = round(float(np.mean(overlap)), 4)
+        report["identical_rankings"] = round(float(np.mean([a == b for a, b in zip(reference, rankings)])), 4)
+        report["top1_agreement"] = round(float(np.mean([a[0] == b[0] for a, b in zip(reference, rankings)])), 4)
+    return report, rankings
+
+
+def run(args) -> Dict:
+    chunks, chunk_topics, chunk_words, topics = build_corpus(args.chunks, args.topics, args.seed)
+    queries = build_queries(args.queries, chunk_topics, chunk_words, topics, args.seed, args.paraphrase)
+    vectorizer = TfidfVectorizer()
+    matrix = vectorizer.fit_transform(chunks)
+
+    results = {"corpus": {"chunks": args.chunks, "vocabulary": len(vectorizer.vocabulary_), "nnz": int(matrix.nnz)}}
+    with tempfile.TemporaryDirectory() as root:
+        reference = None
+        for fmt in ("sklearn", "float32", "int8"):
+            directory = os.path.join(root, fmt)
+            os.makedirs(directory)
+            storage = save_tfidf_store(directory, vectorizer, matrix, fmt)
+            joblib.dump(chunks, os.path.join(directory, "chunks.pkl"))
+            report, rankings = _store_report(directory, queries, args.k, reference)
+            if reference is None:
+                reference = rankings
+            results[fmt] = {
+                "memory_bytes": storage["memory_bytes"],
+                "disk_bytes": storage["disk_bytes"],
+                **{key: value for key, value in storage.items() if key.endswith("_pct")},
+                **report,
+            }
+    return results
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=5000)
+    parser.add_argument("--topics", type=int, default=40)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--paraphrase", type=float, default=0.5)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    print(json.dumps(results, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
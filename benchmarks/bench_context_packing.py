@@ -0,0 +1,97 @@
+"""
+Prompt context size with and without context packing.
+
+Chunks a synthetic document with the app's splitter (recording chunk
+offsets as vectorization does), asks questions made of words from random
+chunks, and packs each question's top-k hits with
+app/utils/context_packer.py. Reports the context tokens before and after
+packing per query (mean, percentiles) and the packing time. With --layout
+pages every page is one long paragraph, so chunks overlap by CHUNK_OVERLAP
+characters; with paragraphs most chunks are single paragraphs.
+
+    python -m benchmarks.bench_context_packing --pages 100 --queries 200
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+from typing import Dict, List
+
+import numpy as np
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from app.utils.context_packer import pack_context
+from app.utils.qa_utils import score_top_k
+from app.utils.vectorizer import CHUNK_SIZE, CHUNK_OVERLAP, locate_chunks
+from benchmarks.corpus import generate_pages
+
+
+def _percentile(values: List[float], q: float) -> float:
+    return round(float(np.percentile(values, q)), 4)
+
+
+def run(args) -> Dict:
+    pages = generate_pages(args.pages, args.seed)
+    separator = "\n\n" if args.layout == "paragraphs" else " "
+    text = "\n\n".join(separator.join(paragraphs) for paragraphs in pages)
+    chunks = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP).split_text(text)
+    offsets = np.array(locate_chunks(text, chunks), dtype=np.int64).reshape(-1, 2)
+    vectorizer = TfidfVectorizer()
+    store = {"vectorizer": vectorizer, "matrix": vectorizer.fit_transform(chunks), "chunks": chunks}
+
+    rng = random.Random(args.seed)
+    before, after, reductions, seconds = [], [], [], []
+    totals = {"duplicates_dropped": 0, "merged": 0, "trimmed": 0, "over_budget": 0}
+    for _ in range(args.queries):
+        words = rng.choice(chunks).split()
+        question = " ".join(rng.sample(words, min(8, len(words))))
+        hits = [(score, None, index, chunks[index]) for score, index in score_top_k(store, question, args.k, "sparse")]
+        started = time.perf_counter()
+        _, report = pack_context(hits, question, {None: offsets}, args.budget)
+        seconds.append(time.perf_counter() - started)
+        before.append(report["retrieved_tokens"])
+        after.append(report["packed_tokens"])
+        reductions.append(report["token_reduction"])
+        for key in totals:
+            totals[key] += report[key]
+
+    return {
+        "layout": args.layout,
+        "chunks": len(chunks),
+        "overlapping_chunk_pairs": int((offsets[1:, 0] < offsets[:-1, 1]).sum()),
+        "queries": args.queries,
+        "k": args.k,
+        "budget": args.budget,
+        "retrieved_tokens_mean": round(statistics.mean(before), 1),
+        "packed_tokens_mean": round(statistics.mean(after), 1),
+        "token_reduction_mean": round(statistics.mean(reductions), 4),
+        "token_reduction_p10": _percentile(reductions, 10),
+        "token_reduction_p50": _percentile(reductions, 50),
+        "token_reduction_p90": _percentile(reductions, 90),
+        "pack_ms_p50": round(statistics.median(seconds) * 1000, 3),
+        **{f"{key}_per_query": round(value / args.queries, 2) for key, value in totals.items()},
+    }
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=100)
+    parser.add_argument("--layout", choices=("paragraphs", "pages"), default="pages")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--budget", type=int, default=3000, help="Context token budget (0 = none)")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    print(json.dumps(results, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
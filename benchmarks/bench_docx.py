@@ -0,0 +1,106 @@
+"""
+Streaming DOCX extraction (app/utils/docx_stream.py) vs python-docx's
+object model: extraction time, peak memory and text parity on synthetic
+documents of growing size.
+
+    python -m benchmarks.bench_docx --pages 10,100,1000
+
+Each extraction runs in a fresh process, so peak RSS growth is measured
+per extractor and includes lxml's allocations (which tracemalloc misses).
+`parity` checks that the streamed text equals the python-docx paragraphs;
+the corpus documents have no tables or headers, which python-docx skips.
+"""
+import argparse
+import json
+import multiprocessing
+import resource
+import statistics
+import sys
+import time
+from typing import Dict, List, Tuple
+
+from benchmarks.corpus import DEFAULT_CORPUS_DIR, corpus_file
+
+
+def _peak_rss() -> int:
+    """High-water RSS of this process in bytes."""
+    # On Linux ru_maxrss survives exec, so a spawned child would report its parent's peak; VmHWM does not
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+
+def _python_docx(path: str) -> str:
+    from docx import Document
+    return "\n".join(paragraph.text for paragraph in Document(path).paragraphs if paragraph.text.strip())
+
+
+def _streaming(path: str) -> str:
+    from app.utils.docx_stream import iter_docx_text
+    return "\n".join(iter_docx_text(path))
+
+
+EXTRACTORS = {"python_docx": _python_docx, "streaming": _streaming}
+
+
+def _measure(extractor: str, path: str) -> Tuple[float, int, str]:
+    """Runs in a child process: (seconds, peak RSS growth in bytes, text)."""
+    import docx  # noqa: F401  Imports are not part of the measurement
+    import app.utils.docx_stream  # noqa: F401
+    baseline = _peak_rss()
+    started = time.perf_counter()
+    text = EXTRACTORS[extractor](path)
+    seconds = time.perf_counter() - started
+    return seconds, _peak_rss() - baseline, text
+
+
+def bench_file(path: str, repeat: int) -> Dict:
+    context = multiprocessing.get_context("spawn")
+    results, texts = {}, {}
+    for extractor in EXTRACTORS:
+        runs = []
+        for _ in range(repeat):
+            with context.Pool(1) as pool:
+                runs.append(pool.apply(_measure, (extractor, path)))
+        texts[extractor] = runs[-1][2]
+        results[extractor] = {
+            "seconds": round(statistics.median(run[0] for run in runs), 4),
+            "peak_rss_mb": round(max(run[1] for run in runs) / 2 ** 20, 1),
+            "chars": len(texts[extractor]),
+        }
+    results["speedup"] = round(results["python_docx"]["seconds"] / max(results["streaming"]["seconds"], 1e-9), 2)
+    results["parity"] = texts["python_docx"] == texts["streaming"]
+    return results
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", default="10,100,1000", help="Comma separated page counts (1 to 2000)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--corpus-dir", default=DEFAULT_CORPUS_DIR)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for pages in (int(p) for p in args.pages.split(",") if p.strip()):
+        if not 1 <= pages <= 2000:
+            parser.error("page counts must be between 1 and 2000")
+        path = corpus_file("docx", pages, args.seed, args.corpus_dir)
+        print(f"Benchmarking docx/{pages} ...", file=sys.stderr)
+        results[f"docx/{pages}"] = bench_file(path, args.repeat)
+
+    print(json.dumps(results, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
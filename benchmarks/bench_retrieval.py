@@ -0,0 +1,141 @@
+"""
+Retrieval quality and latency: sparse TF-IDF vs LSA (dense) vs hybrid.
+
+Builds a synthetic topical corpus in memory, then asks paraphrased questions:
+each query is derived from a target chunk, with part of its topic words
+swapped for other words of the same topic that the chunk never uses (what
+rewrite_queries otherwise has to paper over). Query rewriting is off, i.e.
+every mode gets exactly one retrieval query and no LLM call.
+
+    python -m benchmarks.bench_retrieval --chunks 2000 --queries 300
+"""
+import argparse
+import json
+import random
+import time
+from typing import Dict, List
+
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from app.utils.qa_utils import score_top_k
+from app.utils.vectorizer import build_lsa_index
+
+MODES = ("sparse", "dense", "hybrid")
+
+
+def _word(rng: random.Random) -> str:
+    return "".join(rng.choice("bcdfghjklmnpqrstvwz") + rng.choice("aeiou") for _ in range(rng.randint(2, 4)))
+
+
+def build_corpus(n_chunks: int, n_topics: int, seed: int):
+    """Chunks of ~150 words: a random subset of one topic's vocabulary plus shared filler."""
+    rng = random.Random(seed)
+    topics = [[_word(rng) for _ in range(40)] for _ in range(n_topics)]
+    filler = [_word(rng) for _ in range(400)]
+    chunks, chunk_topics, chunk_words = [], [], []
+    for _ in range(n_chunks):
+        topic = rng.randrange(n_topics)
+        used = rng.sample(topics[topic], 10)
+        words = [rng.choice(used) for _ in range(50)] + [rng.choice(filler) for _ in range(100)]
+        rng.shuffle(words)
+        chunks.append(" ".join(words))
+        chunk_topics.append(topic)
+        chunk_words.append(set(used))
+    return chunks, chunk_topics, chunk_words, topics
+
+
+def build_queries(n_queries: int, chunk_topics, chunk_words, topics, seed: int, paraphrase: float):
+    """(query, target chunk) pairs; `paraphrase` is the share of query words not in the target chunk."""
+    rng = random.Random(seed + 1)
+    queries = []
+    for _ in range(n_queries):
+        target = rng.randrange(len(chunk_topics))
+        own = sorted(chunk_words[target])
+        unseen = [w for w in topics[chunk_topics[target]] if w not in chunk_words[target]]
+        n_swapped = round(6 * paraphrase)
+        words = rng.sample(own, 6 - n_swapped) + rng.sample(unseen, n_swapped)
+        queries.append((" ".join(words), target))
+    return queries
+
+
+def evaluate(store: Dict, queries, chunk_topics, mode: str, k: int) -> Dict:
+    hits_1 = hits_k = 0
+    reciprocal_ranks, topic_precision, latencies = [], [], []
+    for query, target in queries:
+        started = time.perf_counter()
+        ranked = score_top_k(store, query, k, mode)
+        latencies.append((time.perf_counter() - started) * 1000)
+        indices = [index for _, index in ranked]
+        if indices and indices[0] == target:
+            hits_1 += 1
+        if target in indices:
+            hits_k += 1
+            reciprocal_ranks.append(1 / (indices.index(target) + 1))
+        else:
+            reciprocal_ranks.append(0.0)
+        topic_precision.append(sum(chunk_topics[i] == chunk_topics[target] for i in indices) / k)
+    latencies = np.array(latencies)
+    return {
+        "hit@1": round(hits_1 / len(queries), 4),
+        f"hit@{k}": round(hits_k / len(queries), 4),
+        "mrr": round(float(np.mean(reciprocal_ranks)), 4),
+        f"topic_precision@{k}": round(float(np.mean(topic_precision)), 4),
+        "latency_ms_mean": round(float(latencies.mean()), 3),
+        "latency_ms_p95": round(float(np.percentile(latencies, 95)), 3),
+    }
+
+
+def run(args) -> Dict:
+    chunks, chunk_topics, chunk_words, topics = build_corpus(args.chunks, args.topics, args.seed)
+    queries = build_queries(args.queries, chunk_topics, chunk_words, topics, args.seed, args.paraphrase)
+
+    started = time.perf_counter()
+    vectorizer = TfidfVectorizer()
+    matrix = vectorizer.fit_transform(chunks)
+    tfidf_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    components, embeddings = build_lsa_index(matrix, args.components)
+    lsa_seconds = time.perf_counter() - started
+
+    store = {
+        "vectorizer": vectorizer,
+        "matrix": matrix,
+        "chunks": chunks,
+        "lsa_components": components,
+        "lsa_embeddings": embeddings,
+    }
+    return {
+        "corpus": {"chunks": args.chunks, "topics": args.topics, "queries": args.queries, "paraphrase": args.paraphrase},
+        "build": {
+            "tfidf_seconds": round(tfidf_seconds, 3),
+            "lsa_seconds": round(lsa_seconds, 3),
+            "lsa_components": int(components.shape[0]),
+            "lsa_bytes": int(components.nbytes + embeddings.nbytes),
+        },
+        "modes": {mode: evaluate(store, queries, chunk_topics, mode, args.k) for mode in MODES},
+    }
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--topics", type=int, default=40)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--paraphrase", type=float, default=0.5, help="Share of query words absent from the target chunk")
+    parser.add_argument("--components", type=int, default=128)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    print(json.dumps(results, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
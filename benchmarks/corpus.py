@@ -0,0 +1,83 @@
+"""
+Synthetic document corpus for the benchmarks: deterministic pseudo-English
+text rendered as TXT, PDF (PyMuPDF) or DOCX (python-docx) with a given
+number of pages. Generated files are cached on disk by (type, pages, seed).
+"""
+import os
+import random
+from typing import List
+
+import fitz  # PyMuPDF
+from docx import Document as DocxDocument
+
+FILE_TYPES = ("txt", "pdf", "docx")
+WORDS_PER_PAGE = 450
+PARAGRAPHS_PER_PAGE = 5
+DEFAULT_CORPUS_DIR = os.path.join(os.path.dirname(__file__), ".corpus")
+
+
+def _vocabulary(rng: random.Random, size: int = 5000) -> List[str]:
+    syllables = [c + v for c in "bcdfghjklmnprstvwz" for v in "aeiou"]
+    return ["".join(rng.choice(syllables) for _ in range(rng.randint(1, 4))) for _ in range(size)]
+
+
+def generate_pages(pages: int, seed: int = 0) -> List[List[str]]:
+    """Pages of paragraphs of sentences; word frequencies roughly follow Zipf's law."""
+    rng = random.Random(seed)
+    vocabulary = _vocabulary(rng)
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    words_per_paragraph = WORDS_PER_PAGE // PARAGRAPHS_PER_PAGE
+    result = []
+    for _ in range(pages):
+        paragraphs = []
+        for _ in range(PARAGRAPHS_PER_PAGE):
+            words = rng.choices(vocabulary, weights=weights, k=words_per_paragraph)
+            sentences, start = [], 0
+            while start < len(words):
+                end = start + rng.randint(8, 20)
+                sentence = " ".join(words[start:end])
+                sentences.append(sentence[:1].upper() + sentence[1:] + ".")
+                start = end
+            paragraphs.append(" ".join(sentences))
+        result.append(paragraphs)
+    return result
+
+
+def write_txt(path: str, pages: List[List[str]]) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n\n".join("\n\n".join(paragraphs) for paragraphs in pages))
+
+
+def write_pdf(path: str, pages: List[List[str]]) -> None:
+    pdf = fitz.open()
+    for paragraphs in pages:
+        page = pdf.new_page()
+        page.insert_textbox(page.rect + (36, 36, -36, -36), "\n\n".join(paragraphs), fontsize=9)
+    pdf.save(path)
+    pdf.close()
+
+
+def write_docx(path: str, pages: List[List[str]]) -> None:
+    docx = DocxDocument()
+    for number, paragraphs in enumerate(pages):
+        if number:
+            docx.add_page_break()
+        for paragraph in paragraphs:
+            docx.add_paragraph(paragraph)
+    docx.save(path)
+
+
+WRITERS = {"txt": write_txt, "pdf": write_pdf, "docx": write_docx}
+
+
+def corpus_file(file_type: str, pages: int, seed: int = 0, corpus_dir: str = DEFAULT_CORPUS_DIR) -> str:
+    """Path of a generated document, creating it on first use."""
+    if file_type not in WRITERS:
+        raise ValueError(f"Unknown file type: {file_type}")
+    os.makedirs(corpus_dir, exist_ok=True)
+    path = os.path.join(corpus_dir, f"doc_{pages}p_s{seed}.{file_type}")
+    if not os.path.exists(path):
+        tmp_path = f"{path}.tmp.{file_type}"
+        WRITERS[file_type](tmp_path, generate_pages(pages, seed))
+        os.replace(tmp_path, path)
+    return path
@@ -0,0 +1,340 @@
+"""
+End-to-end load generator for the API.
+
+Drives `app.main:app` in-process through an ASGI client (no server, no
+network): every virtual user signs up, logs in, uploads its document mix,
+vectorizes each document, asks questions about it and lists its documents.
+The data directory is a fresh temporary directory and the LLM is the
+deterministic stub, so runs are offline and repeatable:
+
+    python -m benchmarks.loadtest --users 20 --docs txt:5,pdf:20 --questions 5
+    python -m benchmarks.loadtest --users 20 --save-baseline benchmarks/loadtest_baseline.json
+    python -m benchmarks.loadtest --users 20 --baseline benchmarks/loadtest_baseline.json
+
+--base-url sends the same traffic to a running server instead (start it
+with LLM_PROVIDER=stub and VERIFY_EMAIL_DOMAIN=false). The report gives
+requests per second and p50/p95/p99 latency per route; exit status is 1
+when --fail-on-regression is given and a route's p95 or throughput got
+worse than --threshold.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from benchmarks.corpus import FILE_TYPES, DEFAULT_CORPUS_DIR, corpus_file
+
+ROUTES = ("signup", "login", "upload", "vectorize", "ask", "list")
+CONTENT_TYPES = {
+    "pdf": "application/pdf",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "txt": "text/plain",
+}
+QUESTIONS = (
+    "What is this document about?",
+    "Summarize the main points.",
+    "Which topics come up most often?",
+    "What does the last section say?",
+)
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    # Nearest rank on the sorted sample
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+class Recorder:
+    """Per-route latencies and failures of one run."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.statuses: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+
+    async def request(self, client: httpx.AsyncClient, route: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.errors[route] += 1
+            self.latencies[route].append(time.perf_counter() - started)
+            return None
+        self.latencies[route].append(time.perf_counter() - started)
+        self.statuses[route][response.status_code] += 1
+        if response.status_code >= 400:
+            self.errors[route] += 1
+        return response
+
+    def report(self, elapsed: float) -> Dict[str, Dict]:
+        routes = {}
+        for route in ROUTES:
+            values = self.latencies.get(route)
+            if not values:
+                continue
+            routes[route] = {
+                "count": len(values),
+                "errors": self.errors[route],
+                "rps": round(len(values) / elapsed, 2) if elapsed else 0.0,
+                "mean_s": round(statistics.mean(values), 4),
+                "p50_s": round(_percentile(values, 50), 4),
+                "p95_s": round(_percentile(values, 95), 4),
+                "p99_s": round(_percentile(values, 99), 4),
+                "max_s": round(max(values), 4),
+                "statuses": {str(code): n for code, n in sorted(self.statuses[route].items())},
+            }
+        return routes
+
+
+def parse_doc_mix(spec: str) -> List[Tuple[str, int]]:
+    """"txt:5,pdf:20" -> [("txt", 5), ("pdf", 20)]: one document per entry, of that type and page count."""
+    mix = []
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        file_type, _, pages = item.partition(":")
+        if file_type not in FILE_TYPES:
+            raise ValueError(f"Unknown document type {file_type!r} (expected one of {', '.join(FILE_TYPES)})")
+        pages = int(pages or 1)
+        if not 1 <= pages <= 2000:
+            raise ValueError("page counts must be between 1 and 2000")
+        mix.append((file_type, pages))
+    if not mix:
+        raise ValueError("the document mix is empty")
+    return mix
+
+
+async def virtual_user(
+    client: httpx.AsyncClient, recorder: Recorder, user_index: int, run_id: str,
+    documents: List[str], questions: int
+) -> None:
+    """One user's session: signup, login, then upload, vectorize and ask per document, then list."""
+    email = f"load-{run_id}-{user_index}@example.com"
+    password = "load-test-password"
+    response = await recorder.request(client, "signup", "POST", "/auth/signup", json={
+        "email": email, "username": f"load{user_index}", "password": password, "gemini_api_key": "stub-key",
+    })
+    if response is None or response.status_code >= 400:
+        return
+    response = await recorder.request(client, "login", "POST", "/auth/token", data={"username": email, "password": password})
+    if response is None or response.status_code >= 400:
+        return
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    for path in documents:
+        file_type = os.path.splitext(path)[1].lstrip(".")
+        with open(path, "rb") as f:
+            payload = f.read()
+        response = await recorder.request(
+            client, "upload", "POST", "/upload", headers=headers,
+            files={"file": (os.path.basename(path), payload, CONTENT_TYPES[file_type])},
+        )
+        if response is None or response.status_code >= 400:
+            continue
+        filename = response.json()["filename"]
+
+        response = await recorder.request(client, "vectorize", "POST", f"/vectorize/{filename}", headers=headers)
+        if response is None or response.status_code >= 400:
+            continue
+        for i in range(questions):
+            await recorder.request(client, "ask", "POST", "/ask", headers=headers, json={
+                "filename": filename, "question": QUESTIONS[(user_index + i) % len(QUESTIONS)],
+            })
+
+    await recorder.request(client, "list", "GET", "/documents", headers=headers)
+
+
+async def run_load(client: httpx.AsyncClient, args, mix: List[Tuple[str, int]]) -> Tuple[Recorder, float]:
+    recorder = Recorder()
+    run_id = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S%f")
+    # Users get distinct content (seeded by their index) unless --shared-content, which
+    # makes them upload the same files and so exercises the shared store / single-flight paths
+    documents = [
+        [corpus_file(file_type, pages, args.seed + (0 if args.shared_content else user) * 1000 + n, args.corpus_dir)
+         for n, (file_type, pages) in enumerate(mix)]
+        for user in range(args.users)
+    ]
+    slots = asyncio.Semaphore(args.concurrency or args.users)
+
+    async def user_session(index: int):
+        async with slots:
+            await virtual_user(client, recorder, index, run_id, documents[index], args.questions)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user_session(index) for index in range(args.users)))
+    return recorder, time.perf_counter() - started
+
+
+def _configure_in_process(data_dir: str) -> None:
+    """Environment for importing the app against a throwaway data directory and the stub LLM."""
+    os.environ["DATA_PATH"] = data_dir
+    os.environ.setdefault("LLM_PROVIDER", "stub")
+    os.environ["VERIFY_EMAIL_DOMAIN"] = "false"
+    os.environ["GC_INTERVAL_SECONDS"] = "0"
+    os.environ.setdefault("SECRET_KEY", "load-test-secret")
+    os.environ.setdefault("ALGORITHM", "HS256")
+    os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "60")
+
+
+async def _run_in_process(args, mix: List[Tuple[str, int]]) -> Tuple[Recorder, float]:
+    data_dir = tempfile.mkdtemp(prefix="smartdoc-load-")
+    try:
+        _configure_in_process(data_dir)
+        # Imported only now: config and the engine read the environment at import time
+        from app.config import create_required_directories
+        from app.database import create_db, engine
+        from app.migrations import run_migrations
+        from app.main import app
+
+        engine.echo = args.echo_sql
+        # The ASGI transport does not send lifespan events; this is the startup hook minus the admin user and GC
+        create_required_directories()
+        create_db()
+        run_migrations(engine)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=args.timeout) as client:
+            return await run_load(client, args, mix)
+    finally:
+        if args.keep_data:
+            print(f"Data directory kept at {data_dir}", file=sys.stderr)
+        else:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+
+async def _run_remote(args, mix: List[Tuple[str, int]]) -> Tuple[Recorder, float]:
+    limits = httpx.Limits(max_connections=args.concurrency or args.users)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        return await run_load(client, args, mix)
+
+
+def compare(current: Dict, baseline: Dict, threshold: float, min_seconds: float) -> List[Dict]:
+    """Per route p95 and throughput against the baseline; flags slowdowns beyond the threshold."""
+    rows = []
+    for route, result in current["routes"].items():
+        base = baseline.get("routes", {}).get(route)
+        if not base:
+            continue
+        p95_ratio = result["p95_s"] / base["p95_s"] if base["p95_s"] else float("inf")
+        rps_ratio = result["rps"] / base["rps"] if base["rps"] else 1.0
+        rows.append({
+            "route": route,
+            "baseline_p95_s": base["p95_s"],
+            "current_p95_s": result["p95_s"],
+            "p95_ratio": round(p95_ratio, 3),
+            "baseline_rps": base["rps"],
+            "current_rps": result["rps"],
+            "rps_ratio": round(rps_ratio, 3),
+            "regression": (p95_ratio > 1 + threshold and result["p95_s"] - base["p95_s"] > min_seconds)
+            or rps_ratio < 1 / (1 + threshold),
+        })
+    return rows
+
+
+def _print_report(report: Dict) -> None:
+    print(f"{'route':<12}{'count':>7}{'errors':>8}{'rps':>9}{'p50 s':>9}{'p95 s':>9}{'p99 s':>9}{'max s':>9}", file=sys.stderr)
+    for route, row in report["routes"].items():
+        print(
+            f"{route:<12}{row['count']:>7}{row['errors']:>8}{row['rps']:>9.2f}"
+            f"{row['p50_s']:>9.4f}{row['p95_s']:>9.4f}{row['p99_s']:>9.4f}{row['max_s']:>9.4f}",
+            file=sys.stderr
+        )
+    print(f"{report['total']['requests']} requests in {report['total']['elapsed_s']:.2f}s "
+          f"({report['total']['rps']:.2f} req/s)", file=sys.stderr)
+
+
+def _print_comparison(rows: List[Dict]) -> None:
+    print(f"{'route':<12}{'base p95':>10}{'cur p95':>10}{'ratio':>8}{'base rps':>10}{'cur rps':>10}{'ratio':>8}", file=sys.stderr)
+    for row in rows:
+        flag = "  REGRESSION" if row["regression"] else ""
+        print(
+            f"{row['route']:<12}{row['baseline_p95_s']:>10.4f}{row['current_p95_s']:>10.4f}{row['p95_ratio']:>8.2f}"
+            f"{row['baseline_rps']:>10.2f}{row['current_rps']:>10.2f}{row['rps_ratio']:>8.2f}{flag}",
+            file=sys.stderr
+        )
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10, help="Virtual users, each with its own account")
+    parser.add_argument("--concurrency", type=int, default=0, help="Users running at once (default: all)")
+    parser.add_argument("--docs", default="txt:5", help="Document mix per user, type:pages, comma separated")
+    parser.add_argument("--questions", type=int, default=3, help="Questions asked per document")
+    parser.add_argument("--shared-content", action="store_true", help="All users upload identical files")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--corpus-dir", default=DEFAULT_CORPUS_DIR)
+    parser.add_argument("--base-url", help="Load a running server instead of the in-process app")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Per-request timeout in seconds")
+    parser.add_argument("--keep-data", action="store_true", help="Keep the temporary data directory")
+    parser.add_argument("--echo-sql", action="store_true", help="Keep SQLAlchemy statement logging on")
+    parser.add_argument("--output", help="Write the results JSON here")
+    parser.add_argument("--baseline", help="Compare against this results JSON")
+    parser.add_argument("--save-baseline", help="Write the results JSON here as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed p95 slowdown / throughput drop per route")
+    parser.add_argument("--min-seconds", type=float, default=0.005, help="Ignore p95 differences smaller than this")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args(argv)
+
+    if args.users < 1:
+        parser.error("--users must be at least 1")
+    try:
+        mix = parse_doc_mix(args.docs)
+    except ValueError as e:
+        parser.error(str(e))
+
+    runner = _run_remote if args.base_url else _run_in_process
+    recorder, elapsed = asyncio.run(runner(args, mix))
+
+    routes = recorder.report(elapsed)
+    requests = sum(row["count"] for row in routes.values())
+    report = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "target": args.base_url or "in-process",
+            "users": args.users,
+            "concurrency": args.concurrency or args.users,
+            "docs": args.docs,
+            "questions": args.questions,
+            "shared_content": args.shared_content,
+            "seed": args.seed,
+            "llm_provider": os.getenv("LLM_PROVIDER", "stub") if not args.base_url else None,
+        },
+        "total": {
+            "requests": requests,
+            "errors": sum(row["errors"] for row in routes.values()),
+            "elapsed_s": round(elapsed, 3),
+            "rps": round(requests / elapsed, 2) if elapsed else 0.0,
+        },
+        "routes": routes,
+    }
+    _print_report(report)
+    output = json.dumps(report, indent=2)
+    print(output)
+    for path in filter(None, (args.output, args.save_baseline)):
+        with open(path, "w") as f:
+            f.write(output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            rows = compare(report, json.load(f), args.threshold, args.min_seconds)
+        _print_comparison(rows)
+        regressions = [row for row in rows if row["regression"]]
+        print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}", file=sys.stderr)
+        if regressions and args.fail_on_regression:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,209 @@
+"""
+Offline benchmark suite for ingestion, retrieval and summarization.
+
+For every (file type, page count) it generates a synthetic document and
+times each stage with the app's own code: extraction, chunking, TF-IDF
+fitting, store save/load, top-k retrieval, and end-to-end summarize and ask
+against the deterministic stub LLM (no network, no API key). Results are
+written as JSON and can be compared with a stored baseline:
+
+    python -m benchmarks.run --pages 1,10,100 --save-baseline benchmarks/baseline.json
+    python -m benchmarks.run --pages 1,10,100 --baseline benchmarks/baseline.json
+
+Timings are the median of --repeat runs. Exit status is 1 when
+--fail-on-regression is given and a stage got slower than --threshold.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List
+
+import joblib
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from app.utils.extractor import extract_text
+from app.utils.hierarchical_summarizer import HierarchicalSummarizer
+from app.utils.llm_providers import StubChatModel
+from app.utils.qa_utils import load_vector_store, rewrite_queries, retrieve_packed_context, run_qa_chain, score_top_k
+from app.utils.vectorizer import CHUNK_SIZE, CHUNK_OVERLAP, save_tfidf_store
+from benchmarks.corpus import FILE_TYPES, DEFAULT_CORPUS_DIR, corpus_file
+
+STAGES = ("extract", "chunk", "tfidf_fit", "store_save", "store_load", "retrieve", "ask_e2e", "summarize_e2e")
+QUESTIONS = 20
+
+
+WARMUP_RUNS = 1
+
+
+def _timed(fn: Callable, repeat: int):
+    """Run fn once untimed (imports, caches), then `repeat` times; return (median seconds, last result)."""
+    for _ in range(WARMUP_RUNS):
+        fn()
+    durations, result = [], None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        durations.append(time.perf_counter() - started)
+    return statistics.median(durations), result
+
+
+def _make_summarizer(llm) -> HierarchicalSummarizer:
+    # Same settings as app/routes/summarize.py, with the stub model swapped in
+    summarizer = HierarchicalSummarizer(
+        model_name="gemini-1.5-flash-latest",
+        temperature=0.1,
+        max_tokens_per_chunk=4000,
+        chunk_overlap=400,
+        max_retries=3,
+        api_key="offline-benchmark"
+    )
+    summarizer.llm = llm
+    return summarizer
+
+
+def bench_document(path: str, repeat: int, store_format: str, llm_latency: float) -> Dict:
+    stages = {}
+    stages["extract"], text = _timed(lambda: extract_text(path), repeat)
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    stages["chunk"], chunks = _timed(lambda: splitter.split_text(text), repeat)
+
+    stages["tfidf_fit"], (vectorizer, matrix) = _timed(
+        lambda: (lambda v: (v, v.fit_transform(chunks)))(TfidfVectorizer()), repeat
+    )
+
+    with tempfile.TemporaryDirectory() as store_dir:
+        def save():
+            storage = save_tfidf_store(store_dir, vectorizer, matrix, store_format)
+            joblib.dump(chunks, os.path.join(store_dir, "chunks.pkl"))
+            return storage
+        stages["store_save"], storage = _timed(save, repeat)
+        stages["store_load"], store = _timed(lambda: load_vector_store(store_dir), repeat)
+
+        # Questions made of words from evenly spaced chunks
+        questions = [" ".join(chunks[i * len(chunks) // QUESTIONS].split()[:8]) for i in range(QUESTIONS)]
+        retrieve_total, _ = _timed(lambda: [score_top_k(store, q) for q in questions], repeat)
+        stages["retrieve"] = retrieve_total / QUESTIONS
+
+        llm = StubChatModel(latency_seconds=llm_latency)
+
+        def ask():
+            # Mirrors POST /ask: load the store, rewrite, retrieve and pack, answer
+            loaded = load_vector_store(store_dir)
+            queries = rewrite_queries(llm, questions[0], num_rephrasals=4)
+            top_chunks, _ = retrieve_packed_context(loaded, " OR ".join(queries))
+            return run_qa_chain(llm, questions[0], top_chunks)
+        stages["ask_e2e"], _ = _timed(ask, repeat)
+
+    summarizer = _make_summarizer(llm)
+    stages["summarize_e2e"], summary = _timed(lambda: summarizer.summarize(text), repeat)
+
+    return {
+        "bytes": os.path.getsize(path),
+        "chars": len(text),
+        "chunks": len(chunks),
+        "vocabulary": len(vectorizer.vocabulary_),
+        "store": storage,
+        "summary_api_calls": summary["api_calls"],
+        "stages": {name: round(stages[name], 6) for name in STAGES},
+    }
+
+
+def compare(current: Dict, baseline: Dict, threshold: float, min_seconds: float) -> List[Dict]:
+    """Per (document, stage) ratio current/baseline; flags slowdowns beyond the threshold."""
+    rows = []
+    for key, result in current["results"].items():
+        base = baseline.get("results", {}).get(key)
+        if not base:
+            continue
+        for stage, seconds in result["stages"].items():
+            base_seconds = base["stages"].get(stage)
+            if base_seconds is None:
+                continue
+            ratio = seconds / base_seconds if base_seconds else float("inf")
+            rows.append({
+                "document": key,
+                "stage": stage,
+                "baseline_s": base_seconds,
+                "current_s": seconds,
+                "ratio": round(ratio, 3),
+                "regression": ratio > 1 + threshold and seconds - base_seconds > min_seconds,
+            })
+    return rows
+
+
+def _print_comparison(rows: List[Dict]) -> None:
+    print(f"{'document':<14}{'stage':<16}{'baseline s':>12}{'current s':>12}{'ratio':>8}")
+    for row in rows:
+        flag = "  REGRESSION" if row["regression"] else ""
+        print(f"{row['document']:<14}{row['stage']:<16}{row['baseline_s']:>12.4f}{row['current_s']:>12.4f}{row['ratio']:>8.2f}{flag}")
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--types", default=",".join(FILE_TYPES), help="Comma separated: txt,pdf,docx")
+    parser.add_argument("--pages", default="1,10,100", help="Comma separated page counts (1 to 2000)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--store-format", default="sklearn", choices=("sklearn", "float32", "int8"))
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Simulated seconds per LLM call")
+    parser.add_argument("--corpus-dir", default=DEFAULT_CORPUS_DIR)
+    parser.add_argument("--output", help="Write the results JSON here")
+    parser.add_argument("--baseline", help="Compare against this results JSON")
+    parser.add_argument("--save-baseline", help="Write the results JSON here as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed slowdown before a stage counts as a regression")
+    parser.add_argument("--min-seconds", type=float, default=0.005, help="Ignore differences smaller than this")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args(argv)
+
+    file_types = [t.strip() for t in args.types.split(",") if t.strip()]
+    page_counts = [int(p) for p in args.pages.split(",") if p.strip()]
+    if any(not 1 <= pages <= 2000 for pages in page_counts):
+        parser.error("page counts must be between 1 and 2000")
+
+    results = {}
+    for file_type in file_types:
+        for pages in page_counts:
+            key = f"{file_type}/{pages}"
+            path = corpus_file(file_type, pages, args.seed, args.corpus_dir)
+            print(f"Benchmarking {key} ...", file=sys.stderr)
+            results[key] = bench_document(path, args.repeat, args.store_format, args.llm_latency)
+
+    report = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+            "seed": args.seed,
+            "store_format": args.store_format,
+            "llm_latency": args.llm_latency,
+        },
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    for path in filter(None, (args.output, args.save_baseline)):
+        with open(path, "w") as f:
+            f.write(output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            rows = compare(report, json.load(f), args.threshold, args.min_seconds)
+        _print_comparison(rows)
+        regressions = [row for row in rows if row["regression"]]
+        print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}", file=sys.stderr)
+        if regressions and args.fail_on_regression:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
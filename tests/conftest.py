@@ -0,0 +1,46 @@
+import os
+import shutil
+import tempfile
+import uuid
+
+import pytest
+
+# Config and the engine read the environment at import time, so it is set before any app import
+DATA_DIR = tempfile.mkdtemp(prefix="smartdoc-test-")
+os.environ["DATA_PATH"] = DATA_DIR
+os.environ["LLM_PROVIDER"] = "stub"
+os.environ["VERIFY_EMAIL_DOMAIN"] = "false"
+os.environ["GC_INTERVAL_SECONDS"] = "0"
+os.environ.setdefault("SECRET_KEY", "test-secret")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "60")
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+    from app.config import create_required_directories
+    from app.database import create_db, engine
+    from app.migrations import run_migrations
+    from app.main import app
+
+    # The startup hook minus the admin user and the GC scheduler
+    create_required_directories()
+    create_db()
+    run_migrations(engine)
+    yield TestClient(app)
+    shutil.rmtree(DATA_DIR, ignore_errors=True)
+
+
+@pytest.fixture
+def auth_headers(client):
+    """A fresh user, signed up and logged in through the API."""
+    email = f"user-{uuid.uuid4().hex[:8]}@example.com"
+    password = "test-password"
+    response = client.post("/auth/signup", json={
+        "email": email, "username": email.split("@")[0], "password": password, "gemini_api_key": "stub-key",
+    })
+    assert response.status_code < 400, response.text
+    response = client.post("/auth/token", data={"username": email, "password": password})
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
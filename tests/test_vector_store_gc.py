@@ -0,0 +1,114 @@
+import os
+import shutil
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlmodel import Session, update
+
+from app.config import VECTOR_STORE_DIR, EXTRACTED_TEXT_DIR
+from app.database import engine
+from app.models.content import Content
+from app.utils.vector_store_gc import run_gc
+from app.utils.vectorizer import compute_file_hash
+
+GRACE = 60
+BODY = ("Clause 7 covers payment within thirty days. Clause 8 covers termination with notice. " * 200).encode()
+
+
+def _upload(client, headers, filename, body=BODY):
+    response = client.post("/upload", files={"file": (filename, body, "text/plain")}, headers=headers)
+    assert response.status_code == 201, response.text
+
+
+def _ask(client, headers, filename):
+    return client.post("/ask", json={"filename": filename, "question": "What does clause 7 say?"}, headers=headers)
+
+
+def _file_hash(body=BODY):
+    path = os.path.join(EXTRACTED_TEXT_DIR, "hash-input.txt")
+    with open(path, "wb") as f:
+        f.write(body)
+    try:
+        return compute_file_hash(path)
+    finally:
+        os.remove(path)
+
+
+def _age_artifacts(file_hash, seconds):
+    """Backdate the vector store and extracted text, as if written `seconds` ago."""
+    past = time.time() - seconds
+    store = os.path.join(VECTOR_STORE_DIR, file_hash)
+    for root, _, files in os.walk(store):
+        for name in files:
+            os.utime(os.path.join(root, name), (past, past))
+    os.utime(store, (past, past))
+    text = os.path.join(EXTRACTED_TEXT_DIR, f"{file_hash}.txt")
+    if os.path.exists(text):
+        os.utime(text, (past, past))
+
+
+def _age_content(file_hash, seconds):
+    with Session(engine) as db:
+        db.exec(
+            update(Content)
+            .where(Content.file_hash == file_hash)
+            .values(updated_at=datetime.now(timezone.utc) - timedelta(seconds=seconds))
+        )
+        db.commit()
+
+
+def test_recently_summarized_content_keeps_its_artifacts(client, auth_headers):
+    """Old artifacts of a content summarized within the grace period survive its last delete."""
+    body = BODY + b"summarized"
+    file_hash = _file_hash(body)
+    _upload(client, auth_headers, "kept.txt", body)
+    assert client.post("/vectorize/kept.txt", headers=auth_headers).status_code == 200
+    _age_artifacts(file_hash, 2 * GRACE)
+    assert client.post("/summarize/kept.txt", headers=auth_headers).status_code == 200
+    assert client.delete("/documents/kept.txt", headers=auth_headers).status_code == 200
+
+    report = run_gc(grace_period=GRACE, file_hashes=[file_hash])
+    assert report["removed"] == 0
+    assert report["content_rows_removed"] == 0
+    assert os.path.isdir(os.path.join(VECTOR_STORE_DIR, file_hash))
+
+    _upload(client, auth_headers, "kept.txt", body)
+    assert client.post("/vectorize/kept.txt", headers=auth_headers).json()["message"] == "Document already vectorized"
+    assert _ask(client, auth_headers, "kept.txt").status_code == 200
+
+
+def test_upload_vectorize_summarize_delete_gc_reupload_ask(client, auth_headers):
+    """Artifacts and the Content row are swept together, and a re-upload is vectorized again."""
+    file_hash = _file_hash()
+    _upload(client, auth_headers, "contract.txt")
+    assert client.post("/vectorize/contract.txt", headers=auth_headers).status_code == 200
+    assert client.post("/summarize/contract.txt", headers=auth_headers).status_code == 200
+    assert _ask(client, auth_headers, "contract.txt").status_code == 200
+    assert client.delete("/documents/contract.txt", headers=auth_headers).status_code == 200
+
+    _age_artifacts(file_hash, 2 * GRACE)
+    _age_content(file_hash, 2 * GRACE)
+    report = run_gc(grace_period=GRACE, file_hashes=[file_hash])
+    assert report["removed"] == 2
+    assert report["content_rows_removed"] == 1
+    assert not os.path.exists(os.path.join(VECTOR_STORE_DIR, file_hash))
+
+    _upload(client, auth_headers, "contract.txt")
+    response = client.post("/vectorize/contract.txt", headers=auth_headers)
+    assert response.json()["message"] == "Document vectorized successfully"
+    response = _ask(client, auth_headers, "contract.txt")
+    assert response.status_code == 200, response.text
+    assert response.json()["answer"]
+
+
+def test_vectorize_rebuilds_a_missing_store(client, auth_headers):
+    """A Content row still marked vectorized does not stop a rebuild when the store is gone."""
+    body = BODY + b"missing"
+    file_hash = _file_hash(body)
+    _upload(client, auth_headers, "missing.txt", body)
+    assert client.post("/vectorize/missing.txt", headers=auth_headers).status_code == 200
+    shutil.rmtree(os.path.join(VECTOR_STORE_DIR, file_hash))
+
+    response = client.post("/vectorize/missing.txt", headers=auth_headers)
+    assert response.json()["message"] == "Document vectorized successfully"
+    assert _ask(client, auth_headers, "missing.txt").status_code == 200